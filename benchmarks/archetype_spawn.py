@@ -0,0 +1,44 @@
+"""
+Compares spawning NPCs from an Archetype against building each with BasicRoleplayCharacter(**stats) and
+set_skill_class, for a fixed stat block and for one with rolled characteristics and skill variance.
+Run from the repository root with `python -m benchmarks.archetype_spawn [count]`.
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from src.sheets import Archetype, BasicRoleplayCharacter
+
+STATS = {"SIZ": 6, "armor_protection": 1, "primary_weapon_damage": "1d6",
+         "skills": {"Brawl": {"name": "Brawl", "category": "combat", "chance": 40},
+                    "Hide": {"name": "Hide", "category": "manipulation", "chance": 50}}}
+ROLLS = {"STR": "3d6", "CON": "3d6", "DEX": "2d6+6", "POW": "3d6"}
+
+
+def construct(count: int, generator: np.random.Generator, rolled: bool):
+    characters = []
+    for i in range(count):
+        stats = dict(STATS)
+        if rolled:
+            stats.update({key: int(np.sum(generator.integers(1, 7, size=3))) for key in ROLLS})
+        character = BasicRoleplayCharacter(name=f"Goblin {i + 1}", **stats)
+        character.set_skill_class()
+        characters.append(character)
+    return characters
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    generator = np.random.default_rng(0)
+    fixed = Archetype("Goblin", STATS)
+    rolled = Archetype("Goblin", STATS, rolls=ROLLS, skill_variance=10)
+    timings = {
+        "construct fixed": lambda: construct(count, generator, False),
+        "spawn fixed": lambda: fixed.spawn(count, generator),
+        "construct rolled": lambda: construct(count, generator, True),
+        "spawn rolled": lambda: rolled.spawn(count, generator),
+    }
+    for name, function in timings.items():
+        seconds = min(timeit.repeat(function, number=1, repeat=3)) / count
+        print(f"{name:17} {seconds * 1e6:8.1f} us per NPC")
@@ -0,0 +1,51 @@
+"""
+Compares saving and loading the characters in tests/test_characters with the original asdict and json round trip
+against save_character_to_json and load_character_from_json.
+Run from the repository root with `python -m benchmarks.json_io [repeats]`.
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+from dataclasses import asdict
+
+from src.sheets import BasicRoleplayCharacter, BasicRoleplaySkill, load_character_from_json, save_character_to_json
+from src.sheets.brp_json import JSON_BACKEND
+
+FIXTURES = [os.path.join("tests", "test_characters", name) for name in ("alice.json", "bob.json", "eve.json")]
+
+
+def legacy_load(filepath: str) -> BasicRoleplayCharacter:
+    with open(filepath, "r") as fh:
+        character = BasicRoleplayCharacter(**json.loads(fh.read()))
+    character.SkillClass = BasicRoleplaySkill
+    for key, value in character.skills.items():
+        character.skills[key] = BasicRoleplaySkill(**value)
+    character._set_default_skills()
+    for key, value in character.skills.items():
+        character.skills[key] = BasicRoleplaySkill(**asdict(value))
+    return character
+
+
+def legacy_save(character: BasicRoleplayCharacter, filepath: str):
+    data = json.dumps(asdict(character))
+    with open(filepath, "w") as fh:
+        fh.write(data)
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    characters = [load_character_from_json(path) for path in FIXTURES]
+    with tempfile.TemporaryDirectory() as directory:
+        target = os.path.join(directory, "character.json")
+        timings = {
+            "legacy load": lambda: [legacy_load(path) for path in FIXTURES],
+            "load": lambda: [load_character_from_json(path) for path in FIXTURES],
+            "legacy save": lambda: [legacy_save(character, target) for character in characters],
+            "save": lambda: [save_character_to_json(character, target) for character in characters],
+        }
+        print(f"JSON backend: {JSON_BACKEND}")
+        for name, function in timings.items():
+            seconds = timeit.timeit(function, number=repeats) / (repeats * len(FIXTURES))
+            print(f"{name:12} {seconds * 1e6:8.1f} us per character")
@@ -0,0 +1,36 @@
+"""
+Compares the memory held by characters' skills as a dict of BasicRoleplaySkill instances against a SkillTable.
+Run from the repository root with `python -m benchmarks.skill_table_memory [number of characters]`.
+"""
+import sys
+import tracemalloc
+
+from src.sheets import BasicRoleplayCharacter
+
+
+def measure(count: int, compact: bool = False, skills: bool = True) -> int:
+    tracemalloc.start()
+    characters = []
+    for i in range(count):
+        character = BasicRoleplayCharacter(name=f"NPC {i}", DEX=8 + i % 10, POW=8 + i % 7)
+        character.set_skill_class()
+        # touch every skill, as a loaded character or a full dict of skills would
+        character.skills = {key: skill for key, skill in character.skills.items()}
+        if compact:
+            character.compact_skills()
+        if not skills:
+            character.skills = {}
+        characters.append(character)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    base_size = measure(count, skills=False)
+    dict_size = measure(count) - base_size
+    table_size = measure(count, compact=True) - base_size
+    print(f"skills of {count} characters")
+    print(f"dict of skills: {dict_size / count:10.0f} bytes per character")
+    print(f"SkillTable:     {table_size / count:10.0f} bytes per character ({table_size / dict_size:.0%})")
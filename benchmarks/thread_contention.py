@@ -0,0 +1,68 @@
+"""
+Runs take_damage, heal_damage and sanity_roll on shared characters from many threads, with few characters (high
+contention) and many (low contention), through LockedCharacter and on the bare characters. Prints the throughput
+of each and whether every character's damage and sanity losses add up afterwards, which unlocked threads can break.
+Threads are switched as often as the interpreter allows, so that races which are rare in a real server show up.
+Run from the repository root with `python -m benchmarks.thread_contention [threads] [operations per thread]`.
+"""
+import sys
+import threading
+import time
+
+from src.sheets import BasicRoleplayCharacter, LockedCharacter
+from src.utils import roll_stream
+
+
+def make_characters(count: int):
+    characters = []
+    for i in range(count):
+        character = BasicRoleplayCharacter(name=f"Guard {i + 1}", CON=18, SIZ=18, POW=18)
+        character.set_skill_class()
+        characters.append(character)
+    return characters
+
+
+def work(targets, operations: int, rng, start: threading.Barrier, taken: list):
+    start.wait()
+    for i in range(operations):
+        target = targets[rng.die(len(targets)) - 1]
+        step = i % 3
+        if step == 0:
+            target.take_damage(1, bypass_armor=True, rng=rng)
+            taken.append(1)
+        elif step == 1:
+            target.sanity_roll("1", "1d2", loss_reason="Benchmark", rng=rng)
+        else:
+            target.heal_damage(0)
+
+
+def run(count: int, threads: int, operations: int, locked: bool):
+    characters = make_characters(count)
+    targets = [LockedCharacter(character) for character in characters] if locked else characters
+    streams = roll_stream(0).spawn(threads)
+    start = threading.Barrier(threads + 1)
+    taken = [[] for _ in range(threads)]
+    workers = [threading.Thread(target=work, args=(targets, operations, stream, start, hits))
+               for stream, hits in zip(streams, taken)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - began
+    consistent = sum(character.damage for character in characters) == sum(len(hits) for hits in taken) and all(
+        character.recent_san_loss == sum(loss["amount"] for loss in character.loss_history)
+        for character in characters)
+    return threads * operations / seconds, consistent
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    sys.setswitchinterval(1e-6)
+    for label, count in (("high contention", 4), ("low contention", 1024)):
+        for locked in (False, True):
+            rate, consistent = run(count, threads, operations, locked)
+            name = f"{label}, {'locked' if locked else 'unlocked'}"
+            print(f"{name:26} {rate:10.0f} operations/s  consistent: {consistent}")
@@ -1,2 +1,15 @@
 from .brp_character import BasicRoleplayCharacter, load_character_from_json, save_character_to_json
-from .brp_skill import BasicRoleplaySkill
+from .brp_skill import BasicRoleplaySkill, SkillIndex, generic_skill_name
+from .brp_probability import skill_roll_probabilities, predict_opposed, TIERS
+from .brp_probability import damage_distribution, damage_table, expected_damage, sanity_risk
+from .brp_skill_table import SkillTable
+from .brp_population import CharacterPopulation
+from .brp_bulk import bulk_experience_rolls, bulk_sanity_roll
+from .brp_archetype import Archetype
+from .brp_generation import generate_population, roll_characteristics, GENERATION_METHODS
+from .brp_roster import Roster, load_roster, save_roster
+from .brp_jsonl import iter_characters_jsonl, write_characters_jsonl
+from .brp_snapshot import load_snapshot, save_snapshot, SNAPSHOT_VERSION
+from .brp_roll_log import RollLog, RollRecord, start_roll_log, stop_roll_log, read_roll_log, replay_rolls
+from .brp_encounter import simulate_encounters, EncounterStats
+from .brp_concurrency import LockedCharacter, hold_characters
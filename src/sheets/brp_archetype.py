@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from typing import List, Mapping, Union
+
+import numpy as np
+
+from .brp_character import BasicRoleplayCharacter, _DERIVED_CHARACTERISTICS
+from .brp_population import CharacterPopulation
+from .brp_skill import BasicRoleplaySkill, SkillOverlay
+from ..utils import compile_dice, get_generator
+
+
+def _copy_skill(skill: BasicRoleplaySkill) -> BasicRoleplaySkill:
+    copied = object.__new__(type(skill))
+    copied.__dict__.update(skill.__dict__)
+    return copied
+
+
+class Archetype:
+    """
+    A stat block that stamps out many characters. The character is built, given its skills and has its derived
+    characteristics calculated once, then each spawned character starts as a copy of it, skipping the dataclass
+    __init__ and set_skill_class. Only rolled characteristics and skill variance are worked out per character.
+
+    Spawned characters equal characters built with CharacterClass(**stats) and set_skill_class(SkillClass), with
+    the rolled values passed in as stats and the skill variance added to their chances.
+    """
+
+    def __init__(self,
+                 name: str = "NPC",
+                 stats: Mapping = None,
+                 rolls: Mapping[str, Union[str, int]] = None,
+                 skill_variance: Union[int, Mapping[str, int]] = 0,
+                 CharacterClass: dataclass = BasicRoleplayCharacter,
+                 SkillClass: dataclass = BasicRoleplaySkill):
+        """
+        :param name: spawned characters are named after the archetype and numbered, "Goblin 1", "Goblin 2", ...
+        :param stats: keyword arguments for CharacterClass, including any skills the archetype has
+        :param rolls: attributes rolled for each character, such as {"STR": "3d6", "SIZ": "2d6+6"}
+        :param skill_variance: each character's chance in every skill given in stats varies by up to this much either
+                               way, or a dict of skill to how much its chance varies, for any skill
+        """
+        if not issubclass(CharacterClass, BasicRoleplayCharacter):
+            raise TypeError("An Archetype's CharacterClass should be a subclass of BasicRoleplayCharacter")
+        self.name = name
+        self.stats = dict(stats or {})
+        self.rolls = {key: compile_dice(str(expression)) for key, expression in (rolls or {}).items()}
+        self.CharacterClass = CharacterClass
+        self.SkillClass = SkillClass
+        self.spawned = 0
+
+        # the character takes dicts like skills as given and changes them, so it is given copies
+        prototype = CharacterClass(**{"name": name, **{key: value.copy() if isinstance(value, (dict, list)) else value
+                                                       for key, value in self.stats.items()}})
+        prototype.set_skill_class(SkillClass)
+        for key in _DERIVED_CHARACTERISTICS:
+            getattr(prototype, key)
+        self.prototype = prototype
+        self._skills = prototype.skills.owned()
+        self._template = prototype.skills.template
+        self._state = {key: value for key, value in vars(prototype).items() if key not in ("skills", "_skill_index")}
+        self._containers = [key for key, value in self._state.items() if isinstance(value, (dict, list))]
+        if isinstance(skill_variance, Mapping):
+            self.skill_variance = dict(skill_variance)
+        else:
+            self.skill_variance = {key: skill_variance for key in self._skills} if skill_variance else {}
+
+    def _stamp(self, name: str) -> BasicRoleplayCharacter:
+        character = object.__new__(self.CharacterClass)
+        attributes = character.__dict__
+        attributes.update(self._state)
+        for key in self._containers:
+            attributes[key] = attributes[key].copy()
+        attributes["new_skill_defaults"] = {key: _copy_skill(skill)
+                                            for key, skill in attributes["new_skill_defaults"].items()}
+        attributes["name"] = name
+        return character
+
+    def spawn(self, n: int = 1, generator: np.random.Generator = None) -> List[BasicRoleplayCharacter]:
+        """
+        Makes n new characters of this archetype
+        :param generator: a numpy generator to roll from, pass a seeded one for reproducible characters
+        :return: the list of characters
+        """
+        generator = generator if generator is not None else get_generator()
+        rolled = {key: expression.roll_many(n, generator).tolist() for key, expression in self.rolls.items()}
+        varied = {key: generator.integers(-variance, variance + 1, size=n).tolist()
+                  for key, variance in self.skill_variance.items()}
+
+        characters = []
+        for i in range(n):
+            character = self._stamp(f"{self.name} {self.spawned + i + 1}")
+            template = self._template
+            if rolled:
+                for key, values in rolled.items():
+                    setattr(character, key, values[i])
+                # as __post_init__ does, which also resets power points, fatigue and sanity
+                character._derived_characteristics()
+                template = character._skill_template()
+            skills = SkillOverlay({key: _copy_skill(skill) for key, skill in self._skills.items()},
+                                  template, self.SkillClass)
+            for key, deltas in varied.items():
+                skills[key].chance = max(0, skills[key].chance + deltas[i])
+            character.skills = skills
+            characters.append(character)
+        self.spawned += n
+        return characters
+
+    def spawn_population(self, n: int = 1, generator: np.random.Generator = None) -> CharacterPopulation:
+        """
+        Makes n new characters of this archetype as the rows of a CharacterPopulation, see spawn
+        """
+        return CharacterPopulation.from_characters(self.spawn(n, generator))
+
+    def __repr__(self) -> str:
+        rolls = {key: expression.expression for key, expression in self.rolls.items()}
+        return f"{type(self).__name__}({self.name!r}, stats={self.stats!r}, rolls={rolls!r})"
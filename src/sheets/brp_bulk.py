@@ -0,0 +1,105 @@
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .brp_character import BasicRoleplayCharacter
+from .brp_skill import BasicRoleplaySkill, SkillOverlay
+from .brp_skill_table import SkillTable
+from ..utils import compile_dice, get_generator, roll_d100_batch
+
+
+def _checked_skills(character: BasicRoleplayCharacter) -> Iterable[Tuple[str, BasicRoleplaySkill]]:
+    if isinstance(character.skills, SkillTable):
+        return character.skills.checked()
+    # default skills still in the template have never been rolled, so cannot have an experience check
+    skills = character.skills.owned() if isinstance(character.skills, SkillOverlay) else character.skills
+    return [(key, skill) for key, skill in skills.items() if skill.experience_check]
+
+
+def bulk_experience_rolls(characters: Iterable[BasicRoleplayCharacter],
+                          generator: np.random.Generator = None) -> List[Dict[str, int]]:
+    """
+    Makes the end of session experience rolls for many characters at once. Gives the same results, in distribution,
+    as calling make_experience_rolls on each character, but the improvement checks and improvement dice are rolled in
+    a few batches.
+    :param characters: the characters to make experience rolls for
+    :param generator: a numpy generator to draw from, pass a seeded one for reproducible results
+    :return: for each character, a dict of each skill that had an experience check to the amount it improved by
+    """
+    generator = generator if generator is not None else get_generator()
+    characters = list(characters)
+    reports = [{} for _ in characters]
+    skills, rows, chances, bonuses, dice = [], [], [], [], []
+    for row, character in enumerate(characters):
+        for key, skill in _checked_skills(character):
+            skills.append((key, skill))
+            rows.append(row)
+            chances.append(skill.chance)
+            bonuses.append(-(character.INT // -2))
+            dice.append(character.improvement_die)
+
+    improve_check = roll_d100_batch(len(skills), generator=generator) + np.array(bonuses, dtype=np.int64)
+    improve = improve_check >= np.minimum(np.array(chances, dtype=np.float64), 100)
+    amounts = np.zeros(len(skills), dtype=np.int64)
+    dice = np.array(dice, dtype=object)
+    for die in set(dice.tolist()):
+        chosen = np.flatnonzero(improve & (dice == die))
+        if isinstance(die, str):
+            amounts[chosen] = compile_dice(die).roll_many(len(chosen), generator)
+        else:
+            amounts[chosen] = generator.integers(1, die + 1, size=len(chosen))
+
+    for (key, skill), row, improved, amount in zip(skills, rows, improve.tolist(), amounts.tolist()):
+        if improved:
+            skill.improve(amount)
+        skill.experience_check = False
+        reports[row][key] = amount
+    return reports
+
+
+def bulk_sanity_roll(characters: Iterable[BasicRoleplayCharacter],
+                     loss_on_success: str = "0",
+                     loss_on_fail: str = "0",
+                     loss_reason: str = "Default",
+                     generator: np.random.Generator = None) -> Dict[str, np.ndarray]:
+    """
+    Makes the same sanity roll for many characters at once. Gives the same results, in distribution, as calling
+    sanity_roll on each character, but each loss expression is parsed once and the dice are rolled in a few batches.
+    :param characters: the characters who make the sanity roll
+    :param loss_on_success: sanity lost on a successful roll, a number or a string roll
+    :param loss_on_fail: sanity lost on a failed roll, a number or a string roll
+    :param loss_reason: the reason recorded in each character's loss_history
+    :param generator: a numpy generator to draw from, pass a seeded one for reproducible results
+    :return: dict of arrays over the characters, "success" of the roll, "loss" of sanity, and whether each became
+             "temporarily_insane" or "permanently_insane" through this roll
+    """
+    generator = generator if generator is not None else get_generator()
+    characters = list(characters)
+    sanity = np.array([character.sanity for character in characters], dtype=np.int64)
+    recent_san_loss = np.array([character.recent_san_loss for character in characters], dtype=np.int64)
+    temp_insanity_score = np.array([character.temp_insanity_score for character in characters], dtype=np.int64)
+    was_temporarily_insane = np.array([character.temporarily_insane for character in characters], dtype=bool)
+    was_permanently_insane = np.array([character.permanently_insane for character in characters], dtype=bool)
+
+    success = roll_d100_batch(len(characters), generator=generator) <= sanity
+    loss = np.zeros(len(characters), dtype=np.int64)
+    for chosen, expression in ((success, loss_on_success), (~success, loss_on_fail)):
+        loss[chosen] = compile_dice(str(expression)).roll_many(int(chosen.sum()), generator)
+    sanity = np.maximum(0, sanity - loss)
+    recent_san_loss += loss
+    temporarily_insane = was_temporarily_insane | (recent_san_loss >= temp_insanity_score)
+    permanently_insane = was_permanently_insane | (sanity <= 0)
+
+    for character, new_sanity, new_recent_san_loss, amount, temporary, permanent in zip(
+            characters, sanity.tolist(), recent_san_loss.tolist(), loss.tolist(),
+            temporarily_insane.tolist(), permanently_insane.tolist()):
+        character.sanity = new_sanity
+        character.recent_san_loss = new_recent_san_loss
+        if hasattr(character, "loss_history"):
+            character.loss_history.append({"amount": amount, "reason": loss_reason})
+        character.temporarily_insane = temporary
+        character.permanently_insane = permanent
+    return {"success": success,
+            "loss": loss,
+            "temporarily_insane": temporarily_insane & ~was_temporarily_insane,
+            "permanently_insane": permanently_insane & ~was_permanently_insane}
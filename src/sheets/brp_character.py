@@ -1,10 +1,15 @@
-import json
-from typing import Union, Dict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import ClassVar, Union, Dict, Mapping
 from dataclasses import dataclass, field, asdict
 from dataclasses_json import dataclass_json, Undefined
 
-from .brp_skill import BasicRoleplaySkill
-from ..utils import roll_d100, roll_ndm, roll_str
+from .brp_skill import BasicRoleplaySkill, SkillIndex, SkillOverlay, build_skill
+from .brp_skill_table import SkillTable
+from .brp_json import character_from_dict, loads, write_character
+from .brp_probability import predict_opposed
+from .brp_roll_log import logged_roll
+from ..utils import DiceBuffer, roll_d100, roll_ndm, roll_str
 
 skill_defaults: dict = {
     # Combat Skills
@@ -88,6 +93,115 @@ skill_defaults: dict = {
 }
 
 
+# read only copy of skill_defaults that every character's skill template is built from
+_default_skill_template = MappingProxyType({key: MappingProxyType(asdict(skill))
+                                           for key, skill in skill_defaults.items()})
+
+
+def _skill_spec(name: str, category: str, chance: int, can_be_improved_through_experience: bool = True) -> Mapping:
+    return MappingProxyType({"name": name,
+                             "category": category,
+                             "chance": chance,
+                             "experience_check": False,
+                             "can_be_improved_through_experience": can_be_improved_through_experience})
+
+
+def _language_key(primary_language: str) -> str:
+    """
+    The key of a character's own language among its default skills, which has always been saved without its closing
+    parenthesis
+    """
+    return f"Language ({primary_language}"
+
+
+@lru_cache(maxsize=4096)
+def _build_skill_template(STR: int, CON: int, POW: int, DEX: int, CHA: int, INT: int, EDU: int,
+                          can_drive: bool, can_fly: bool, literate: bool, energy_projection: bool,
+                          use_education: bool, primary_language: str) -> Mapping:
+    """
+    Builds the read only default skills for a set of characteristics. Characters with the same characteristics and
+    options share the same template.
+    """
+    template = dict(_default_skill_template)
+
+    def set_chance(key, chance):
+        template[key] = MappingProxyType({**template[key], "chance": chance})
+
+    # skills that depend on attributes
+    set_chance("Dodge", 2 * DEX)
+    if can_drive:
+        set_chance("Drive (various)", 20)
+    language = _language_key(primary_language)
+    if not use_education:
+        template[language] = _skill_spec("Language (own)", "communication", 5 * INT)
+    else:
+        template[language] = _skill_spec("Language (own)", "communication", 5 * max(INT, EDU))
+    if literate:
+        set_chance("Literacy", template[language]["chance"])
+    template["Gaming"] = _skill_spec("Gaming", "communication", INT + POW)
+    if can_fly:
+        set_chance("Fly", 4 * DEX)
+    else:
+        set_chance("Fly", .5 * DEX)
+    if energy_projection:
+        set_chance("Projection", 2 * DEX)
+
+    # characteristic rolls are treated as skill rolls
+    for key, characteristic in (("Effort", STR), ("Stamina", CON), ("Idea", INT), ("Luck", POW),
+                                ("Agility", DEX), ("Charm", CHA), ("Know", EDU)):
+        template[key] = _skill_spec(key, "", 5 * characteristic, False)
+    return MappingProxyType(template)
+
+
+# calculated from the characteristics when first read, and recalculated after any of them change
+_DERIVED_CHARACTERISTICS = ("damage_modifier", "max_hit_points", "major_wound_level", "max_power_points",
+                            "max_hp_location", "temp_insanity_score", "category_bonuses")
+_UNSET = object()
+
+
+class _Characteristic:
+    """
+    A dataclass field default for a value the derived characteristics depend on. Changing it clears them, so they are
+    recalculated the next time they are read.
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.default
+        return instance.__dict__.get(self.name, self.default)
+
+    def __set__(self, instance, value):
+        attributes = instance.__dict__
+        if attributes.get(self.name, _UNSET) != value:
+            attributes[self.name] = value
+            if not attributes.keys().isdisjoint(_DERIVED_CHARACTERISTICS):
+                for name in _DERIVED_CHARACTERISTICS:
+                    attributes.pop(name, None)
+
+
+class _Derived:
+    """
+    A derived characteristic, calculated when first read and then kept in the character's __dict__ until a
+    characteristic changes. Assigning to it overrides the calculated value until then.
+    """
+
+    def __init__(self, calculate):
+        self.calculate = calculate
+        self.name = calculate.__name__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.calculate(instance)
+        return value
+
+
 @dataclass_json(undefined=Undefined.EXCLUDE)
 @dataclass
 class BasicRoleplayCharacter:
@@ -103,9 +217,10 @@ class BasicRoleplayCharacter:
     name: str = ""
     gender: str = ""
     age: int = 0
-    tough: bool = False  # use optional total hit points rule
-    use_category_bonus: bool = True  # use optional normal category bonus
-    use_simple_category_bonus: bool = False  # use optional simple category bonus, will be overridden by category_bonus
+    tough: bool = _Characteristic(False)  # use optional total hit points rule
+    use_category_bonus: bool = _Characteristic(True)  # use optional normal category bonus
+    # use optional simple category bonus, will be overridden by category_bonus
+    use_simple_category_bonus: bool = _Characteristic(False)
     use_education: bool = True  # use optional education rule
     personality_type: str = ""
     profession: str = ""
@@ -132,14 +247,14 @@ class BasicRoleplayCharacter:
     ranged_weapon_damage: str = "0"
 
     # characteristics
-    STR: int = 10
-    CON: int = 10
-    POW: int = 10
-    DEX: int = 10
-    CHA: int = 10
-    INT: int = 10
-    SIZ: int = 10
-    EDU: int = 10
+    STR: int = _Characteristic(10)
+    CON: int = _Characteristic(10)
+    POW: int = _Characteristic(10)
+    DEX: int = _Characteristic(10)
+    CHA: int = _Characteristic(10)
+    INT: int = _Characteristic(10)
+    SIZ: int = _Characteristic(10)
+    EDU: int = _Characteristic(10)
     MOV: int = 10
     max_species_pow = 18
     min_species_pow = 3
@@ -177,44 +292,68 @@ class BasicRoleplayCharacter:
     fatal_wound: bool = False
     sanity: int = 100
     recent_san_loss: int = 0
-    loss_history = []
+    loss_history: list = field(default_factory=lambda: list())  # the amount and reason of each sanity loss
+    # other names for skills, such as {"Rifle": "Firearm (Rifle)"}, see SkillIndex
+    skill_aliases: ClassVar[Mapping[str, str]] = MappingProxyType({})
     temporarily_insane: bool = False
     permanently_insane: bool = False
 
     def __post_init__(self):
         self.SkillClass = BasicRoleplaySkill
         self._derived_characteristics()
-        if self.use_category_bonus:
-            self._set_category_bonuses()
-        elif self.use_simple_category_bonus:
-            self._set_simple_category_bonuses()
-        else:
-            self.category_bonuses = {"combat": 0,
-                                     "communication": 0,
-                                     "manipulation": 0,
-                                     "mental": 0,
-                                     "perception": 0,
-                                     "physical": 0}
 
     def set_skill_class(self, SkillClass: dataclass = BasicRoleplaySkill):
         self.SkillClass = SkillClass
         if not issubclass(self.SkillClass, BasicRoleplaySkill):
             raise TypeError("A character's SkillClass should be a subclass of BasicRoleplaySkill.")
-        print(f"self.SkillClass is {self.SkillClass}")
         self._objectify_skills()
         self._set_default_skills()
         self._change_class_for_skills()
 
+    def compact_skills(self):
+        """
+        Moves this character's skills into a SkillTable, which stores them in arrays rather than one object per skill.
+        Lookups return views that roll and improve like the usual skills.
+        """
+        self.skills = SkillTable(self.skills.items(), self.SkillClass)
+
     def _change_class_for_skills(self):
-        for skill in self.skills:
-            self.skills[skill] = self.SkillClass(**asdict(self.skills[skill]))
+        skills = self.skills.owned() if isinstance(self.skills, SkillOverlay) else self.skills
+        for skill in skills:
+            if type(skills[skill]) is not self.SkillClass:
+                self.skills[skill] = build_skill(self.SkillClass, asdict(skills[skill]))
 
     def _derived_characteristics(self):
-        self.damage_modifier = self._calc_damage_modifier()
-        self.max_hit_points = self._calc_hit_points()
-        self.major_wound_level = -(self.max_hit_points // -2)
-        self.power_points, self.max_power_points = self.POW, self.POW
-        self.max_hp_location = {
+        """
+        Resets power points, fatigue and sanity to their starting values and recalculates every derived
+        characteristic. The derived characteristics are otherwise calculated when first read, and again after a
+        characteristic changes.
+        """
+        for name in _DERIVED_CHARACTERISTICS:
+            self.__dict__.pop(name, None)
+        self.power_points = self.POW
+        self.fatigue = self.STR + self.CON
+        self.sanity = min(5 * self.POW, 100)
+
+    @_Derived
+    def damage_modifier(self) -> str:
+        return self._calc_damage_modifier()
+
+    @_Derived
+    def max_hit_points(self) -> int:
+        return self._calc_hit_points()
+
+    @_Derived
+    def major_wound_level(self) -> int:
+        return -(self.max_hit_points // -2)
+
+    @_Derived
+    def max_power_points(self) -> int:
+        return self.POW
+
+    @_Derived
+    def max_hp_location(self) -> Dict[str, int]:
+        return {
             "left_leg": -(self.max_hit_points // -3),
             "right_leg": -(self.max_hit_points // -3),
             "abdomen": -(self.max_hit_points // -3),
@@ -224,9 +363,22 @@ class BasicRoleplayCharacter:
             "chest": -(self.max_hit_points // -(10 / 4))
         }
 
-        self.fatigue = self.STR + self.CON
-        self.sanity = min(5 * self.POW, 100)
-        self.temp_insanity_score = -(self.sanity // -2)
+    @_Derived
+    def temp_insanity_score(self) -> int:
+        return -(min(5 * self.POW, 100) // -2)
+
+    @_Derived
+    def category_bonuses(self) -> Dict[str, int]:
+        if self.use_category_bonus:
+            return self._calc_category_bonuses()
+        elif self.use_simple_category_bonus:
+            return self._calc_simple_category_bonuses()
+        return {"combat": 0,
+                "communication": 0,
+                "manipulation": 0,
+                "mental": 0,
+                "perception": 0,
+                "physical": 0}
 
     def _calc_damage_modifier(self) -> str:
         s = self.STR + self.SIZ
@@ -248,107 +400,111 @@ class BasicRoleplayCharacter:
             return self.CON + self.SIZ
         return -((self.CON + self.SIZ) // -2)
 
-    def _set_default_skills(self):
-        # skills that depend on attributes
-        skill_defaults["Dodge"].chance = 2 * self.DEX
-        if self.can_drive:
-            skill_defaults["Drive (various)"].chance = 20
-        if not self.use_education:
-            skill_defaults[f"Language ({self.primary_language}"] = BasicRoleplaySkill(
-                **{"name": "Language (own)", "category": "communication", "chance": 5 * self.INT})
-        else:
-            skill_defaults[f"Language ({self.primary_language}"] = BasicRoleplaySkill(
-                **{"name": "Language (own)", "category": "communication", "chance": 5 * max(self.INT, self.EDU)})
-        if self.literate:
-            skill_defaults["Literacy"].chance = skill_defaults[f"Language ({self.primary_language}"].chance
-        skill_defaults["Gaming"] = BasicRoleplaySkill(
-            **{"name": "Gaming", "category": "communication", "chance": self.INT + self.POW})
-        if self.can_fly:
-            skill_defaults["Fly"].chance = 4 * self.DEX
-        else:
-            skill_defaults["Fly"].chance = .5 * self.DEX
-        if self.energy_projection:
-            skill_defaults["Projection"].chance = 2 * self.DEX
-
-        # characteristic rolls are treated as skill rolls
-        skill_defaults["Effort"] = BasicRoleplaySkill(
-            **{"name": "Effort", "category": "", "chance": 5 * self.STR, "can_be_improved_through_experience": False})
-        skill_defaults["Stamina"] = BasicRoleplaySkill(
-            **{"name": "Stamina", "category": "", "chance": 5 * self.CON, "can_be_improved_through_experience": False})
-        skill_defaults["Idea"] = BasicRoleplaySkill(
-            **{"name": "Idea", "category": "", "chance": 5 * self.INT, "can_be_improved_through_experience": False})
-        skill_defaults["Luck"] = BasicRoleplaySkill(
-            **{"name": "Luck", "category": "", "chance": 5 * self.POW, "can_be_improved_through_experience": False})
-        skill_defaults["Agility"] = BasicRoleplaySkill(
-            **{"name": "Agility", "category": "", "chance": 5 * self.DEX, "can_be_improved_through_experience": False})
-        skill_defaults["Charm"] = BasicRoleplaySkill(
-            **{"name": "Charm", "category": "", "chance": 5 * self.CHA, "can_be_improved_through_experience": False})
-        skill_defaults["Know"] = BasicRoleplaySkill(
-            **{"name": "Know", "category": "", "chance": 5 * self.EDU, "can_be_improved_through_experience": False})
+    def _skill_template(self) -> Mapping:
+        """
+        The read only default skills for this character's current characteristics and new_skill_defaults
+        """
+        template = _build_skill_template(self.STR, self.CON, self.POW, self.DEX, self.CHA, self.INT, self.EDU,
+                                         self.can_drive, self.can_fly, self.literate, self.energy_projection,
+                                         self.use_education, self.primary_language)
 
         # incorporate passed in skills
-        skill_defaults.update(self.new_skill_defaults)
-
-        # set defaults for undefined skills for the character
-        for key in skill_defaults:
-            if key not in self.skills:
-                self.skills[key] = skill_defaults[key]
-
-    def _set_category_bonuses(self):
-        self.category_bonuses = {"combat": _set_category_bonus(self.DEX, self.INT, self.STR),
-                                 "communication": _set_category_bonus(self.INT, self.POW, self.CHA),
-                                 "manipulation": _set_category_bonus(self.DEX, self.INT, self.STR),
-                                 "mental": _set_category_bonus(self.INT, self.POW, self.EDU),
-                                 "perception": _set_category_bonus(self.INT, self.POW, self.CON),
-                                 "physical": _set_category_bonus(self.DEX, self.STR, self.CON, self.SIZ)}
-
-    def _set_simple_category_bonuses(self):
-        self.category_bonuses = {"combat": -(self.DEX // -2),
-                                 "communication": -(self.CHA // -2),
-                                 "manipulation": -(self.DEX // -2),
-                                 "mental": -(self.INT // -2),
-                                 "perception": -(self.POW // -2),
-                                 "physical": -(self.STR // -2)}
+        if self.new_skill_defaults:
+            template = MappingProxyType({**template, **{
+                key: MappingProxyType(dict(skill) if isinstance(skill, Mapping) else asdict(skill))
+                for key, skill in self.new_skill_defaults.items()}})
+        return template
+
+    def _set_default_skills(self):
+        # skills the character does not define are copied from the template when first used
+        skills = self.skills.owned() if isinstance(self.skills, SkillOverlay) else self.skills
+        self.skills = SkillOverlay(skills, self._skill_template(), self.SkillClass)
+
+    def _calc_category_bonuses(self) -> Dict[str, int]:
+        return {"combat": _set_category_bonus(self.DEX, self.INT, self.STR),
+                "communication": _set_category_bonus(self.INT, self.POW, self.CHA),
+                "manipulation": _set_category_bonus(self.DEX, self.INT, self.STR),
+                "mental": _set_category_bonus(self.INT, self.POW, self.EDU),
+                "perception": _set_category_bonus(self.INT, self.POW, self.CON),
+                "physical": _set_category_bonus(self.DEX, self.STR, self.CON, self.SIZ)}
+
+    def _calc_simple_category_bonuses(self) -> Dict[str, int]:
+        return {"combat": -(self.DEX // -2),
+                "communication": -(self.CHA // -2),
+                "manipulation": -(self.DEX // -2),
+                "mental": -(self.INT // -2),
+                "perception": -(self.POW // -2),
+                "physical": -(self.STR // -2)}
 
     def _objectify_skills(self):
         for key, value in self.new_skill_defaults.items():
-            self.new_skill_defaults[key] = self.SkillClass(**value)
-        for key, value in self.skills.items():
-            self.skills[key] = self.SkillClass(**value)
-
+            if isinstance(value, Mapping):
+                self.new_skill_defaults[key] = build_skill(self.SkillClass, value)
+        skills = self.skills.owned() if isinstance(self.skills, SkillOverlay) else self.skills
+        for key, value in skills.items():
+            if isinstance(value, Mapping):
+                self.skills[key] = build_skill(self.SkillClass, value)
+
+    @property
+    def skill_index(self) -> SkillIndex:
+        """
+        The index that resolves skill names for this character's skills, built on first use and again whenever the
+        skills are replaced. Add skills through its add method to keep it up to date.
+        """
+        index = self.__dict__.get("_skill_index")
+        if index is None or index.skills is not self.skills:
+            index = self.__dict__["_skill_index"] = SkillIndex(self.skills, self.skill_aliases)
+        return index
+
+    def _get_skill(self, skill: str = "") -> BasicRoleplaySkill:
+        skills = self.skills
+        if skill in skills:
+            return skills[skill]
+        return skills[self.skill_index._fallback(skill)]
+
+    @logged_roll
     def make_skill_roll(self,
                         skill: str = "",
                         difficulty: int = 1,
                         modifier: int = 0,
                         advantage: int = 0,
-                        lucky: bool = False):
-        if skill in self.skills:
-            return self.skills[skill].skill_roll(category_bonus=self.category_bonuses,
+                        lucky: bool = False,
+                        rng: DiceBuffer = None):
+        return self._get_skill(skill).skill_roll(category_bonus=self.category_bonuses,
                                                  armor_penalty=self.armor_category_penalty,
                                                  fatigue_points=self.fatigue,
                                                  diff_multi=difficulty,
                                                  modifier=modifier,
                                                  advantage=advantage,
-                                                 lucky=lucky)
-        else:
-            _skill = " ".join(skill.split(" ")[0:-1] + ["(various)"])
-            try:
-                return self.skills[_skill].skill_roll(category_bonus=self.category_bonuses,
-                                                      armor_penalty=self.armor_category_penalty,
-                                                      fatigue_points=self.fatigue,
-                                                      diff_multi=difficulty,
-                                                      modifier=modifier,
-                                                      advantage=advantage,
-                                                      lucky=lucky)
-            except KeyError:
-                raise KeyError(f"Selected skill {skill} is not a valid skill and has no generic type")
-
+                                                 lucky=lucky,
+                                                 rng=rng)
+
+    def skill_roll_probabilities(self,
+                                 skill: str = "",
+                                 difficulty: int = 1,
+                                 modifier: int = 0,
+                                 advantage: int = 0,
+                                 lucky: bool = False) -> Dict[str, float]:
+        """
+        The exact chance of each result of make_skill_roll with the same arguments, without rolling any dice
+        :return: dict of fumble, failure, success, special and critical to their exclusive probabilities
+        """
+        return self._get_skill(skill).skill_roll_probabilities(category_bonus=self.category_bonuses,
+                                                               armor_penalty=self.armor_category_penalty,
+                                                               fatigue_points=self.fatigue,
+                                                               diff_multi=difficulty,
+                                                               modifier=modifier,
+                                                               advantage=advantage,
+                                                               lucky=lucky)
+
+    @logged_roll
     def opposed_roll_highest_success(self,
                                      opponent: Union[BasicRoleplaySkill, int] = 0,
                                      opponent_category_bonus: Dict[str, int] = None,
                                      opponent_armor_penalty: Dict[str, int] = None,
                                      my_skill: str = "",
-                                     i_win_ties: bool = None) -> Dict[str, bool]:
+                                     i_win_ties: bool = None,
+                                     rng: DiceBuffer = None) -> Dict[str, bool]:
         """
         Uses the highest success method to resolve a skill roll. Also, useful for combat.
         :param opponent: A skill from an opponent's character class or a static chance
@@ -356,20 +512,23 @@ class BasicRoleplayCharacter:
         :param opponent_armor_penalty: opponent's armor penalty dict
         :param my_skill: The skill this character is using
         :param i_win_ties: Does this character win the tie? If None, ties are determined by highest skill level.
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return: A dictionary containing if this character won, if they critical'd, if they failed, if they fumbled
         """
         # Make rolls, opponent is either a skill from character or fixed chance
-        my_success = self.make_skill_roll(skill=my_skill)
+        my_success = self.make_skill_roll(skill=my_skill, rng=rng)
         if opponent_category_bonus is None:
             opponent_category_bonus = {}
         if opponent_armor_penalty is None:
             opponent_armor_penalty = {}
         if isinstance(opponent, int):
             their_success = BasicRoleplaySkill(chance=opponent).skill_roll(category_bonus=opponent_category_bonus,
-                                                                           armor_penalty=opponent_armor_penalty)
+                                                                           armor_penalty=opponent_armor_penalty,
+                                                                           rng=rng)
         else:
             their_success = opponent.skill_roll(category_bonus=opponent_category_bonus,
-                                                armor_penalty=opponent_armor_penalty)
+                                                armor_penalty=opponent_armor_penalty,
+                                                rng=rng)
             opponent = opponent.chance
 
         # Turn rolls into digestible form
@@ -392,22 +551,25 @@ class BasicRoleplayCharacter:
                     "is_critical": my_success["critical"],
                     "is_fail": my_success["failure"],
                     "is_fumble": my_success["fumble"]}
-        return {"i_won": self.skills[my_skill].chance >= opponent,
+        return {"i_won": self._get_skill(my_skill).chance >= opponent,
                 "is_critical": my_success["fumble"],
                 "is_fail": my_success["failure"],
                 "is_fumble": my_success["fumble"]}
 
+    @logged_roll
     def opposed_roll_subtraction(self,
                                  opponent: Union[BasicRoleplaySkill, int] = 0,
                                  opponent_category_bonus: Dict[str, int] = None,
                                  opponent_armor_penalty: Dict[str, int] = None,
-                                 my_skill: str = "") -> Dict[str, bool]:
+                                 my_skill: str = "",
+                                 rng: DiceBuffer = None) -> Dict[str, bool]:
         """
         An opposed skill check using the subtraction method. This should be called by the active character.
         :param opponent: A skill from an opponent's character class or a static chance
         :param opponent_category_bonus: opponent's category bonus dict
         :param opponent_armor_penalty: opponent's armor penalty dict
         :param my_skill: The skill this character is using
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return: A success dictionary from a regular skill roll
         """
         if opponent_category_bonus is None:
@@ -416,39 +578,45 @@ class BasicRoleplayCharacter:
             opponent_armor_penalty = {}
         if isinstance(opponent, int):
             their_success = BasicRoleplaySkill(chance=opponent).skill_roll(category_bonus=opponent_category_bonus,
-                                                                           armor_penalty=opponent_armor_penalty)
+                                                                           armor_penalty=opponent_armor_penalty,
+                                                                           rng=rng)
         else:
             their_success = opponent.skill_roll(category_bonus=opponent_category_bonus,
-                                                armor_penalty=opponent_armor_penalty)
+                                                armor_penalty=opponent_armor_penalty,
+                                                rng=rng)
             opponent = opponent.chance
 
         their_success_int = _intify_success(their_success)
         if their_success_int > 2:
-            if abs(self.skills[my_skill].chance - opponent) <= 5:
-                return BasicRoleplaySkill(chance=5).skill_roll(lucky=True)
+            if abs(self._get_skill(my_skill).chance - opponent) <= 5:
+                return BasicRoleplaySkill(chance=5).skill_roll(lucky=True, rng=rng)
             return self.make_skill_roll(skill=my_skill,
-                                        modifier=-1*opponent)
+                                        modifier=-1*opponent,
+                                        rng=rng)
 
         if their_success_int == 1:
-            return self.make_skill_roll(skill=my_skill, difficulty=2)
-        return self.make_skill_roll(skill=my_skill)
+            return self.make_skill_roll(skill=my_skill, difficulty=2, rng=rng)
+        return self.make_skill_roll(skill=my_skill, rng=rng)
 
+    @logged_roll
     def opposed_roll_resistance_table(self,
                                       opponent: Union[BasicRoleplaySkill, int] = 0,
-                                      my_skill: str = "") -> Dict[str, bool]:
+                                      my_skill: str = "",
+                                      rng: DiceBuffer = None) -> Dict[str, bool]:
         """
         Makes an opposing roll using the resistance table method
         :param opponent: A skill from an opponent's character class or a static chance
         :param my_skill: The skill this character is using
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return:
         """
         if not isinstance(opponent, int):
             opponent = opponent.chance // 5
         else:
             opponent = opponent // 5
-        vs = self.skills[my_skill].chance // 5 - opponent
+        vs = self._get_skill(my_skill).chance // 5 - opponent
         chance = 50 + 5 * vs
-        roll = roll_d100()
+        roll = roll_d100(rng=rng)
         total = roll
         result = {
             "fumble": False,
@@ -470,21 +638,24 @@ class BasicRoleplayCharacter:
                     result["critical"] = True
         return result
 
+    @logged_roll
     def opposed_roll_resistance(self,
                                 opponent: Union[BasicRoleplaySkill, int] = 0,
-                                my_skill: str = "") -> Dict[str, bool]:
+                                my_skill: str = "",
+                                rng: DiceBuffer = None) -> Dict[str, bool]:
         """
         Makes an opposing roll using the resistance table method
         :param opponent: A skill from an opponent's character class or a static chance
         :param my_skill: The skill this character is using
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return:
         """
         if not isinstance(opponent, int):
             opponent = opponent.chance
-        vs = self.skills[my_skill].chance - opponent
+        vs = self._get_skill(my_skill).chance - opponent
         chance = 50 + vs
 
-        roll = roll_d100()
+        roll = roll_d100(rng=rng)
         total = roll
         result = {
             "fumble": False,
@@ -505,30 +676,61 @@ class BasicRoleplayCharacter:
                     result["critical"] = True
         return result
 
+    def predict_opposed(self,
+                        method: str = "highest_success",
+                        my_skill: str = "",
+                        opponent: Union[BasicRoleplaySkill, int] = 0,
+                        opponent_category_bonus: Dict[str, int] = None,
+                        opponent_armor_penalty: Dict[str, int] = None,
+                        i_win_ties: bool = None) -> Dict[str, float]:
+        """
+        The exact outcome distribution of an opposed roll without rolling, see brp_probability.predict_opposed
+        :param method: one of "highest_success", "subtraction", "resistance_table" or "resistance"
+        :return: probabilities of the outcomes of the matching opposed_roll method
+        """
+        return predict_opposed(self, method, my_skill, opponent, opponent_category_bonus, opponent_armor_penalty,
+                               i_win_ties)
+
+    @logged_roll
     def opposed_pow_check(self,
-                          opponent: Union[BasicRoleplaySkill, int] = 0) -> Dict[str, bool]:
-        result = self.opposed_roll_resistance_table(opponent=opponent, my_skill="Luck")
+                          opponent: Union[BasicRoleplaySkill, int] = 0,
+                          rng: DiceBuffer = None) -> Dict[str, bool]:
+        result = self.opposed_roll_resistance_table(opponent=opponent, my_skill="Luck", rng=rng)
         if result:
             self.pow_improvement_check = True
         return result
 
-    def improve_pow(self):
+    @logged_roll
+    def improve_pow(self, rng: DiceBuffer = None):
         if self.pow_improvement_check:
             target = 5 * (self.max_species_pow + self.min_species_pow - self.POW)
-            if roll_d100() < target:
-                self.POW += roll_ndm(1, 3) - 1
-
-    def make_experience_rolls(self):
-        for skill in self.skills:
-            self.skills[skill].experience_roll(int_characteristic=self.INT,
-                                               improvement_dice=self.improvement_die)
-
-    def characteristic_roll(self, characteristic: str = "", multiplier: int = 0, advantage: int = 0, modifier: int = 0):
+            if roll_d100(rng=rng) < target:
+                self.POW += roll_ndm(1, 3, rng) - 1
+
+    def make_experience_rolls(self, rng: DiceBuffer = None):
+        if isinstance(self.skills, SkillTable):
+            for _, skill in self.skills.checked():
+                skill.experience_roll(int_characteristic=self.INT, improvement_dice=self.improvement_die, rng=rng)
+            return
+        # default skills still in the template have never been rolled, so cannot have an experience check
+        skills = self.skills.owned() if isinstance(self.skills, SkillOverlay) else self.skills
+        for skill in skills:
+            skills[skill].experience_roll(int_characteristic=self.INT,
+                                          improvement_dice=self.improvement_die,
+                                          rng=rng)
+
+    def characteristic_roll(self,
+                            characteristic: str = "",
+                            multiplier: int = 0,
+                            advantage: int = 0,
+                            modifier: int = 0,
+                            rng: DiceBuffer = None):
         if characteristic not in {"STR", "CON", "INT", "DEX", "POW", "CHA", "SIZ", "EDU"}:
             raise ValueError(f"Characteristic {characteristic} not a valid choice.")
-        return roll_d100(advantage=advantage) - modifier <= multiplier * self.__getattribute__(characteristic)
+        return roll_d100(advantage=advantage, rng=rng) - modifier <= multiplier * self.__getattribute__(characteristic)
 
-    def take_damage(self, amount: int = 0, bypass_armor: bool = False, target: str = None):
+    @logged_roll
+    def take_damage(self, amount: int = 0, bypass_armor: bool = False, target: str = None, rng: DiceBuffer = None):
         condition = {
             "unconscious": False,
             "major_wound_timer": None,
@@ -540,7 +742,7 @@ class BasicRoleplayCharacter:
         }
         if not bypass_armor:
             if isinstance(self.armor_protection, str):
-                protection = roll_str(self.armor_protection)
+                protection = roll_str(self.armor_protection, rng)
             else:
                 protection = self.armor_protection
             amount -= protection
@@ -551,12 +753,12 @@ class BasicRoleplayCharacter:
             self.damage += amount
             if not self.minor_wound and self.damage >= self.major_wound_level:
                 self.minor_wound = True
-                if self.skills["Luck"].skill_roll(lucky=True)["failure"]:
+                if self.skills["Luck"].skill_roll(lucky=True, rng=rng)["failure"]:
                     condition["unconscious"] = True
             if amount >= self.major_wound_level:
                 self.major_wound = True
                 condition["major_wound_timer"] = self.max_hit_points - self.damage
-                if self.skills["Luck"].skill_roll(lucky=True)["failure"]:
+                if self.skills["Luck"].skill_roll(lucky=True, rng=rng)["failure"]:
                     condition["permanent_injury"] = True
             if self.damage >= self.max_hit_points:
                 self.fatal_wound = True
@@ -594,17 +796,22 @@ class BasicRoleplayCharacter:
         if target:
             self.damage_location[target] = max(0, self.damage_location[target] - amount)
 
-    def sanity_roll(self, loss_on_success: str = "0", loss_on_fail: str = "0", loss_reason: str = "Default"):
-        if roll_d100() <= self.sanity:
+    @logged_roll
+    def sanity_roll(self,
+                    loss_on_success: str = "0",
+                    loss_on_fail: str = "0",
+                    loss_reason: str = "Default",
+                    rng: DiceBuffer = None):
+        if roll_d100(rng=rng) <= self.sanity:
             try:
                 loss = int(loss_on_success)
             except ValueError:
-                loss = roll_str(loss_on_success)
+                loss = roll_str(loss_on_success, rng)
         else:
             try:
                 loss = int(loss_on_fail)
             except ValueError:
-                loss = roll_str(loss_on_fail)
+                loss = roll_str(loss_on_fail, rng)
 
         self.sanity = max(0, self.sanity - loss)
         self.recent_san_loss += loss
@@ -618,14 +825,14 @@ class BasicRoleplayCharacter:
         if self.sanity <= 0:
             self.permanently_insane = True
 
-    def recover_sanity(self, amount: str = "0"):
+    def recover_sanity(self, amount: str = "0", rng: DiceBuffer = None):
         """
         Use this to recover sanity or with default amounts to just remove temporary insanity
         """
         try:
             self.sanity += int(amount)
         except ValueError:
-            self.sanity += roll_str(amount)
+            self.sanity += roll_str(amount, rng)
         self.sanity = min(self.sanity, 100 - self.skills["Blasphemous Lore"].chance)
         self.temporarily_insane = False
 
@@ -657,17 +864,16 @@ def load_character_from_json(filepath: str,
                              CharacterClass: dataclass = BasicRoleplayCharacter,
                              SkillClass: dataclass = BasicRoleplaySkill) -> BasicRoleplayCharacter:
     if issubclass(CharacterClass, BasicRoleplayCharacter):
-        with open(filepath, "r") as fh:
-            character = CharacterClass(**json.loads(fh.read()))
-            character.set_skill_class(SkillClass)
-            return character
+        with open(filepath, "rb") as fh:
+            return character_from_dict(loads(fh.read()), CharacterClass, SkillClass)
     raise TypeError("On load a CharacterClass should be a subclass of BasicRoleplayCharacter")
 
 
-def save_character_to_json(character: BasicRoleplayCharacter, filepath: str):
-    temp_var = character.SkillClass
-    del character.SkillClass
-    data = json.dumps(asdict(character))
-    with open(filepath, "w") as fh:
-        fh.write(data)
-    character.SkillClass = temp_var
+def save_character_to_json(character: BasicRoleplayCharacter, filepath: str, sparse: bool = False):
+    """
+    Saves a character as JSON
+    :param sparse: only save the fields that differ from the class defaults and the skills that differ from the
+                   default skills for the character's characteristics. load_character_from_json fills in the rest.
+    """
+    with open(filepath, "wb") as fh:
+        write_character(character, fh, sparse)
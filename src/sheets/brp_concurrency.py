@@ -0,0 +1,93 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from .brp_character import BasicRoleplayCharacter
+
+# the wrapper in use for each character, by id, which is unique while the wrapper keeps its character alive
+_wrappers = weakref.WeakValueDictionary()
+_wrappers_lock = threading.Lock()
+
+
+class LockedCharacter:
+    """
+    Wraps a character for use from many threads, as on a game server where several requests can act on the same
+    character at once. Every method call on the wrapper, such as take_damage, heal_damage, sanity_roll or skill_roll,
+    runs while holding the character's lock, so each is a single transition that no other thread sees half done.
+    Setting an attribute through the wrapper also takes the lock. Reading a plain attribute does not, reads see the
+    state between two transitions.
+
+    To make several calls as one transition, such as reading damage then healing it, hold the lock with
+    `with locked:`, or hold several characters at once with hold_characters. The lock is reentrant, so calls inside
+    the block still work.
+
+    There is one lock per character: LockedCharacter(character) hands back the wrapper already in use for that
+    character, if there is one, so threads that each wrap the same character still exclude each other. The lock is
+    not stored on the character, so characters still copy, pickle and save as before.
+
+    Dice are not locked. A DiceBuffer, including the shared one from use_batch_buffer, must not be rolled from two
+    threads at once, so give each thread its own stream, for example from roll_stream(seed).spawn(threads), and
+    pass it as rng.
+    """
+
+    __slots__ = ("character", "lock", "_methods", "__weakref__")
+
+    def __new__(cls, character: BasicRoleplayCharacter):
+        with _wrappers_lock:
+            wrapper = _wrappers.get(id(character))
+            if wrapper is None or wrapper.character is not character:
+                wrapper = object.__new__(cls)
+                object.__setattr__(wrapper, "character", character)
+                object.__setattr__(wrapper, "lock", threading.RLock())
+                object.__setattr__(wrapper, "_methods", {})
+                _wrappers[id(character)] = wrapper
+            return wrapper
+
+    def __getattr__(self, name: str):
+        if name in self._methods:
+            return self._methods[name]
+        value = getattr(self.character, name)
+        if not callable(value) or getattr(value, "__self__", None) is not self.character:
+            return value
+        character, lock = self.character, self.lock
+
+        # the method is looked up on every call, so the roll log swapping methods in and out still applies
+        def locked(*args, **kwargs):
+            with lock:
+                return getattr(character, name)(*args, **kwargs)
+        locked.__name__ = name
+        self._methods[name] = locked
+        return locked
+
+    def __setattr__(self, name: str, value):
+        with self.lock:
+            setattr(self.character, name, value)
+
+    def __enter__(self) -> BasicRoleplayCharacter:
+        self.lock.acquire()
+        return self.character
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.character.name!r})"
+
+
+@contextmanager
+def hold_characters(*characters: LockedCharacter) -> Iterator[Tuple[BasicRoleplayCharacter, ...]]:
+    """
+    Holds the locks of several characters at once, for transitions that involve them all, such as an opposed roll
+    that can set an experience check on the opponent's skill. The locks are always taken in the same order, whatever
+    order the characters are given in, so two threads holding overlapping groups cannot deadlock.
+    :return: the wrapped characters, in the order given
+    """
+    ordered = sorted(set(characters), key=id)
+    for character in ordered:
+        character.lock.acquire()
+    try:
+        yield tuple(character.character for character in characters)
+    finally:
+        for character in reversed(ordered):
+            character.lock.release()
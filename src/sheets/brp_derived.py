@@ -0,0 +1,177 @@
+from typing import Dict, Mapping, Tuple, Union
+
+import numpy as np
+
+from .brp_character import _build_skill_template, _language_key
+
+# the damage modifier for each band of STR + SIZ, up to and including the bound
+_DAMAGE_MODIFIER_BOUNDS = np.array([12, 16, 24, 32, 40])
+_DAMAGE_MODIFIERS = np.array(["-1d6", "-1d4", "0", "1d4", "1d6", None], dtype=object)
+# the divisor of max_hit_points for each location's hit points
+_LOCATION_DIVISORS = {"left_leg": 3, "right_leg": 3, "abdomen": 3, "head": 3, "left_arm": 4, "right_arm": 4,
+                      "chest": 10 / 4}
+
+
+def damage_modifiers(STR: np.ndarray, SIZ: np.ndarray) -> np.ndarray:
+    """
+    BasicRoleplayCharacter._calc_damage_modifier for arrays of characteristics
+    :return: an object array of damage modifier roll strings
+    """
+    total = np.asarray(STR) + np.asarray(SIZ)
+    codes = _DAMAGE_MODIFIERS[np.searchsorted(_DAMAGE_MODIFIER_BOUNDS, total)]
+    large = total > _DAMAGE_MODIFIER_BOUNDS[-1]
+    codes[large] = [f"{dice}d6" for dice in ((total[large] - 41) // 16 + 2).tolist()]
+    return codes
+
+
+def hit_points(CON: np.ndarray, SIZ: np.ndarray, tough: Union[bool, np.ndarray] = False) -> np.ndarray:
+    """
+    BasicRoleplayCharacter._calc_hit_points for arrays of characteristics
+    :param tough: the optional total hit points rule, for everyone or as a boolean array
+    """
+    total = np.asarray(CON) + np.asarray(SIZ)
+    return np.where(tough, total, -(total // -2))
+
+
+def major_wound_levels(max_hit_points: np.ndarray) -> np.ndarray:
+    """
+    BasicRoleplayCharacter.major_wound_level for an array of max_hit_points
+    """
+    return -(np.asarray(max_hit_points) // -2)
+
+
+def location_hit_points(max_hit_points: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    BasicRoleplayCharacter.max_hp_location for an array of max_hit_points
+    :return: dict of each location to an array of hit points
+    """
+    max_hit_points = np.asarray(max_hit_points)
+    return {location: -(max_hit_points // -divisor) for location, divisor in _LOCATION_DIVISORS.items()}
+
+
+def starting_fatigue(STR: np.ndarray, CON: np.ndarray) -> np.ndarray:
+    """
+    The fatigue points a character starts with, for arrays of characteristics
+    """
+    return np.asarray(STR) + np.asarray(CON)
+
+
+def starting_sanity(POW: np.ndarray) -> np.ndarray:
+    """
+    The sanity a character starts with, for an array of POW
+    """
+    return np.minimum(5 * np.asarray(POW), 100)
+
+
+def temp_insanity_scores(POW: np.ndarray) -> np.ndarray:
+    """
+    BasicRoleplayCharacter.temp_insanity_score for an array of POW
+    """
+    return -(starting_sanity(POW) // -2)
+
+
+def _category_bonus(primary, secondary1, secondary2, negative=10):
+    return (primary - 10) + (secondary1 - 10) // 2 + (secondary2 - 10) // 2 + (10 - negative)
+
+
+def _columns(characteristics: Mapping[str, np.ndarray], names: str) -> Tuple[np.ndarray, ...]:
+    return tuple(np.asarray(characteristics[name]) for name in names.split())
+
+
+def category_bonuses(characteristics: Mapping[str, np.ndarray],
+                     use_category_bonus: Union[bool, np.ndarray] = True,
+                     use_simple_category_bonus: Union[bool, np.ndarray] = False) -> Dict[str, np.ndarray]:
+    """
+    BasicRoleplayCharacter.category_bonuses for arrays of characteristics
+    :param characteristics: dict of STR, CON, POW, DEX, CHA, INT, SIZ and EDU to arrays
+    :param use_category_bonus: the optional normal category bonus, for everyone or as a boolean array
+    :param use_simple_category_bonus: the optional simple category bonus, used where use_category_bonus is not
+    :return: dict of each category to an array of bonuses
+    """
+    STR, CON, POW, DEX, CHA, INT, SIZ, EDU = _columns(characteristics, "STR CON POW DEX CHA INT SIZ EDU")
+    normal = {"combat": _category_bonus(DEX, INT, STR),
+              "communication": _category_bonus(INT, POW, CHA),
+              "manipulation": _category_bonus(DEX, INT, STR),
+              "mental": _category_bonus(INT, POW, EDU),
+              "perception": _category_bonus(INT, POW, CON),
+              "physical": _category_bonus(DEX, STR, CON, SIZ)}
+    if np.all(use_category_bonus):
+        return normal
+    simple = simple_category_bonuses(characteristics)
+    return {category: np.where(use_category_bonus, normal[category],
+                               np.where(use_simple_category_bonus, simple[category], 0))
+            for category in normal}
+
+
+def simple_category_bonuses(characteristics: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    BasicRoleplayCharacter._calc_simple_category_bonuses for arrays of characteristics
+    :param characteristics: dict of STR, POW, DEX, CHA and INT to arrays
+    """
+    STR, POW, DEX, CHA, INT = _columns(characteristics, "STR POW DEX CHA INT")
+    return {"combat": -(DEX // -2),
+            "communication": -(CHA // -2),
+            "manipulation": -(DEX // -2),
+            "mental": -(INT // -2),
+            "perception": -(POW // -2),
+            "physical": -(STR // -2)}
+
+
+def derived_characteristics(characteristics: Mapping[str, np.ndarray],
+                            tough: Union[bool, np.ndarray] = False,
+                            use_category_bonus: Union[bool, np.ndarray] = True,
+                            use_simple_category_bonus: Union[bool, np.ndarray] = False) -> Dict:
+    """
+    Every derived characteristic of many characters at once, named as on BasicRoleplayCharacter, along with the
+    starting power_points, fatigue and sanity that __post_init__ sets
+    :param characteristics: dict of STR, CON, POW, DEX, CHA, INT, SIZ and EDU to arrays
+    :return: dict of arrays, with max_hp_location and category_bonuses as dicts of arrays
+    """
+    STR, CON, POW, SIZ = _columns(characteristics, "STR CON POW SIZ")
+    max_hit_points = hit_points(CON, SIZ, tough)
+    return {"damage_modifier": damage_modifiers(STR, SIZ),
+            "max_hit_points": max_hit_points,
+            "major_wound_level": major_wound_levels(max_hit_points),
+            "max_power_points": POW,
+            "max_hp_location": location_hit_points(max_hit_points),
+            "temp_insanity_score": temp_insanity_scores(POW),
+            "category_bonuses": category_bonuses(characteristics, use_category_bonus, use_simple_category_bonus),
+            "power_points": POW,
+            "fatigue": starting_fatigue(STR, CON),
+            "sanity": starting_sanity(POW)}
+
+
+def default_skill_chances(characteristics: Mapping[str, np.ndarray],
+                          can_drive: bool = True,
+                          can_fly: bool = True,
+                          literate: bool = True,
+                          energy_projection: bool = False,
+                          use_education: bool = True,
+                          primary_language: str = "") -> Dict[str, np.ndarray]:
+    """
+    The chance of every default skill, as in the skill template of characters with these options
+    :param characteristics: dict of STR, CON, POW, DEX, CHA, INT and EDU to arrays
+    :param can_drive: and the other options, as the BasicRoleplayCharacter fields of the same names
+    :return: dict of each skill key in the template to an array of chances
+    """
+    STR, CON, POW, DEX, CHA, INT, EDU = _columns(characteristics, "STR CON POW DEX CHA INT EDU")
+    size = len(STR)
+    # the template for average characteristics gives the keys and the skills that do not depend on them
+    template = _build_skill_template(10, 10, 10, 10, 10, 10, 10,
+                                     can_drive=can_drive, can_fly=can_fly, literate=literate,
+                                     energy_projection=energy_projection, use_education=use_education,
+                                     primary_language=primary_language)
+    chances = {key: np.full(size, spec["chance"]) for key, spec in template.items()}
+    chances["Dodge"] = 2 * DEX
+    language = _language_key(primary_language)
+    chances[language] = 5 * (np.maximum(INT, EDU) if use_education else INT)
+    if literate:
+        chances["Literacy"] = chances[language]
+    chances["Gaming"] = INT + POW
+    chances["Fly"] = 4 * DEX if can_fly else .5 * DEX
+    if energy_projection:
+        chances["Projection"] = 2 * DEX
+    for key, characteristic in (("Effort", STR), ("Stamina", CON), ("Idea", INT), ("Luck", POW),
+                                ("Agility", DEX), ("Charm", CHA), ("Know", EDU)):
+        chances[key] = 5 * characteristic
+    return chances
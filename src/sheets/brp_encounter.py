@@ -0,0 +1,201 @@
+import copy
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+from .brp_character import BasicRoleplayCharacter
+from ..utils import DiceBuffer, roll_str, roll_stream
+
+OUTCOMES = ("out", "minor_wound", "major_wound", "fatal_wound", "temporarily_insane", "permanently_insane")
+# the state a fight changes, put back on each character before every trial
+_COMBAT_STATE = ("damage", "minor_wound", "major_wound", "fatal_wound", "sanity", "recent_san_loss",
+                 "temporarily_insane", "permanently_insane")
+
+
+@dataclass
+class EncounterStats:
+    """
+    Running totals over simulated encounters. Trials are added one at a time and the totals of separate runs can be
+    merged, so no trial is kept once it has been counted.
+
+    party_a and party_b hold, for each character in party order, how many trials ended with each of OUTCOMES.
+    """
+    trials: int = 0
+    wins_a: int = 0
+    wins_b: int = 0
+    draws: int = 0
+    rounds_to_win: Dict[int, int] = field(default_factory=dict)  # rounds taken by decisive trials, to how many
+    party_a: List[Dict[str, int]] = field(default_factory=list)
+    party_b: List[Dict[str, int]] = field(default_factory=list)
+
+    @property
+    def win_rate_a(self) -> float:
+        return self.wins_a / self.trials if self.trials else 0.0
+
+    @property
+    def win_rate_b(self) -> float:
+        return self.wins_b / self.trials if self.trials else 0.0
+
+    @property
+    def draw_rate(self) -> float:
+        return self.draws / self.trials if self.trials else 0.0
+
+    @property
+    def mean_rounds_to_win(self) -> float:
+        decisive = self.wins_a + self.wins_b
+        return sum(rounds * count for rounds, count in self.rounds_to_win.items()) / decisive if decisive else 0.0
+
+    def rates(self, party: str = "a") -> List[Dict[str, float]]:
+        """
+        For each character in party "a" or "b", the share of trials ending in each of OUTCOMES
+        """
+        counts = self.party_a if party == "a" else self.party_b
+        return [{outcome: count / self.trials if self.trials else 0.0 for outcome, count in character.items()}
+                for character in counts]
+
+    def merge(self, other: "EncounterStats") -> "EncounterStats":
+        """
+        Adds the totals of another run over the same parties to these
+        """
+        self.trials += other.trials
+        self.wins_a += other.wins_a
+        self.wins_b += other.wins_b
+        self.draws += other.draws
+        for rounds, count in other.rounds_to_win.items():
+            self.rounds_to_win[rounds] = self.rounds_to_win.get(rounds, 0) + count
+        for mine, theirs in ((self.party_a, other.party_a), (self.party_b, other.party_b)):
+            if not mine:
+                mine.extend({outcome: 0 for outcome in OUTCOMES} for _ in theirs)
+            for counts, other_counts in zip(mine, theirs):
+                for outcome, count in other_counts.items():
+                    counts[outcome] += count
+        return self
+
+
+@dataclass
+class _Options:
+    attack_skill: str = "Brawl"
+    defense_skill: str = "Dodge"
+    max_rounds: int = 50
+    sanity_check: Tuple[str, str] = None
+
+
+def _attack(attacker: BasicRoleplayCharacter, defender: BasicRoleplayCharacter, options: _Options,
+            rng: DiceBuffer) -> bool:
+    """
+    One attack, resolved as an opposed roll of the attack skill against the defense skill
+    :return: whether the defender is out of the fight
+    """
+    result = attacker.opposed_roll_highest_success(defender._get_skill(options.defense_skill),
+                                                   opponent_category_bonus=defender.category_bonuses,
+                                                   opponent_armor_penalty=defender.armor_category_penalty,
+                                                   my_skill=options.attack_skill,
+                                                   rng=rng)
+    if not result["i_won"] or result["is_fail"]:
+        return False
+    damage = roll_str(attacker.primary_weapon_damage, rng)
+    if result["is_critical"]:
+        damage += roll_str(attacker.primary_weapon_damage, rng)
+    damage = max(0, damage + roll_str(attacker.damage_modifier, rng))
+    condition = defender.take_damage(damage, rng=rng)
+    return condition["unconscious"] or condition["dying"] or defender.fatal_wound
+
+
+def _run_trials(party_a: Sequence[BasicRoleplayCharacter],
+                party_b: Sequence[BasicRoleplayCharacter],
+                trials: int,
+                rng: DiceBuffer,
+                options: _Options) -> EncounterStats:
+    # the parties are copied once, then put back to their starting state before every trial
+    party_a, party_b = copy.deepcopy((list(party_a), list(party_b)))
+    combatants = [(character, 0) for character in party_a] + [(character, 1) for character in party_b]
+    starting = [({name: getattr(character, name) for name in _COMBAT_STATE}, dict(character.damage_location))
+                for character, _ in combatants]
+    order = sorted(range(len(combatants)), key=lambda i: -combatants[i][0].DEX)
+    stats = EncounterStats(party_a=[{outcome: 0 for outcome in OUTCOMES} for _ in party_a],
+                           party_b=[{outcome: 0 for outcome in OUTCOMES} for _ in party_b])
+    counts = stats.party_a + stats.party_b
+
+    for _ in range(trials):
+        out = [False] * len(combatants)
+        for (character, _), (state, damage_location) in zip(combatants, starting):
+            character.__dict__.update(state)
+            character.damage_location = dict(damage_location)
+            character.loss_history = []
+            if options.sanity_check is not None:
+                character.sanity_roll(*options.sanity_check, loss_reason="Encounter", rng=rng)
+
+        winner, rounds = None, 0
+        while winner is None and rounds < options.max_rounds:
+            rounds += 1
+            for i in order:
+                character, side = combatants[i]
+                if out[i]:
+                    continue
+                targets = [j for j, (_, other_side) in enumerate(combatants) if other_side != side and not out[j]]
+                if not targets:
+                    break
+                target = targets[rng.die(len(targets)) - 1] if len(targets) > 1 else targets[0]
+                out[target] = _attack(character, combatants[target][0], options, rng)
+            for side in (0, 1):
+                if all(out[j] for j, (_, other_side) in enumerate(combatants) if other_side != side):
+                    winner = side
+                    break
+
+        stats.trials += 1
+        if winner is None:
+            stats.draws += 1
+        else:
+            if winner == 0:
+                stats.wins_a += 1
+            else:
+                stats.wins_b += 1
+            stats.rounds_to_win[rounds] = stats.rounds_to_win.get(rounds, 0) + 1
+        for i, (character, _) in enumerate(combatants):
+            counts[i]["out"] += out[i]
+            for outcome in OUTCOMES[1:]:
+                counts[i][outcome] += getattr(character, outcome)
+    return stats
+
+
+def simulate_encounters(party_a: Sequence[BasicRoleplayCharacter],
+                        party_b: Sequence[BasicRoleplayCharacter],
+                        trials: int = 1000,
+                        workers: int = None,
+                        seed: int = None,
+                        attack_skill: str = "Brawl",
+                        defense_skill: str = "Dodge",
+                        max_rounds: int = 50,
+                        sanity_check: Tuple[str, str] = None,
+                        chunk_size: int = 250) -> EncounterStats:
+    """
+    Simulates many fights between two parties. Each round, every character still standing, in order of DEX, attacks
+    a random opponent still standing with opposed_roll_highest_success of attack_skill against the defender's
+    defense_skill. A win that is not a failure deals primary_weapon_damage plus damage_modifier, with the weapon
+    damage rolled twice on a critical, through take_damage. A character is out once knocked unconscious, dying or
+    fatally wounded, and a party loses once all of its characters are out.
+
+    The characters passed in are not changed, each chunk of trials runs on its own copy of the parties.
+    :param trials: the number of fights to simulate
+    :param workers: if given, runs chunks of trials in a pool of this many processes
+    :param seed: seeds the dice, each chunk rolls from its own stream spawned from it, so the same seed gives the
+                 same results whatever the number of workers
+    :param max_rounds: fights still going after this many rounds are draws
+    :param sanity_check: loss_on_success and loss_on_fail of a sanity roll every character makes before each fight
+    :param chunk_size: the number of trials in each chunk
+    :return: the totals over every trial
+    """
+    options = _Options(attack_skill, defense_skill, max_rounds, sanity_check)
+    sizes = [min(chunk_size, trials - start) for start in range(0, trials, chunk_size)]
+    streams = roll_stream(seed).spawn(len(sizes))
+    stats = EncounterStats()
+    if not workers or workers == 1:
+        for size, stream in zip(sizes, streams):
+            stats.merge(_run_trials(party_a, party_b, size, stream, options))
+        return stats
+    with ProcessPoolExecutor(workers) as pool:
+        chunks = [pool.submit(_run_trials, party_a, party_b, size, stream, options)
+                  for size, stream in zip(sizes, streams)]
+        for chunk in chunks:
+            stats.merge(chunk.result())
+    return stats
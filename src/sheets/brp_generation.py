@@ -0,0 +1,81 @@
+from typing import Dict, Mapping, Union
+
+import numpy as np
+
+from .brp_character import _build_skill_template
+from .brp_derived import default_skill_chances
+from .brp_population import CATEGORIES, CharacterPopulation
+from ..utils import compile_dice, get_generator
+
+# the rolled characteristics, MOV is not rolled and starts at 10
+ROLLED_CHARACTERISTICS = ("STR", "CON", "POW", "DEX", "CHA", "INT", "SIZ", "EDU")
+GENERATION_METHODS = {
+    # 3d6, or 2d6+6 for INT, SIZ and EDU
+    "standard": {"STR": "3d6", "CON": "3d6", "POW": "3d6", "DEX": "3d6", "CHA": "3d6",
+                 "INT": "2d6+6", "SIZ": "2d6+6", "EDU": "2d6+6"},
+    # the best three of 4d6 in place of 3d6, for more capable characters
+    "heroic": {"STR": "4d6kh3", "CON": "4d6kh3", "POW": "4d6kh3", "DEX": "4d6kh3", "CHA": "4d6kh3",
+               "INT": "2d6+6", "SIZ": "2d6+6", "EDU": "2d6+6"},
+}
+
+
+def roll_characteristics(n: int = 1,
+                         method: Union[str, Mapping[str, str]] = "standard",
+                         generator: np.random.Generator = None) -> Dict[str, np.ndarray]:
+    """
+    Rolls the characteristics of n characters at once
+    :param method: the name of one of GENERATION_METHODS, or a dict of characteristic to roll string, with any
+                   characteristic left out rolled as in "standard"
+    :param generator: a numpy generator to draw from, pass a seeded one for reproducible characteristics
+    :return: dict of each of ROLLED_CHARACTERISTICS to an integer array of n values
+    """
+    generator = generator if generator is not None else get_generator()
+    if isinstance(method, str):
+        if method not in GENERATION_METHODS:
+            raise ValueError(f"Generation method {method} is not one of {', '.join(GENERATION_METHODS)}")
+        rolls = GENERATION_METHODS[method]
+    else:
+        rolls = {**GENERATION_METHODS["standard"], **method}
+    return {name: compile_dice(rolls[name]).roll_many(n, generator) for name in ROLLED_CHARACTERISTICS}
+
+
+def generate_population(n: int = 1,
+                        method: Union[str, Mapping[str, str]] = "standard",
+                        name: str = "NPC",
+                        generator: np.random.Generator = None,
+                        can_drive: bool = True,
+                        can_fly: bool = True,
+                        literate: bool = True,
+                        energy_projection: bool = False,
+                        use_education: bool = True,
+                        primary_language: str = "") -> CharacterPopulation:
+    """
+    Rolls n new characters straight into a CharacterPopulation, calculating derived characteristics and default skills
+    as arrays rather than character by character. to_characters builds the characters when they are needed.
+    :param method: as in roll_characteristics
+    :param name: the characters are named after it and numbered, "NPC 1", "NPC 2", ...
+    :param generator: a numpy generator to draw from, pass a seeded one for reproducible characters
+    :param can_drive: and the other options, as the BasicRoleplayCharacter fields of the same names, for every
+                      character
+    """
+    options = {"can_drive": can_drive, "can_fly": can_fly, "literate": literate,
+               "energy_projection": energy_projection, "use_education": use_education,
+               "primary_language": primary_language}
+    characteristics = roll_characteristics(n, method, generator)
+    chances = default_skill_chances(characteristics, **options)
+    population = CharacterPopulation(n, list(chances), CATEGORIES)
+    population.character_options = options
+    population.names[:] = [f"{name} {i + 1}" for i in range(n)]
+    for key, values in characteristics.items():
+        getattr(population, key)[:] = values
+    population.MOV[:] = 10
+    population.recalculate_derived(reset_pools=True)
+
+    template = _build_skill_template(10, 10, 10, 10, 10, 10, 10, **options)
+    for column, (key, values) in enumerate(chances.items()):
+        population.chance[:, column] = values
+        population.skill_category[:, column] = population.category_ids.get(template[key]["category"],
+                                                                           len(population.categories))
+    population.has_skill[:] = True
+    population._synced_chance = population.chance.copy()
+    return population
@@ -0,0 +1,177 @@
+import json
+from collections.abc import Mapping
+from dataclasses import asdict, fields, is_dataclass, MISSING
+from functools import lru_cache
+from typing import IO, Dict, Iterator, Tuple
+
+from .brp_skill import BasicRoleplaySkill, SkillOverlay, build_skill
+from .brp_skill_table import SkillTable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+else:
+    JSON_BACKEND = "json"
+
+
+def _encode_default(obj):
+    if is_dataclass(obj):
+        return asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    """
+    Encodes data as JSON with the fastest available backend, orjson, then msgspec, then the json module
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_encode_default, option=orjson.OPT_NON_STR_KEYS)
+    if msgspec is not None:
+        return msgspec.json.encode(data, enc_hook=_encode_default)
+    return json.dumps(data, default=_encode_default).encode()
+
+
+def loads(data):
+    """
+    Decodes JSON with the fastest available backend, orjson, then msgspec, then the json module
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+@lru_cache(maxsize=None)
+def _skill_fields(SkillClass: type) -> Tuple[Tuple[str, object], ...]:
+    defaults = []
+    for skill_field in fields(SkillClass):
+        if skill_field.default_factory is not MISSING:
+            defaults.append((skill_field.name, skill_field.default_factory))
+        else:
+            defaults.append((skill_field.name, skill_field.default))
+    return tuple(defaults)
+
+
+def _skill_items(skills) -> Iterator[Tuple[str, dict]]:
+    if isinstance(skills, SkillTable):
+        yield from skills.to_dicts().items()
+    elif isinstance(skills, SkillOverlay):
+        owned = skills.owned()
+        skill_fields = _skill_fields(skills.SkillClass)
+        for key in skills:
+            if key in owned:
+                yield key, {name: getattr(owned[key], name) for name, _ in skill_fields}
+            else:
+                spec = skills.template[key]
+                yield key, {name: spec[name] if name in spec else (default() if callable(default) else default)
+                            for name, default in skill_fields}
+    else:
+        for key, skill in skills.items():
+            yield key, (dict(skill) if isinstance(skill, Mapping)
+                        else {skill_field.name: getattr(skill, skill_field.name) for skill_field in fields(skill)})
+
+
+def skills_to_dict(skills) -> Dict[str, dict]:
+    """
+    Converts a character's skills to plain dicts, as dataclasses.asdict would, without copying default skills out
+    of a SkillOverlay's template
+    """
+    return dict(_skill_items(skills))
+
+
+def _field_values(character, sparse: bool = False) -> dict:
+    # every field but skills, leaving out those equal to their class defaults when sparse
+    data = {}
+    for character_field in fields(character):
+        if character_field.name == "skills":
+            continue
+        value = getattr(character, character_field.name)
+        if character_field.name == "new_skill_defaults":
+            value = skills_to_dict(value)
+        elif is_dataclass(value):
+            value = asdict(value)
+        if sparse:
+            if character_field.default_factory is not MISSING:
+                default = character_field.default_factory()
+            else:
+                default = character_field.default
+            if value == default:
+                continue
+        data[character_field.name] = value
+    return data
+
+
+def _sparse_skill_items(character) -> Iterator[Tuple[str, dict]]:
+    SkillClass = getattr(character, "SkillClass", BasicRoleplaySkill)
+    defaults = skills_to_dict(SkillOverlay((), character._skill_template(), SkillClass))
+    return ((key, skill) for key, skill in _skill_items(character.skills) if defaults.get(key) != skill)
+
+
+def character_to_dict(character) -> dict:
+    """
+    Converts a character to the dict that is saved as JSON. Unlike dataclasses.asdict, values that are already plain
+    lists and dicts are shared with the character rather than copied, so the result should be encoded and dropped.
+    """
+    data = _field_values(character)
+    data["skills"] = skills_to_dict(character.skills)
+    return data
+
+
+def character_from_dict(data: dict, CharacterClass: type, SkillClass: type = BasicRoleplaySkill):
+    """
+    Builds a character from a dict as loaded from JSON, creating each skill once as a SkillClass
+    """
+    data = dict(data)
+    for key in ("skills", "new_skill_defaults"):
+        if key in data:
+            data[key] = {name: build_skill(SkillClass, skill) for name, skill in data[key].items()}
+    character = CharacterClass(**data)
+    character.set_skill_class(SkillClass)
+    return character
+
+
+def character_to_sparse_dict(character) -> dict:
+    """
+    Like character_to_dict, but leaves out fields equal to their class defaults and skills equal to the default skills
+    the character would get from its characteristics and new_skill_defaults. Loading the result gives back the same
+    character, as long as the library's default skills have not changed in between.
+    """
+    data = _field_values(character, sparse=True)
+    skills = dict(_sparse_skill_items(character))
+    if skills:
+        data["skills"] = skills
+    return data
+
+
+def write_character(character, fh: IO[bytes], sparse: bool = False):
+    """
+    Writes a character to a binary file as the JSON of character_to_dict, or character_to_sparse_dict when sparse.
+    The skills are converted and written one at a time after the other fields, so neither the dict of skills nor the
+    whole document is held in memory at once.
+    """
+    data = _field_values(character, sparse)
+    skills = _sparse_skill_items(character) if sparse else _skill_items(character.skills)
+    # the other fields are written as an object left open, with the skills, if any, added as its last member
+    fh.write(dumps(data)[:-1])
+    separator = b"," if data else b""
+    count = 0
+    for key, skill in skills:
+        fh.write((b"," if count else separator + b'"skills":{') + dumps(key) + b":" + dumps(skill))
+        count += 1
+    if count:
+        fh.write(b"}}")
+    elif sparse:
+        fh.write(b"}")
+    else:
+        fh.write(separator + b'"skills":{}}')
@@ -0,0 +1,107 @@
+import gzip
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import IO, Iterable, Iterator, List
+
+from .brp_character import BasicRoleplayCharacter
+from .brp_json import character_from_dict, character_to_dict, character_to_sparse_dict, dumps, loads
+from .brp_skill import BasicRoleplaySkill
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SUFFIXES = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+
+def _open(filepath: str, mode: str, compression: str) -> IO[bytes]:
+    if compression == "infer":
+        path = os.fspath(filepath)
+        compression = next((name for suffix, name in _SUFFIXES.items() if path.endswith(suffix)), None)
+    if compression is None:
+        return open(filepath, mode)
+    if compression == "gzip":
+        return gzip.open(filepath, mode)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package, install it with the zstd extra")
+        return zstandard.open(filepath, mode)
+    raise ValueError(f"Compression {compression} is not one of gzip, zstd, infer or None")
+
+
+def _decode_lines(lines: List[bytes], CharacterClass: type, SkillClass: type) -> List[BasicRoleplayCharacter]:
+    return [character_from_dict(loads(line), CharacterClass, SkillClass) for line in lines]
+
+
+def _chunks(lines: Iterable[bytes], chunk_size: int) -> Iterator[List[bytes]]:
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_characters_jsonl(filepath: str,
+                          CharacterClass: dataclass = BasicRoleplayCharacter,
+                          SkillClass: dataclass = BasicRoleplaySkill,
+                          compression: str = "infer",
+                          processes: int = None,
+                          chunk_size: int = 256) -> Iterator[BasicRoleplayCharacter]:
+    """
+    Reads characters one at a time from a JSON Lines file, one character per line as saved by save_character_to_json
+    :param compression: "gzip", "zstd" or None, by default inferred from a .gz, .zst or .zstd suffix
+    :param processes: if given, builds characters in a pool of this many processes, chunk_size lines at a time.
+                      CharacterClass and SkillClass must then be importable by the worker processes.
+    :param chunk_size: lines per chunk handed to a worker process, at most two chunks per process are held at once
+    :return: an iterator of characters in file order
+    """
+    # checked here rather than in the generator, so a bad class is reported where the iterator is made
+    if not issubclass(CharacterClass, BasicRoleplayCharacter):
+        raise TypeError("On load a CharacterClass should be a subclass of BasicRoleplayCharacter")
+    return _iter_characters(filepath, CharacterClass, SkillClass, compression, processes, chunk_size)
+
+
+def _iter_characters(filepath: str,
+                     CharacterClass: type,
+                     SkillClass: type,
+                     compression: str,
+                     processes: int,
+                     chunk_size: int) -> Iterator[BasicRoleplayCharacter]:
+    with _open(filepath, "rb", compression) as fh:
+        if not processes:
+            for line in fh:
+                if line.strip():
+                    yield character_from_dict(loads(line), CharacterClass, SkillClass)
+            return
+        with ProcessPoolExecutor(processes) as pool:
+            pending = deque()
+            for chunk in _chunks(fh, chunk_size):
+                pending.append(pool.submit(_decode_lines, chunk, CharacterClass, SkillClass))
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+
+def write_characters_jsonl(characters: Iterable[BasicRoleplayCharacter],
+                           filepath: str,
+                           sparse: bool = False,
+                           compression: str = "infer") -> int:
+    """
+    Writes characters to a JSON Lines file one at a time, so characters can be streamed from a generator
+    :param sparse: save each character as save_character_to_json does with sparse=True
+    :param compression: "gzip", "zstd" or None, by default inferred from a .gz, .zst or .zstd suffix
+    :return: the number of characters written
+    """
+    count = 0
+    with _open(filepath, "wb", compression) as fh:
+        for character in characters:
+            fh.write(dumps(character_to_sparse_dict(character) if sparse else character_to_dict(character)))
+            fh.write(b"\n")
+            count += 1
+    return count
@@ -0,0 +1,378 @@
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from .brp_character import BasicRoleplayCharacter
+from .brp_derived import derived_characteristics
+from .brp_skill import BasicRoleplaySkill, SkillOverlay, generic_skill_name
+from ..utils import compile_dice, roll_d100_batch
+
+CHARACTERISTICS = ("STR", "CON", "POW", "DEX", "CHA", "INT", "SIZ", "EDU", "MOV")
+DERIVED = ("max_hit_points", "major_wound_level", "power_points", "max_power_points", "fatigue", "sanity",
+           "temp_insanity_score", "damage", "recent_san_loss")
+FLAGS = ("minor_wound", "major_wound", "fatal_wound", "temporarily_insane", "permanently_insane")
+OPTIONS = ("tough", "use_category_bonus", "use_simple_category_bonus")
+CATEGORIES = ("combat", "communication", "manipulation", "mental", "perception", "physical")
+LOCATIONS = ("left_leg", "right_leg", "abdomen", "head", "left_arm", "right_arm", "chest")
+_LOCATION_IDS = {name: i for i, name in enumerate(LOCATIONS)}
+
+
+def _skill_rows(skills):
+    """
+    Yields key, category, chance and experience check of each skill, reading untouched default skills straight from
+    the template rather than copying them onto the character
+    """
+    if isinstance(skills, SkillOverlay):
+        owned = skills.owned()
+        for key in skills:
+            if key in owned:
+                skill = owned[key]
+                yield key, skill.category, skill.chance, skill.experience_check
+            else:
+                spec = skills.template[key]
+                yield key, spec["category"], spec["chance"], spec["experience_check"]
+    else:
+        for key, skill in skills.items():
+            yield key, skill.category, skill.chance, skill.experience_check
+
+
+def _running_total(keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    The running total of values over the entries that share a key, in the order given
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys, sorted_values = keys[order], values[order]
+    totals = np.cumsum(sorted_values)
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    totals -= (totals - sorted_values)[starts][np.cumsum(starts) - 1]
+    result = np.empty_like(totals)
+    result[order] = totals
+    return result
+
+
+def _update_dict(values: dict, keys: Sequence[str], column: list):
+    # only adds keys the character did not have when the value is not zero, so custom dicts keep their shape
+    for key, value in zip(keys, column):
+        if key in values or value:
+            values[key] = value
+
+
+class CharacterPopulation:
+    """
+    Holds many characters as NumPy columns, one row per character, so that a whole crowd can be rolled at once.
+
+    Characteristics, derived characteristics, health and the options tough, use_category_bonus and
+    use_simple_category_bonus are one dimensional columns named as on BasicRoleplayCharacter, with damage_modifier and
+    armor_protection holding roll strings or ints. category_bonuses and armor_category_penalty have a column per entry
+    of categories, damage_location and max_hp_location a column per entry of LOCATIONS, and the skill columns chance,
+    skill_category, experience_check and has_skill a column per entry of skill_names.
+    """
+
+    def __init__(self,
+                 size: int = 0,
+                 skill_names: Sequence[str] = (),
+                 categories: Sequence[str] = CATEGORIES):
+        self.size = size
+        self.names = np.full(size, "", dtype=object)
+        self.skill_names = list(skill_names)
+        self.skill_ids = {name: i for i, name in enumerate(self.skill_names)}
+        # the last category column is always 0, for skills whose category is not in categories
+        self.categories = list(categories)
+        self.category_ids = {name: i for i, name in enumerate(self.categories)}
+        for name in CHARACTERISTICS + DERIVED:
+            setattr(self, name, np.zeros(size, dtype=np.int64))
+        for name in FLAGS:
+            setattr(self, name, np.zeros(size, dtype=bool))
+        for name in OPTIONS:
+            setattr(self, name, np.full(size, getattr(BasicRoleplayCharacter, name), dtype=bool))
+        self.damage_modifier = np.full(size, "0", dtype=object)
+        self.armor_protection = np.zeros(size, dtype=object)
+        self.category_bonuses = np.zeros((size, len(self.categories) + 1), dtype=np.int64)
+        self.armor_category_penalty = np.zeros((size, len(self.categories) + 1), dtype=np.int64)
+        self.damage_location = np.zeros((size, len(LOCATIONS)), dtype=np.int64)
+        self.max_hp_location = np.zeros((size, len(LOCATIONS)), dtype=np.int64)
+        self.chance = np.zeros((size, len(self.skill_names)), dtype=np.float64)
+        self.skill_category = np.full((size, len(self.skill_names)), len(self.categories), dtype=np.int16)
+        self.experience_check = np.zeros((size, len(self.skill_names)), dtype=bool)
+        self.has_skill = np.zeros((size, len(self.skill_names)), dtype=bool)
+        self.characters = None
+        self.character_options = {}  # other keyword arguments for CharacterClass when to_characters builds characters
+        self._synced_chance = self.chance.copy()
+        self._synced_experience_check = self.experience_check.copy()
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_characters(cls, characters: Iterable[BasicRoleplayCharacter]) -> "CharacterPopulation":
+        """
+        Builds a population from characters, which are kept so that to_characters can write changes back to them
+        """
+        characters = list(characters)
+        skill_rows = [list(_skill_rows(character.skills)) for character in characters]
+        skill_names, categories = {}, dict.fromkeys(CATEGORIES)
+        for character, rows in zip(characters, skill_rows):
+            categories.update(dict.fromkeys(character.category_bonuses))
+            categories.update(dict.fromkeys(character.armor_category_penalty))
+            for key, category, _, _ in rows:
+                skill_names.setdefault(key)
+                categories.setdefault(category)
+        population = cls(len(characters), list(skill_names), [name for name in categories if name])
+
+        for row, (character, rows) in enumerate(zip(characters, skill_rows)):
+            population.names[row] = character.name
+            for name in CHARACTERISTICS + DERIVED + FLAGS + OPTIONS:
+                getattr(population, name)[row] = getattr(character, name)
+            population.damage_modifier[row] = character.damage_modifier
+            population.armor_protection[row] = character.armor_protection
+            for name, value in character.category_bonuses.items():
+                population.category_bonuses[row, population.category_ids[name]] = value
+            for name, value in character.armor_category_penalty.items():
+                population.armor_category_penalty[row, population.category_ids[name]] = value
+            for i, location in enumerate(LOCATIONS):
+                population.damage_location[row, i] = character.damage_location.get(location, 0)
+                population.max_hp_location[row, i] = character.max_hp_location.get(location, 0)
+            for key, category, chance, experience_check in rows:
+                column = population.skill_ids[key]
+                population.chance[row, column] = chance
+                population.skill_category[row, column] = population.category_ids.get(category,
+                                                                                     len(population.categories))
+                population.experience_check[row, column] = experience_check
+                population.has_skill[row, column] = True
+        population.characters = characters
+        population._synced_chance = population.chance.copy()
+        population._synced_experience_check = population.experience_check.copy()
+        return population
+
+    def to_characters(self,
+                      CharacterClass: type = BasicRoleplayCharacter,
+                      SkillClass: type = BasicRoleplaySkill) -> List[BasicRoleplayCharacter]:
+        """
+        Writes the columns back to the characters the population was built from, or builds new characters of
+        CharacterClass, with character_options and skills of SkillClass, if it was not built from characters
+        :return: the list of characters, in row order
+        """
+        if self.characters is None:
+            self.characters = []
+            for row in range(self.size):
+                character = CharacterClass(name=self.names[row],
+                                           **{name: int(getattr(self, name)[row]) for name in CHARACTERISTICS},
+                                           **self.character_options)
+                character.set_skill_class(SkillClass)
+                self.characters.append(character)
+            changed = self.has_skill
+        else:
+            changed = ((self.chance != self._synced_chance)
+                       | (self.experience_check != self._synced_experience_check))
+
+        for row, character in enumerate(self.characters):
+            character.name = self.names[row]
+            for name in CHARACTERISTICS + DERIVED:
+                setattr(character, name, int(getattr(self, name)[row]))
+            for name in FLAGS + OPTIONS:
+                setattr(character, name, bool(getattr(self, name)[row]))
+            character.damage_modifier = self.damage_modifier[row]
+            character.armor_protection = self.armor_protection[row]
+            _update_dict(character.category_bonuses, self.categories, self.category_bonuses[row].tolist())
+            _update_dict(character.armor_category_penalty, self.categories, self.armor_category_penalty[row].tolist())
+            _update_dict(character.damage_location, LOCATIONS, self.damage_location[row].tolist())
+            _update_dict(character.max_hp_location, LOCATIONS, self.max_hp_location[row].tolist())
+            for column in np.flatnonzero(changed[row]):
+                key = self.skill_names[column]
+                chance = self.chance[row, column].item()
+                if key not in character.skills:
+                    category = self.skill_category[row, column]
+                    character.skills[key] = character.SkillClass(
+                        name=key,
+                        category=self.categories[category] if category < len(self.categories) else "")
+                skill = character.skills[key]
+                skill.chance = int(chance) if chance.is_integer() else chance
+                skill.experience_check = bool(self.experience_check[row, column])
+        self._synced_chance = self.chance.copy()
+        self._synced_experience_check = self.experience_check.copy()
+        return self.characters
+
+    def recalculate_derived(self, rows: np.ndarray = None, reset_pools: bool = False):
+        """
+        Recalculates the derived characteristics from the characteristic columns, as a character does after one of
+        its characteristics changes
+        :param rows: a boolean array or array of rows to recalculate, defaults to every row
+        :param reset_pools: also reset power_points, fatigue and sanity to their starting values, which are otherwise
+                            left as they are
+        """
+        rows = slice(None) if rows is None else rows
+        derived = derived_characteristics({name: getattr(self, name)[rows] for name in CHARACTERISTICS},
+                                          self.tough[rows], self.use_category_bonus[rows],
+                                          self.use_simple_category_bonus[rows])
+        pools = ("power_points", "fatigue", "sanity") if reset_pools else ()
+        for name in ("max_hit_points", "major_wound_level", "max_power_points", "temp_insanity_score",
+                     "damage_modifier") + pools:
+            getattr(self, name)[rows] = derived[name]
+        for column, location in enumerate(LOCATIONS):
+            self.max_hp_location[rows, column] = derived["max_hp_location"][location]
+        for category, bonuses in derived["category_bonuses"].items():
+            self.category_bonuses[rows, self.category_ids[category]] = bonuses
+
+    def skill_column(self, skill: str = "") -> int:
+        """
+        The column of a skill, falling back to its generic "(various)" skill as make_skill_roll does
+        """
+        if skill in self.skill_ids:
+            return self.skill_ids[skill]
+        try:
+            return self.skill_ids[generic_skill_name(skill)]
+        except KeyError:
+            raise KeyError(f"Selected skill {skill} is not a valid skill and has no generic type")
+
+    def make_skill_roll(self,
+                        skill: str = "",
+                        mask: np.ndarray = None,
+                        difficulty: int = 1,
+                        modifier: int = 0,
+                        advantage: int = 0,
+                        lucky: bool = False,
+                        generator: np.random.Generator = None) -> Dict[str, np.ndarray]:
+        """
+        Rolls a skill for every character in mask at once, following the rules of BasicRoleplaySkill.skill_roll
+        :param skill: the skill to roll
+        :param mask: a boolean array or array of rows choosing who rolls, defaults to everyone with the skill
+        :param difficulty: easy checks should double the skill, difficult or fatigued checks should half it
+        :param modifier: a situational modifier for the skill roll, adds to chance of success
+        :param advantage: as in roll_d100
+        :param lucky: allows a 1% chance of success on a skill with 0 chance
+        :param generator: a numpy generator to draw from, defaults to the generator of the roll module
+        :return: dict of arrays over every row, with the keys of skill_roll's result, "tier" holding the result as
+                 1 for a fumble up to 5 for a critical, and "rolled" marking who rolled. Rows that did not roll are
+                 0 or False throughout.
+        """
+        column = self.skill_column(skill)
+        rolled = self.has_skill[:, column].copy()
+        if mask is not None:
+            chosen = np.zeros(self.size, dtype=bool)
+            chosen[mask] = True
+            rolled &= chosen
+        rows = np.flatnonzero(rolled)
+
+        chance = self.chance[rows, column]
+        category = self.skill_category[rows, column]
+        roll = roll_d100_batch(len(rows), advantage, generator)
+        total = (roll
+                 + self.category_bonuses[rows, category]
+                 - self.armor_category_penalty[rows, category]
+                 + modifier
+                 + np.minimum(self.fatigue[rows], 0))
+        target = difficulty * chance
+        lucky_success = (chance == 0) & (roll == 1) & lucky
+        fumble = ~lucky_success & (roll >= 100 - (100 - chance) // 20)
+        success = ~lucky_success & ~fumble & (total <= target)
+        special = success & (total <= -(target // -5))
+        critical = special & (total <= -(target // -20))
+        self.experience_check[rows[success], column] = True
+
+        result = {"fumble": fumble,
+                  "failure": ~(success | lucky_success),
+                  "success": success | lucky_success,
+                  "special": special,
+                  "critical": critical,
+                  "roll": roll,
+                  "total": total,
+                  "tier": np.select([fumble, critical, special, success | lucky_success], [1, 5, 4, 3], 2)}
+        full = {}
+        for key, values in result.items():
+            full[key] = np.zeros(self.size, dtype=values.dtype)
+            full[key][rows] = values
+        full["rolled"] = rolled
+        return full
+
+    def resolve_hits(self,
+                     targets: Sequence[int],
+                     amounts: Sequence[int],
+                     locations: Sequence[str] = None,
+                     bypass_armor: bool = False,
+                     generator: np.random.Generator = None) -> Dict[str, np.ndarray]:
+        """
+        Applies a round of hits at once, following the rules of BasicRoleplayCharacter.take_damage as if each hit were
+        taken in turn. damage, damage_location and the wound flags are updated in place, and successful Luck rolls
+        set the experience check of Luck.
+        :param targets: the row hit by each hit, a row can be hit many times
+        :param amounts: the damage of each hit, before armor
+        :param locations: the entry of LOCATIONS each hit strikes, with None or an unknown location for general damage.
+                          Defaults to general damage for every hit.
+        :param bypass_armor: ignore armor_protection
+        :param generator: a numpy generator to draw from, defaults to the generator of the roll module
+        :return: dict of arrays over the hits, with the keys of take_damage's condition. The body part keys are True
+                 where the hit's location was disabled, maimed or severed, and major_wound_timer is NaN where the hit
+                 was not a major wound. "amount" holds the damage of each hit after armor.
+        """
+        targets = np.asarray(targets, dtype=np.int64)
+        amounts = np.array(amounts, dtype=np.int64)
+        if locations is None:
+            location = np.full(len(targets), -1, dtype=np.int64)
+        else:
+            location = np.array([_LOCATION_IDS.get(name, -1) for name in locations], dtype=np.int64)
+        if not bypass_armor:
+            protection = self.armor_protection[targets]
+            for value in set(protection.tolist()):
+                chosen = protection == value
+                if isinstance(value, str):
+                    amounts[chosen] -= compile_dice(value).roll_many(int(chosen.sum()), generator)
+                else:
+                    amounts[chosen] -= value
+
+        hit = amounts > 0
+        general = hit & (location < 0)
+        located = hit & (location >= 0)
+        location = np.maximum(location, 0)
+        max_hp = self.max_hit_points[targets]
+        major_wound_level = self.major_wound_level[targets]
+        max_hp_location = self.max_hp_location[targets, location]
+
+        # a hit to a location adds at most twice that location's hit points to the total damage
+        added = np.where(general, amounts, np.where(located, np.minimum(amounts, 2 * max_hp_location), 0))
+        damage = self.damage[targets] + _running_total(targets, added)
+        damage_before = damage - added
+        location_damage = (self.damage_location[targets, location]
+                           + _running_total(targets * len(LOCATIONS) + location, np.where(located, amounts, 0)))
+
+        # only the first general hit to take a character past its major wound level is a minor wound
+        crossed = general & (damage >= major_wound_level) & ~self.minor_wound[targets]
+        minor = crossed & (_running_total(targets, crossed.astype(np.int64)) == 1)
+        major = general & (amounts >= major_wound_level)
+        fatal = general & (damage >= max_hp)
+
+        # minor and major wounds each roll Luck, as skill_roll does with lucky, the minor wounds first in checks
+        checks = np.concatenate([np.flatnonzero(minor), np.flatnonzero(major)])
+        unconscious_minor = np.zeros(len(targets), dtype=bool)
+        permanent_injury = np.zeros(len(targets), dtype=bool)
+        if len(checks):
+            luck = self.skill_column("Luck")
+            chance = self.chance[targets[checks], luck]
+            roll = roll_d100_batch(len(checks), 0, generator)
+            lucky_success = (chance == 0) & (roll == 1)
+            success = ~lucky_success & (roll < 100 - (100 - chance) // 20) & (roll <= chance)
+            self.experience_check[targets[checks[success]], luck] = True
+            failed = ~(success | lucky_success)
+            split = int(minor.sum())
+            unconscious_minor[checks[:split]] = failed[:split]
+            permanent_injury[checks[split:]] = failed[split:]
+
+        disabled = located & (location_damage >= max_hp_location)
+        knocked_out = located & (location_damage >= 2 * max_hp_location)
+        maimed = located & (location_damage >= 3 * max_hp_location)
+        severed = located & (location_damage >= 4 * max_hp_location)
+
+        np.add.at(self.damage, targets, added)
+        np.add.at(self.damage_location, (targets[located], location[located]), amounts[located])
+        self.minor_wound[targets[minor]] = True
+        self.major_wound[targets[major]] = True
+        self.fatal_wound[targets[fatal]] = True
+
+        return {"unconscious": unconscious_minor | fatal | (located & (max_hp - damage_before <= 2)) | knocked_out,
+                "major_wound_timer": np.where(major, max_hp - damage, np.nan),
+                "permanent_injury": permanent_injury,
+                "disabled_body_part": disabled,
+                "maimed_body_part": maimed,
+                "severed_body_part": severed,
+                "dying": fatal | (located & (max_hp - damage_before <= 0)),
+                "amount": np.maximum(amounts, 0)}
@@ -0,0 +1,285 @@
+from functools import lru_cache
+from math import floor
+from typing import Dict, Tuple, Union
+
+from ..utils import compile_dice
+
+TIERS = ("fumble", "failure", "success", "special", "critical")
+# the multiple of a location's hit points that take_damage needs for each result of a hit there
+LOCATION_RESULTS = (("disabled", 1), ("unconscious", 2), ("maimed", 3), ("severed", 4))
+
+
+@lru_cache(maxsize=None)
+def d100_distribution(advantage: int = 0) -> Tuple[float, ...]:
+    """
+    The exact distribution of roll_d100 with the given advantage, the order statistic of abs(advantage)+1 rolls
+    :return: a tuple indexed by roll value, index 0 is always 0
+    """
+    k = abs(advantage) + 1
+    if advantage > 0:
+        return (0.0,) + tuple(((101 - x) ** k - (100 - x) ** k) / 100 ** k for x in range(1, 101))
+    return (0.0,) + tuple((x ** k - (x - 1) ** k) / 100 ** k for x in range(1, 101))
+
+
+@lru_cache(maxsize=65536)
+def tier_probabilities(fumble_at: int,
+                       success_at: int,
+                       special_at: int,
+                       critical_at: int,
+                       advantage: int = 0,
+                       lucky_one: bool = False) -> Tuple[float, ...]:
+    """
+    The memoized table behind skill_roll_probabilities, keyed on the effective chances in terms of the d100 roll.
+    Each threshold is the highest roll that still achieves that result, before fumbles are taken into account.
+    :param lucky_one: a roll of 1 is a plain success whatever the thresholds, as for a lucky roll on a 0 chance
+    :return: probabilities in the order of TIERS
+    """
+    probabilities = [0.0] * 5
+    for roll, p in enumerate(d100_distribution(advantage)[1:], start=1):
+        if lucky_one and roll == 1:
+            probabilities[2] += p
+        elif roll >= fumble_at:
+            probabilities[0] += p
+        elif roll <= success_at:
+            if roll <= critical_at:
+                probabilities[4] += p
+            elif roll <= special_at:
+                probabilities[3] += p
+            else:
+                probabilities[2] += p
+        else:
+            probabilities[1] += p
+    return tuple(probabilities)
+
+
+def _tier_key(chance,
+              category: str = "",
+              category_bonus: dict = None,
+              armor_penalty: dict = None,
+              fatigue_points: int = 0,
+              diff_multi: int = 1,
+              modifier: int = 0,
+              advantage: int = 0,
+              lucky: bool = False) -> Tuple:
+    """
+    Reduces the arguments of a skill roll to the effective thresholds that key tier_probabilities
+    """
+    if not category_bonus:
+        category_bonus = {}
+    if not armor_penalty:
+        armor_penalty = {}
+    if fatigue_points > 0:
+        fatigue_points = 0
+    offset = (category_bonus.get(category, 0)
+              - armor_penalty.get(category, 0)
+              + modifier
+              + fatigue_points)
+    target = diff_multi * chance
+    return (100 - (100 - chance) // 20,
+            floor(target - offset),
+            floor(-(target // -5) - offset),
+            floor(-(target // -20) - offset),
+            advantage,
+            chance == 0 and lucky)
+
+
+def _chance_key(chance, fumble_cap: bool = False) -> Tuple:
+    """
+    The thresholds for the resistance methods, which roll directly against a chance with no bonuses
+    """
+    fumble_at = 100 - (100 - chance) // 20
+    if fumble_cap:
+        fumble_at = min(fumble_at, 100)
+    return fumble_at, chance, -(chance // -5), -(chance // -20), 0, False
+
+
+def skill_roll_probabilities(skill,
+                             category_bonus: dict = None,
+                             armor_penalty: dict = None,
+                             fatigue_points: int = 0,
+                             diff_multi: int = 1,
+                             modifier: int = 0,
+                             advantage: int = 0,
+                             lucky: bool = False) -> Dict[str, float]:
+    """
+    The exact chance of each result of skill.skill_roll called with the same arguments, without rolling any dice.
+    The results are exclusive tiers, so "success" is a success that is neither special nor critical.
+    :param skill: a BasicRoleplaySkill
+    :return: dict of each tier in TIERS to its probability
+    """
+    probabilities = tier_probabilities(*_tier_key(skill.chance, skill.category, category_bonus, armor_penalty,
+                                                  fatigue_points, diff_multi, modifier, advantage, lucky))
+    return dict(zip(TIERS, probabilities))
+
+
+@lru_cache(maxsize=65536)
+def _highest_success_table(my_key: Tuple, their_key: Tuple, i_win_ties: bool, my_chance_wins_ties: bool) -> Tuple:
+    mine = tier_probabilities(*my_key)
+    theirs = tier_probabilities(*their_key)
+    i_won = tie = is_critical = is_fail = is_fumble = 0.0
+    for my_tier, my_p in enumerate(mine, start=1):
+        for their_tier, their_p in enumerate(theirs, start=1):
+            p = my_p * their_p
+            if not p:
+                continue
+            if my_tier > their_tier:
+                won, critical, fumble = True, my_tier == 5, my_tier == 1
+            elif their_tier > my_tier:
+                won, critical, fumble = False, their_tier == 5, their_tier == 1
+            else:
+                tie += p
+                if i_win_ties is not None:
+                    won, critical, fumble = i_win_ties, my_tier == 5, my_tier == 1
+                else:
+                    # mirrors opposed_roll_highest_success, which reports a fumble as the critical on these ties
+                    won, critical, fumble = my_chance_wins_ties, my_tier == 1, my_tier == 1
+            i_won += p * won
+            is_critical += p * critical
+            is_fail += p * (my_tier <= 2)
+            is_fumble += p * fumble
+    return i_won, tie, is_critical, is_fail, is_fumble
+
+
+@lru_cache(maxsize=65536)
+def _subtraction_table(their_key: Tuple, success_key: Tuple, fumble_key: Tuple, failure_key: Tuple) -> Tuple:
+    theirs = tier_probabilities(*their_key)
+    branches = (tier_probabilities(*fumble_key),
+                tier_probabilities(*failure_key),
+                tier_probabilities(*success_key))
+    probabilities = [0.0] * 5
+    for their_tier, their_p in enumerate(theirs, start=1):
+        branch = branches[min(their_tier, 3) - 1]
+        for i, p in enumerate(branch):
+            probabilities[i] += their_p * p
+    return tuple(probabilities)
+
+
+def predict_opposed(character,
+                    method: str = "highest_success",
+                    my_skill: str = "",
+                    opponent=0,
+                    opponent_category_bonus: Dict[str, int] = None,
+                    opponent_armor_penalty: Dict[str, int] = None,
+                    i_win_ties: bool = None) -> Dict[str, float]:
+    """
+    The exact outcome distribution of one of the character's opposed roll methods, without rolling any dice
+    :param character: the BasicRoleplayCharacter making the opposed roll
+    :param method: one of "highest_success", "subtraction", "resistance_table" or "resistance"
+    :param my_skill: The skill this character is using
+    :param opponent: A skill from an opponent's character class or a static chance
+    :param opponent_category_bonus: opponent's category bonus dict, used by highest_success and subtraction
+    :param opponent_armor_penalty: opponent's armor penalty dict, used by highest_success and subtraction
+    :param i_win_ties: as in opposed_roll_highest_success
+    :return: for highest_success, the chance of each key of its result being True plus the chance of a tie,
+             for the other methods, the exclusive tier probabilities of the resulting roll
+    """
+    skill = character._get_skill(my_skill)
+    if isinstance(opponent, int):
+        opponent_chance, opponent_category = opponent, ""
+    else:
+        opponent_chance, opponent_category = opponent.chance, opponent.category
+
+    if method == "resistance_table":
+        chance = 50 + 5 * (skill.chance // 5 - opponent_chance // 5)
+        return dict(zip(TIERS, tier_probabilities(*_chance_key(chance, fumble_cap=True))))
+    if method == "resistance":
+        return dict(zip(TIERS, tier_probabilities(*_chance_key(50 + skill.chance - opponent_chance))))
+
+    their_key = _tier_key(opponent_chance, opponent_category, opponent_category_bonus, opponent_armor_penalty)
+
+    def my_key(difficulty: int = 1, modifier: int = 0):
+        return _tier_key(skill.chance, skill.category, character.category_bonuses,
+                         character.armor_category_penalty, character.fatigue, difficulty, modifier)
+
+    if method == "highest_success":
+        table = _highest_success_table(my_key(), their_key, i_win_ties, skill.chance >= opponent_chance)
+        return dict(zip(("i_won", "tie", "is_critical", "is_fail", "is_fumble"), table))
+    if method == "subtraction":
+        if abs(skill.chance - opponent_chance) <= 5:
+            success_key = _tier_key(5, lucky=True)
+        else:
+            success_key = my_key(modifier=-1 * opponent_chance)
+        return dict(zip(TIERS, _subtraction_table(their_key, success_key, my_key(difficulty=2), my_key())))
+    raise ValueError(f"Opposed roll method {method} is not one of "
+                     f"highest_success, subtraction, resistance_table or resistance")
+
+
+@lru_cache(maxsize=4096)
+def damage_table(weapon: str = "0", damage_modifier: str = "0", armor: Union[int, str] = 0) -> Tuple:
+    """
+    The memoized exact distribution of the damage one hit deals: the weapon roll plus the damage modifier, at least 0,
+    less the armor, which may be a roll string. As in take_damage, a hit that armor brings below 1 deals nothing.
+    :return: pairs of damage and probability, in increasing order of damage
+    """
+    weapon_counts, weapon_total = compile_dice(weapon).counts()
+    modifier_counts, modifier_total = compile_dice(damage_modifier).counts()
+    if isinstance(armor, str):
+        armor_counts, armor_total = compile_dice(armor).counts()
+    else:
+        armor_counts, armor_total = {armor: 1}, 1
+    rolled = {}
+    for weapon_value, weapon_count in weapon_counts.items():
+        for modifier_value, modifier_count in modifier_counts.items():
+            value = max(0, weapon_value + modifier_value)
+            rolled[value] = rolled.get(value, 0) + weapon_count * modifier_count
+    dealt = {}
+    for value, count in rolled.items():
+        for armor_value, armor_count in armor_counts.items():
+            amount = max(0, value - armor_value)
+            dealt[amount] = dealt.get(amount, 0) + count * armor_count
+    total = weapon_total * modifier_total * armor_total
+    return tuple((amount, count / total) for amount, count in sorted(dealt.items()))
+
+
+def _at_least(table: Tuple, amount) -> float:
+    # a hit has to deal some damage to do anything
+    return sum(p for value, p in table if value >= max(amount, 1))
+
+
+def damage_distribution(attacker, defender, weapon: str = None) -> Dict:
+    """
+    The exact outcome of one hit from attacker on defender, without rolling any dice, see damage_table
+    :param attacker: the BasicRoleplayCharacter making the hit, whose damage_modifier is added
+    :param defender: the BasicRoleplayCharacter taking the hit, whose armor_protection is taken off
+    :param weapon: the roll string of the weapon's damage, defaults to the attacker's primary_weapon_damage
+    :return: dict of "pmf", the probability of each amount of damage dealt, "expected", the mean damage, "kill", the
+             chance of a general hit taking the defender to its max_hit_points, and "locations", for each location in
+             max_hp_location the chance of a hit there disabling, knocking unconscious, maiming and severing it
+    """
+    weapon = attacker.primary_weapon_damage if weapon is None else weapon
+    table = damage_table(weapon, attacker.damage_modifier, defender.armor_protection)
+    locations = {}
+    for location, hit_points in defender.max_hp_location.items():
+        taken = defender.damage_location.get(location, 0)
+        locations[location] = {result: _at_least(table, multiple * hit_points - taken)
+                               for result, multiple in LOCATION_RESULTS}
+    return {"pmf": dict(table),
+            "expected": sum(value * p for value, p in table),
+            "kill": _at_least(table, defender.max_hit_points - defender.damage),
+            "locations": locations}
+
+
+def expected_damage(attacker, defender, weapon: str = None) -> float:
+    """
+    The mean damage of one hit from attacker on defender after armor, see damage_distribution
+    """
+    weapon = attacker.primary_weapon_damage if weapon is None else weapon
+    return sum(value * p for value, p in damage_table(weapon, attacker.damage_modifier, defender.armor_protection))
+
+
+def sanity_risk(character, loss_on_success: str = "0", loss_on_fail: str = "0") -> Dict[str, float]:
+    """
+    The exact outcome of the character making sanity_roll with the same losses, without rolling any dice
+    :return: dict of the chance the roll leaves the character "temporarily_insane", with recent_san_loss at or over
+             temp_insanity_score, or "permanently_insane", with sanity at 0, and the "expected_loss" of sanity
+    """
+    succeed = min(max(character.sanity, 0), 100) / 100
+    temporary = permanent = expected = 0.0
+    for p_branch, expression in ((succeed, loss_on_success), (1 - succeed, loss_on_fail)):
+        if not p_branch:
+            continue
+        for loss, p in compile_dice(str(expression)).distribution().items():
+            temporary += p_branch * p * (character.recent_san_loss + loss >= character.temp_insanity_score)
+            permanent += p_branch * p * (character.sanity - loss <= 0)
+            expected += p_branch * p * loss
+    return {"temporarily_insane": temporary, "permanently_insane": permanent, "expected_loss": expected}
@@ -0,0 +1,220 @@
+import inspect
+import os
+import struct
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from functools import wraps
+from random import randint
+from typing import Iterable, Iterator, List, Tuple
+
+from .brp_json import dumps, loads
+from .brp_skill import build_skill
+from ..utils import roll
+
+# a roll log file is the magic and version, then records of the JSON size and number of dice, the JSON of the
+# character name, method, arguments and result, then the sides and value of each die as little endian unsigned 32 bit
+# integers
+_MAGIC = b"BRPL"
+_VERSION = 1
+_HEADER = struct.Struct("<4sI")
+_RECORD = struct.Struct("<II")
+_log = None
+_logged_methods = []  # the owner, name and plain function of each logged_roll
+
+
+@dataclass
+class RollRecord:
+    character: str = ""
+    method: str = ""
+    arguments: dict = field(default_factory=dict)
+    dice: List[Tuple[int, int]] = field(default_factory=list)  # the sides and value of each die, in the order rolled
+    result: object = None
+
+
+class _RecordingDice:
+    """
+    Passed as rng to a logged roll, rolling from the rng the caller gave, or the module's random state, and keeping
+    every die
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else roll._buffer
+        self.dice = []
+
+    def die(self, m: int) -> int:
+        value = self.rng.die(m) if self.rng is not None else randint(1, m)
+        self.dice.append((m, value))
+        return value
+
+
+class ReplayDice:
+    """
+    Passed as rng to re-run a logged roll, handing back the logged dice in order instead of rolling
+    """
+
+    def __init__(self, dice: Iterable[Tuple[int, int]] = ()):
+        self.dice = deque(dice)
+
+    def die(self, m: int) -> int:
+        if not self.dice:
+            raise ValueError(f"The roll log has no more dice, but a d{m} was rolled")
+        sides, value = self.dice.popleft()
+        if sides != m:
+            raise ValueError(f"The roll log has a d{sides} next, but a d{m} was rolled")
+        return value
+
+
+def _encode(record: RollRecord) -> bytes:
+    data = dumps([record.character, record.method, record.arguments, record.result])
+    dice = struct.pack(f"<{2 * len(record.dice)}I", *[number for die in record.dice for number in die])
+    return _RECORD.pack(len(data), len(record.dice)) + data + dice
+
+
+def _decode(data, offset: int = 0) -> Tuple[RollRecord, int]:
+    size, count = _RECORD.unpack_from(data, offset)
+    offset += _RECORD.size
+    character, method, arguments, result = loads(data[offset:offset + size])
+    offset += size
+    dice = struct.unpack_from(f"<{2 * count}I", data, offset)
+    offset += 8 * count
+    return RollRecord(character, method, arguments, list(zip(dice[::2], dice[1::2])), result), offset
+
+
+class RollLog:
+    """
+    Keeps the most recent logged rolls, already encoded, in a ring buffer of capacity records. With a filepath,
+    the ring is appended to that file whenever it fills and on flush, so the file holds every roll. Without one, the
+    oldest rolls are dropped once the ring is full.
+    """
+
+    def __init__(self, filepath: str = None, capacity: int = 4096):
+        if capacity < 1:
+            raise ValueError("A RollLog needs a capacity of at least 1")
+        self.filepath = filepath
+        self.capacity = capacity
+        self._ring = deque(maxlen=capacity)
+
+    def append(self, record: RollRecord):
+        if self.filepath is not None and len(self._ring) == self.capacity:
+            self.flush()
+        self._ring.append(_encode(record))
+
+    def flush(self):
+        """
+        Appends the records in the ring to the log file, if there is one
+        """
+        if self.filepath is None or not self._ring:
+            return
+        with open(self.filepath, "ab") as fh:
+            if fh.tell() == 0:
+                fh.write(_HEADER.pack(_MAGIC, _VERSION))
+            fh.write(b"".join(self._ring))
+        self._ring.clear()
+
+    def __iter__(self) -> Iterator[RollRecord]:
+        if self.filepath is not None and os.path.exists(self.filepath):
+            yield from read_roll_log(self.filepath)
+        for data in list(self._ring):
+            yield _decode(data)[0]
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+
+def start_roll_log(filepath: str = None, capacity: int = 4096) -> RollLog:
+    """
+    Starts recording every logged roll, see RollLog. Replaces any log already running, after flushing it.
+    :return: the active log
+    """
+    global _log
+    stop_roll_log()
+    _log = RollLog(filepath, capacity)
+    for owner, name, method in _logged_methods:
+        setattr(owner, name, _recording(method))
+    return _log
+
+
+def stop_roll_log():
+    """
+    Stops recording rolls and flushes the log to its file
+    """
+    global _log
+    for owner, name, method in _logged_methods:
+        setattr(owner, name, method)
+    if _log is not None:
+        _log.flush()
+    _log = None
+
+
+def read_roll_log(filepath: str) -> Iterator[RollRecord]:
+    """
+    Reads back the records of a roll log file, in the order they were rolled
+    """
+    with open(filepath, "rb") as fh:
+        data = fh.read()
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError(f"{filepath} is not a roll log")
+    if version != _VERSION:
+        raise ValueError(f"{filepath} is roll log version {version}, only version {_VERSION} is supported")
+    offset = _HEADER.size
+    while offset < len(data):
+        record, offset = _decode(data, offset)
+        yield record
+
+
+class logged_roll:
+    """
+    Marks a character's roll method to be recorded while a RollLog is running: its arguments, every die it rolls and
+    its result. start_roll_log swaps a recording wrapper in for each marked method and stop_roll_log swaps the plain
+    method back, so while no log is running the methods cost nothing extra.
+    """
+
+    def __init__(self, method):
+        self.method = method
+
+    def __set_name__(self, owner, name):
+        _logged_methods.append((owner, name, self.method))
+        setattr(owner, name, _recording(self.method) if _log is not None else self.method)
+
+
+def _recording(method):
+    signature = inspect.signature(method)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        rng = bound.arguments.get("rng")
+        # rolls made inside another logged roll, and replayed rolls, are not recorded again
+        if _log is None or isinstance(rng, (_RecordingDice, ReplayDice)):
+            return method(self, *args, **kwargs)
+        arguments = {name: value for name, value in bound.arguments.items() if name not in ("self", "rng")}
+        bound.arguments["rng"] = dice = _RecordingDice(rng)
+        result = method(*bound.args, **bound.kwargs)
+        _log.append(RollRecord(getattr(self, "name", ""), method.__name__, arguments, dice.dice, result))
+        return result
+    return wrapper
+
+
+def replay_rolls(character, records: Iterable[RollRecord]) -> list:
+    """
+    Re-runs the logged rolls of a character, by name, using the logged dice rather than an RNG. The character should
+    start as it was when the rolls were logged, and ends as it was after them. An opponent's skill is rebuilt from the
+    log, so changes a roll made to it, like an experience check, are not replayed onto the opponent.
+    :param records: a RollLog, the result of read_roll_log, or any other records
+    :return: the result of each replayed roll
+    """
+    results = []
+    for record in records:
+        if record.character != character.name:
+            continue
+        arguments = dict(record.arguments)
+        if isinstance(arguments.get("opponent"), Mapping):
+            arguments["opponent"] = build_skill(character.SkillClass, arguments["opponent"])
+        dice = ReplayDice(record.dice)
+        result = getattr(character, record.method)(**arguments, rng=dice)
+        if dice.dice or loads(dumps(result)) != record.result:
+            raise ValueError(f"Replaying {record.method} for {record.character} did not match the roll log")
+        results.append(result)
+    return results
@@ -0,0 +1,172 @@
+import mmap
+import struct
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+from .brp_character import BasicRoleplayCharacter
+from .brp_json import character_from_dict, character_to_dict, character_to_sparse_dict, dumps, loads
+from .brp_skill import BasicRoleplaySkill
+
+# a roster file is a header, the JSON of each character one after another, then a JSON index of
+# name -> [offset, size] that the header points to
+_MAGIC = b"BRPR"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQ")
+
+
+class Roster(MutableMapping):
+    """
+    Many characters in one file, found by name through an offset index. Characters are only decoded when they are
+    looked up, reading through a memory map, so opening a large roster to use a few characters is cheap.
+
+    Assigning a character to a name saves it: in place if its JSON fits in the space of the character it replaces,
+    otherwise at the end of the file. The replaced space is only reclaimed by writing a new roster with save_roster.
+    Each lookup builds a new character, so changes to it are only kept once it is assigned back.
+    """
+
+    def __init__(self,
+                 filepath: str,
+                 CharacterClass: dataclass = BasicRoleplayCharacter,
+                 SkillClass: dataclass = BasicRoleplaySkill,
+                 sparse: bool = False,
+                 writable: bool = False):
+        if not issubclass(CharacterClass, BasicRoleplayCharacter):
+            raise TypeError("On load a CharacterClass should be a subclass of BasicRoleplayCharacter")
+        self.filepath = filepath
+        self.CharacterClass = CharacterClass
+        self.SkillClass = SkillClass
+        self.sparse = sparse
+        self.writable = writable
+        self._fh = open(filepath, "r+b" if writable else "rb")
+        self._map = None
+        self._open_map()
+        magic, version, self._index_offset = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{filepath} is not a roster file")
+        if version != _VERSION:
+            self.close()
+            raise ValueError(f"{filepath} is roster version {version}, only version {_VERSION} is supported")
+        self._index: Dict[str, List[int]] = loads(self._map[self._index_offset:])
+
+    def _open_map(self):
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fh.close()
+
+    def __getitem__(self, name: str) -> BasicRoleplayCharacter:
+        offset, size = self._index[name]
+        return character_from_dict(loads(self._map[offset:offset + size]), self.CharacterClass, self.SkillClass)
+
+    def __setitem__(self, name: str, character: BasicRoleplayCharacter):
+        self._write({name: character})
+
+    def __delitem__(self, name: str):
+        self._check_writable()
+        del self._index[name]
+        self._write({}, index_changed=True)
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def append(self, character: BasicRoleplayCharacter):
+        """
+        Saves a character under its name, replacing any character of the same name
+        """
+        self[character.name] = character
+
+    def extend(self, characters: Iterable[BasicRoleplayCharacter]):
+        """
+        Saves many characters under their names, writing the index once
+        """
+        self._write({character.name: character for character in characters})
+
+    def _encode(self, character: BasicRoleplayCharacter) -> bytes:
+        return dumps(character_to_sparse_dict(character) if self.sparse else character_to_dict(character))
+
+    def _check_writable(self):
+        if not self.writable:
+            raise PermissionError(f"{self.filepath} was opened read only, pass writable=True to change it")
+
+    def _write(self, characters: Dict[str, BasicRoleplayCharacter], index_changed: bool = False):
+        self._check_writable()
+        # the map is closed while writing so the file can grow, and on Windows so it can be written at all
+        self._map.close()
+        self._map = None
+        try:
+            appended = {}
+            for name, character in characters.items():
+                data = self._encode(character)
+                if name in self._index and len(data) <= self._index[name][1]:
+                    offset, size = self._index[name]
+                    self._fh.seek(offset)
+                    # JSON allows trailing whitespace, so the rest of the old space is padded out
+                    self._fh.write(data.ljust(size))
+                else:
+                    appended[name] = data
+            if appended or index_changed:
+                # new data goes after the current index, and the header is pointed at the new index last, so a
+                # failed write leaves the roster as it was
+                self._fh.seek(0, 2)
+                offset = self._fh.tell()
+                for name, data in appended.items():
+                    self._fh.write(data)
+                    self._index[name] = [offset, len(data)]
+                    offset += len(data)
+                self._fh.write(dumps(self._index))
+                self._fh.flush()
+                self._fh.seek(0)
+                self._fh.write(_HEADER.pack(_MAGIC, _VERSION, offset))
+                self._index_offset = offset
+            self._fh.flush()
+        finally:
+            self._open_map()
+
+
+def save_roster(characters: Iterable[BasicRoleplayCharacter], filepath: str, sparse: bool = False):
+    """
+    Saves many characters to one roster file, indexed by name
+    :param sparse: save each character as save_character_to_json does with sparse=True
+    """
+    records, index, offset = [], {}, _HEADER.size
+    for character in characters:
+        if character.name in index:
+            raise ValueError(f"A roster can only hold one character named {character.name}")
+        data = dumps(character_to_sparse_dict(character) if sparse else character_to_dict(character))
+        records.append(data)
+        index[character.name] = [offset, len(data)]
+        offset += len(data)
+    with open(filepath, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, _VERSION, offset))
+        fh.writelines(records)
+        fh.write(dumps(index))
+
+
+def load_roster(filepath: str,
+                names: Iterable[str] = None,
+                CharacterClass: dataclass = BasicRoleplayCharacter,
+                SkillClass: dataclass = BasicRoleplaySkill) -> Dict[str, BasicRoleplayCharacter]:
+    """
+    Loads characters from a roster file. Only the named characters are read and decoded.
+    :param names: the names of the characters to load, defaults to every character in the roster
+    :return: dict of name to character, in the order of names
+    """
+    with Roster(filepath, CharacterClass, SkillClass) as roster:
+        return {name: roster[name] for name in (roster if names is None else names)}
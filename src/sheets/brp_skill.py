@@ -1,8 +1,11 @@
-from typing import Dict
-from dataclasses import dataclass
+from collections.abc import ItemsView, KeysView, Mapping, ValuesView
+from typing import Dict, Tuple
+from dataclasses import dataclass, fields, MISSING
+from functools import lru_cache
 from dataclasses_json import dataclass_json, Undefined
 
-from ..utils import roll_d100, roll_ndm
+from .brp_probability import skill_roll_probabilities
+from ..utils import DiceBuffer, roll_d100, roll_ndm
 
 
 @dataclass_json(undefined=Undefined.EXCLUDE)
@@ -14,17 +17,18 @@ class BasicRoleplaySkill:
     experience_check: bool = False
     can_be_improved_through_experience: bool = True  # only false for Blasphemous Knowledge
 
-    def experience_roll(self, int_characteristic: int = 10, improvement_dice: int = 6):
+    def experience_roll(self, int_characteristic: int = 10, improvement_dice: int = 6, rng: DiceBuffer = None):
         """
         Rolls an experience check for this skill.
         :param int_characteristic: bonus for character's learning based on their int
         :param improvement_dice: the size of the improvement die to roll, generally 6
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return: None, acts on self
         """
         if self.experience_check:
-            improve_check = roll_d100() + -(int_characteristic//-2)
+            improve_check = roll_d100(rng=rng) + -(int_characteristic//-2)
             if improve_check >= min(self.chance, 100):
-                self.improve(roll_ndm(1, improvement_dice))
+                self.improve(roll_ndm(1, improvement_dice, rng))
             self.experience_check = False
 
     def improve(self, amount: int):
@@ -37,7 +41,8 @@ class BasicRoleplaySkill:
                    diff_multi: int = 1,
                    modifier: int = 0,
                    advantage: int = 0,
-                   lucky: bool = False) -> Dict:
+                   lucky: bool = False,
+                   rng: DiceBuffer = None) -> Dict:
         """
         This rolls the skill and reports a dict of the levels of success
         :param category_bonus: bonus from the calling character's characteristics
@@ -48,6 +53,7 @@ class BasicRoleplaySkill:
         :param advantage: positive values indicate additional rolls to take lowest,
                           negative values indicate additional rolls to take highest
         :param lucky: allows a 1% chance of success on a skill with 0 chance
+        :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
         :return: dict of possible success states
         """
 
@@ -57,7 +63,7 @@ class BasicRoleplaySkill:
             armor_penalty = {}
         if fatigue_points > 0:
             fatigue_points = 0
-        roll = roll_d100(advantage)
+        roll = roll_d100(advantage, rng)
         total = (roll
                  + category_bonus.get(self.category, 0)
                  - armor_penalty.get(self.category, 0)
@@ -85,3 +91,204 @@ class BasicRoleplaySkill:
                 if total <= -((diff_multi * self.chance)//-20):
                     result["critical"] = True
         return result
+
+    def skill_roll_probabilities(self,
+                                 category_bonus: dict = None,
+                                 armor_penalty: dict = None,
+                                 fatigue_points: int = 0,
+                                 diff_multi: int = 1,
+                                 modifier: int = 0,
+                                 advantage: int = 0,
+                                 lucky: bool = False) -> Dict[str, float]:
+        """
+        The exact chance of each result of skill_roll with the same arguments, see brp_probability
+        :return: dict of fumble, failure, success, special and critical to their exclusive probabilities
+        """
+        return skill_roll_probabilities(self, category_bonus, armor_penalty, fatigue_points, diff_multi, modifier,
+                                        advantage, lucky)
+
+
+@lru_cache(maxsize=None)
+def _init_fields(SkillClass: type) -> Tuple[Tuple[str, object, bool], ...]:
+    return tuple((skill_field.name,
+                  skill_field.default_factory if skill_field.default_factory is not MISSING else skill_field.default,
+                  skill_field.default_factory is not MISSING)
+                 for skill_field in fields(SkillClass) if skill_field.init)
+
+
+def build_skill(SkillClass: type, values: Mapping) -> BasicRoleplaySkill:
+    """
+    Equivalent to SkillClass(**values), ignoring unknown keys as dataclass_json's Undefined.EXCLUDE does, but without
+    the cost of the signature binding that dataclass_json wraps around __init__. Used when loading many skills.
+    """
+    skill = object.__new__(SkillClass)
+    attributes = skill.__dict__
+    for name, default, is_factory in _init_fields(SkillClass):
+        if name in values:
+            attributes[name] = values[name]
+        elif is_factory:
+            attributes[name] = default()
+        elif default is MISSING:
+            raise TypeError(f"{SkillClass.__name__} missing required argument: '{name}'")
+        else:
+            attributes[name] = default
+    if hasattr(skill, "__post_init__"):
+        skill.__post_init__()
+    return skill
+
+
+class SkillOverlay(dict):
+    """
+    A character's skills laid over a shared, read only template of default skills. Only the skills a character was
+    given, or has since used, are stored on the character. A default skill is copied out of the template the first
+    time it is looked up, so rolls and improvements never reach the template or any other character sharing it.
+
+    Iterating, keys, len and in all include the template, while items and values copy out every default skill.
+    """
+
+    def __init__(self, skills=(), template: Mapping = None, SkillClass: type = BasicRoleplaySkill):
+        super().__init__(skills)
+        self.template = template if template is not None else {}
+        self.SkillClass = SkillClass
+
+    def __missing__(self, key):
+        if key not in self.template:
+            raise KeyError(key)
+        skill = build_skill(self.SkillClass, self.template[key])
+        dict.__setitem__(self, key, skill)
+        return skill
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.template
+
+    def __iter__(self):
+        yield from self.template
+        for key in dict.__iter__(self):
+            if key not in self.template:
+                yield key
+
+    def __len__(self):
+        return len(self.template) + sum(1 for key in dict.__iter__(self) if key not in self.template)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.peek_items()) == dict(other.items())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.peek_items())!r})"
+
+    def __reduce__(self):
+        return type(self), (dict(self.owned()), {key: dict(spec) for key, spec in self.template.items()},
+                            self.SkillClass)
+
+    def peek_items(self):
+        """
+        Like items, but default skills still in the template are returned as fresh copies rather than stored
+        """
+        for key in self:
+            if dict.__contains__(self, key):
+                yield key, dict.__getitem__(self, key)
+            else:
+                yield key, build_skill(self.SkillClass, self.template[key])
+
+    def owned(self) -> Dict[str, BasicRoleplaySkill]:
+        """
+        The skills stored on this character, which are the only ones that can differ from the template
+        """
+        return dict(dict.items(self))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def copy(self):
+        return type(self)(self.owned(), self.template, self.SkillClass)
+
+
+def generic_skill_name(skill: str = "") -> str:
+    """
+    The generic skill a specialized skill falls back to, "Firearm (Rifle)" or "Firearm Rifle" to "Firearm (various)"
+    """
+    if skill.endswith(")") and " (" in skill:
+        return skill[:skill.rindex(" (")] + " (various)"
+    return " ".join(skill.split(" ")[0:-1] + ["(various)"])
+
+
+class SkillIndex:
+    """
+    Resolves skill names to the keys of a character's skills. A name that is a key is used as is, otherwise it is
+    looked up in aliases, then falls back to its generic "(various)" skill, see generic_skill_name. Each name is only
+    resolved once, so repeated lookups of a specialized name skip rebuilding and retrying its generic name.
+
+    Skills added through add keep the index up to date. A skill added straight to the skills is still found by its
+    exact key, but names already resolved through an alias keep their old resolution until refresh is called.
+    """
+
+    def __init__(self, skills: Mapping, aliases: Mapping[str, str] = None):
+        self.skills = skills
+        self.aliases = dict(aliases) if aliases else {}
+        self._resolved: Dict[str, str] = {}
+
+    def refresh(self):
+        """
+        Forgets every resolved name
+        """
+        self._resolved.clear()
+
+    def add(self, key: str, skill: BasicRoleplaySkill):
+        """
+        Adds a skill to the skills under key
+        """
+        self.skills[key] = skill
+        # names are checked against the keys before their resolution is used, so only a new generic skill or alias
+        # target changes what names resolve to
+        if key.endswith("(various)") or key in self.aliases.values():
+            self._resolved.clear()
+
+    def resolve(self, skill: str = "") -> str:
+        """
+        The key of the skill a name refers to
+        """
+        if skill in self.skills:
+            return skill
+        return self._fallback(skill)
+
+    def _fallback(self, skill: str) -> str:
+        # the key for a name that is not itself a key
+        key = self._resolved.get(skill)
+        if key is None:
+            target = self.aliases.get(skill, skill)
+            for key in (target, generic_skill_name(target)):
+                if key in self.skills:
+                    break
+            else:
+                raise KeyError(f"Selected skill {skill} is not a valid skill and has no generic type")
+            self._resolved[skill] = key
+        return key
+
+    def skill(self, skill: str = "") -> BasicRoleplaySkill:
+        """
+        The skill a name refers to, which can be kept to roll many times
+        """
+        return self.skills[self.resolve(skill)]
@@ -0,0 +1,221 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from dataclasses import fields, MISSING
+from typing import Dict, Iterable, Tuple
+
+from .brp_skill import BasicRoleplaySkill
+
+# skill keys, names and categories are interned once per process and stored in tables by their ID
+_string_ids: Dict[str, int] = {}
+_strings: list = []
+_key_ids: Dict[str, int] = {}
+_keys: list = []
+
+_PRESENT = 1
+_EXPERIENCE_CHECK = 2
+_CAN_BE_IMPROVED = 4
+_CORE_FIELDS = ("name", "category", "chance", "experience_check", "can_be_improved_through_experience")
+_view_classes: dict = {}
+
+
+def _intern(value: str, ids: Dict[str, int], values: list) -> int:
+    value_id = ids.get(value)
+    if value_id is None:
+        value_id = ids.setdefault(value, len(values))
+        if value_id == len(values):
+            values.append(value)
+    return value_id
+
+
+def _field_default(skill_field):
+    if skill_field.default_factory is not MISSING:
+        return skill_field.default_factory()
+    return None if skill_field.default is MISSING else skill_field.default
+
+
+def skill_id(key: str) -> int:
+    """
+    The process wide ID of a skill key, which each SkillTable maps to a row of its own
+    """
+    return _intern(key, _key_ids, _keys)
+
+
+def _chance_getter(view):
+    chance = view._table._chance[view._id]
+    return int(chance) if chance.is_integer() else chance
+
+
+def _chance_setter(view, value):
+    view._table._chance[view._id] = value
+
+
+def _flag_property(flag: int) -> property:
+    def getter(view):
+        return bool(view._table._flags[view._id] & flag)
+
+    def setter(view, value):
+        if value:
+            view._table._flags[view._id] |= flag
+        else:
+            view._table._flags[view._id] &= ~flag
+    return property(getter, setter)
+
+
+def _string_property(column: str) -> property:
+    def getter(view):
+        return _strings[getattr(view._table, column)[view._id]]
+
+    def setter(view, value):
+        getattr(view._table, column)[view._id] = _intern(value, _string_ids, _strings)
+    return property(getter, setter)
+
+
+def _extra_property(name: str) -> property:
+    def getter(view):
+        return view._table._extra[name][view._id]
+
+    def setter(view, value):
+        view._table._extra[name][view._id] = value
+    return property(getter, setter)
+
+
+def _view_init(self, table, row: int):
+    object.__setattr__(self, "_table", table)
+    object.__setattr__(self, "_id", row)
+
+
+def skill_view_class(SkillClass: type = BasicRoleplaySkill) -> type:
+    """
+    A subclass of SkillClass whose fields are read from and written to a row of a SkillTable. Methods such as
+    skill_roll, experience_roll or a subclass's own rolls work unchanged on these views.
+    """
+    if SkillClass not in _view_classes:
+        namespace = {"__slots__": ("_table", "_id"),
+                     "__init__": _view_init,
+                     "name": _string_property("_name"),
+                     "category": _string_property("_category"),
+                     "chance": property(_chance_getter, _chance_setter),
+                     "experience_check": _flag_property(_EXPERIENCE_CHECK),
+                     "can_be_improved_through_experience": _flag_property(_CAN_BE_IMPROVED)}
+        for skill_field in fields(SkillClass):
+            if skill_field.name not in _CORE_FIELDS:
+                namespace[skill_field.name] = _extra_property(skill_field.name)
+        _view_classes[SkillClass] = type(f"{SkillClass.__name__}View", (SkillClass,), namespace)
+    return _view_classes[SkillClass]
+
+
+class SkillTable(MutableMapping):
+    """
+    A compact alternative to a dict of skills. Each skill is a row in parallel arrays, rather than a dataclass instance
+    with its own __dict__. Rows are found by the skill's interned ID in a sorted array of the IDs this table holds, so a
+    table is sized by its own skills however many distinct skill keys the process has seen. Looking up a skill returns a
+    view object, an instance of a subclass of SkillClass, that reads and writes its row, so it can be rolled like any
+    other skill.
+
+    Fields added by a SkillClass subclass, like RavenSkill.guilt, are kept in plain lists alongside the arrays.
+    """
+
+    def __init__(self, skills: Iterable = (), SkillClass: type = BasicRoleplaySkill):
+        self.SkillClass = SkillClass
+        self._view = skill_view_class(SkillClass)
+        self._name = array("i")
+        self._category = array("i")
+        self._chance = array("d")
+        self._flags = bytearray()
+        self._order = array("i")  # the skill IDs of the skills held, in the order they were added
+        self._ids = array("i")  # the skill IDs of the rows, sorted, alongside the row of each
+        self._id_rows = array("i")
+        self._extra_fields = [skill_field for skill_field in fields(SkillClass)
+                              if skill_field.name not in _CORE_FIELDS]
+        self._extra = {skill_field.name: [] for skill_field in self._extra_fields}
+        if isinstance(skills, Mapping):
+            skills = skills.items()
+        for key, skill in skills:
+            self[key] = skill
+
+    def _find(self, key: str) -> int:
+        """
+        The row holding key, present or deleted, or -1 if this table has never held it
+        """
+        key_id = _key_ids.get(key)
+        if key_id is None:
+            return -1
+        position = bisect_left(self._ids, key_id)
+        if position < len(self._ids) and self._ids[position] == key_id:
+            return self._id_rows[position]
+        return -1
+
+    def _add_row(self, key: str) -> int:
+        key_id = skill_id(key)
+        row = len(self._flags)
+        self._name.append(0)
+        self._category.append(0)
+        self._chance.append(0.0)
+        self._flags.append(0)
+        for skill_field in self._extra_fields:
+            self._extra[skill_field.name].append(_field_default(skill_field))
+        position = bisect_left(self._ids, key_id)
+        self._ids.insert(position, key_id)
+        self._id_rows.insert(position, row)
+        return row
+
+    def _row(self, key: str) -> int:
+        row = self._find(key)
+        if row < 0 or not self._flags[row] & _PRESENT:
+            raise KeyError(key)
+        return row
+
+    def __getitem__(self, key: str) -> BasicRoleplaySkill:
+        return self._view(self, self._row(key))
+
+    def __setitem__(self, key: str, skill):
+        row = self._find(key)
+        if row < 0:
+            row = self._add_row(key)
+        if not self._flags[row] & _PRESENT:
+            self._order.append(_key_ids[key])
+        get = skill.get if isinstance(skill, Mapping) else lambda name, default: getattr(skill, name, default)
+        self._name[row] = _intern(get("name", ""), _string_ids, _strings)
+        self._category[row] = _intern(get("category", ""), _string_ids, _strings)
+        self._chance[row] = get("chance", 0)
+        self._flags[row] = (_PRESENT
+                            | (_EXPERIENCE_CHECK if get("experience_check", False) else 0)
+                            | (_CAN_BE_IMPROVED if get("can_be_improved_through_experience", True) else 0))
+        for skill_field in self._extra_fields:
+            self._extra[skill_field.name][row] = get(skill_field.name, _field_default(skill_field))
+
+    def __delitem__(self, key: str):
+        row = self._row(key)
+        self._flags[row] = 0
+        self._order.remove(_key_ids[key])
+
+    def __contains__(self, key) -> bool:
+        row = self._find(key)
+        return row >= 0 and bool(self._flags[row] & _PRESENT)
+
+    def __iter__(self):
+        return (_keys[key_id] for key_id in self._order)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def __reduce__(self):
+        # skill IDs are only meaningful within one process, so pickle by key
+        return type(self), (self.to_dicts(), self.SkillClass)
+
+    def checked(self) -> Iterable[Tuple[str, BasicRoleplaySkill]]:
+        """
+        The skills with an experience check set, found without building a view for every skill
+        """
+        for key_id in self._order:
+            row = self._id_rows[bisect_left(self._ids, key_id)]
+            if self._flags[row] & _EXPERIENCE_CHECK:
+                yield _keys[key_id], self._view(self, row)
+
+    def to_dicts(self) -> Dict[str, dict]:
+        return {key: {skill_field.name: getattr(skill, skill_field.name) for skill_field in fields(skill)}
+                for key, skill in self.items()}
@@ -0,0 +1,156 @@
+import mmap
+import struct
+from dataclasses import dataclass, fields
+from typing import Iterable, List, Union
+
+import numpy as np
+
+from .brp_character import BasicRoleplayCharacter, load_character_from_json
+from .brp_json import dumps, loads, skills_to_dict
+from .brp_jsonl import iter_characters_jsonl
+from .brp_skill import BasicRoleplaySkill, SkillOverlay, build_skill
+from .brp_skill_table import SkillTable
+
+# a snapshot file is the magic and header length, a JSON header, the int and bool attributes of every character as
+# a NumPy structured array, then a JSON list of each character's remaining attributes
+SNAPSHOT_VERSION = 1
+_MAGIC = b"BRPS"
+_PREFIX = struct.Struct("<4sI")
+_ALIGN = 8
+
+
+def _class_name(cls: type) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _schema(CharacterClass: type, SkillClass: type) -> dict:
+    return {"version": SNAPSHOT_VERSION,
+            "character_class": _class_name(CharacterClass),
+            "character_fields": [character_field.name for character_field in fields(CharacterClass)],
+            "skill_class": _class_name(SkillClass),
+            "skill_fields": [skill_field.name for skill_field in fields(SkillClass)]}
+
+
+def _dump_skills(character: BasicRoleplayCharacter) -> list:
+    skills = character.skills
+    if isinstance(skills, SkillTable):
+        return ["table", skills.to_dicts()]
+    if isinstance(skills, SkillOverlay) and skills.template == character._skill_template():
+        # the template is rebuilt from the cached defaults on load, so only skills that differ from it are kept
+        defaults = skills_to_dict(SkillOverlay((), skills.template, skills.SkillClass))
+        return ["overlay", {key: skill for key, skill in skills_to_dict(skills.owned()).items()
+                            if defaults.get(key) != skill}]
+    return ["dict", skills_to_dict(skills)]
+
+
+def _restore_skill(SkillClass: type, state: dict) -> BasicRoleplaySkill:
+    # like build_skill, but a saved skill already holds every field so its state is used as is
+    skill = object.__new__(SkillClass)
+    skill.__dict__.update(state)
+    if hasattr(skill, "__post_init__"):
+        skill.__post_init__()
+    return skill
+
+
+def _load_skills(character: BasicRoleplayCharacter, kind: str, skills: dict):
+    SkillClass = character.SkillClass
+    if kind == "table":
+        return SkillTable(skills, SkillClass)
+    skills = {key: _restore_skill(SkillClass, skill) for key, skill in skills.items()}
+    if kind == "overlay":
+        return SkillOverlay(skills, character._skill_template(), SkillClass)
+    return skills
+
+
+def save_snapshot(characters: Iterable[BasicRoleplayCharacter], filepath: str):
+    """
+    Saves the full state of many characters of one class, including derived characteristics, so that load_snapshot
+    can restore them without running __post_init__ or set_skill_class again
+    """
+    characters = list(characters)
+    CharacterClass = type(characters[0]) if characters else BasicRoleplayCharacter
+    SkillClass = getattr(characters[0], "SkillClass", BasicRoleplaySkill) if characters else BasicRoleplaySkill
+    for character in characters:
+        if type(character) is not CharacterClass or character.SkillClass is not SkillClass:
+            raise TypeError("A snapshot should only hold characters of one CharacterClass and SkillClass")
+
+    states = [dict(vars(character)) for character in characters]
+    # attributes that are a plain int or bool on every character go in the structured array
+    columns = []
+    for name, value in (states[0].items() if states else ()):
+        for kind in (bool, int):
+            if all(type(state.get(name)) is kind for state in states):
+                columns.append((name, "?" if kind is bool else "<i8"))
+                break
+    dtype = np.dtype(columns)
+    table = np.array([tuple(state.pop(name) for name, _ in columns) for state in states], dtype=dtype)
+
+    rest = []
+    for character, state in zip(characters, states):
+        state.pop("SkillClass", None)
+        state.pop("_skill_index", None)
+        state["skills"] = _dump_skills(character)
+        state["new_skill_defaults"] = skills_to_dict(state["new_skill_defaults"])
+        rest.append(state)
+
+    header = dumps({**_schema(CharacterClass, SkillClass), "count": len(characters), "columns": columns})
+    array_offset = -(-(_PREFIX.size + len(header)) // _ALIGN) * _ALIGN
+    with open(filepath, "wb") as fh:
+        fh.write(_PREFIX.pack(_MAGIC, len(header)))
+        fh.write(header.ljust(array_offset - _PREFIX.size))
+        fh.write(table.tobytes())
+        fh.write(dumps(rest))
+
+
+def _read_snapshot(filepath: str, CharacterClass: type, SkillClass: type) -> List[BasicRoleplayCharacter]:
+    with open(filepath, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        magic, header_size = _PREFIX.unpack_from(mapped, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{filepath} is not a snapshot file")
+        header = loads(mapped[_PREFIX.size:_PREFIX.size + header_size])
+        schema = _schema(CharacterClass, SkillClass)
+        if {key: header.get(key) for key in schema} != schema:
+            raise ValueError(f"{filepath} was saved by snapshot version {header.get('version')} for "
+                             f"{header.get('character_class')}, which does not match {_class_name(CharacterClass)}")
+        dtype = np.dtype([tuple(column) for column in header["columns"]])
+        array_offset = -(-(_PREFIX.size + header_size) // _ALIGN) * _ALIGN
+        table = np.frombuffer(mapped, dtype=dtype, count=header["count"], offset=array_offset)
+        rows = table.tolist()
+        rest = loads(mapped[array_offset + table.nbytes:])
+        # the array shares the map's memory, so it has to go before the map is closed
+        del table
+
+    names = dtype.names
+    characters = []
+    for row, state in zip(rows, rest):
+        character = object.__new__(CharacterClass)
+        character.__dict__.update(zip(names, row))
+        character.__dict__.update(state)
+        character.SkillClass = SkillClass
+        character.new_skill_defaults = {key: build_skill(SkillClass, skill)
+                                        for key, skill in character.new_skill_defaults.items()}
+        character.skills = _load_skills(character, *character.skills)
+        characters.append(character)
+    return characters
+
+
+def load_snapshot(filepath: str,
+                  CharacterClass: dataclass = BasicRoleplayCharacter,
+                  SkillClass: dataclass = BasicRoleplaySkill,
+                  fallback: Union[str, Iterable[str]] = None) -> List[BasicRoleplayCharacter]:
+    """
+    Loads characters saved by save_snapshot, restoring derived characteristics as saved rather than recalculating them
+    :param fallback: a JSON Lines file, or a list of character JSON files, to load instead if the snapshot is missing,
+                     from another snapshot version, or for another CharacterClass or SkillClass
+    :return: the list of characters, in the order they were saved
+    """
+    if not issubclass(CharacterClass, BasicRoleplayCharacter):
+        raise TypeError("On load a CharacterClass should be a subclass of BasicRoleplayCharacter")
+    try:
+        return _read_snapshot(filepath, CharacterClass, SkillClass)
+    except (OSError, ValueError, struct.error):
+        if fallback is None:
+            raise
+    if isinstance(fallback, str):
+        return list(iter_characters_jsonl(fallback, CharacterClass, SkillClass))
+    return [load_character_from_json(path, CharacterClass, SkillClass) for path in fallback]
@@ -1 +1,4 @@
 from .roll import roll_ndm, roll_d100, roll_str
+from .roll import roll_d100_batch, roll_ndm_batch, roll_str_batch, DiceExpression, compile_dice
+from .roll import DiceBuffer, use_batch_buffer, stop_batch_buffer, seed_generator, get_generator
+from .roll import roll_stream
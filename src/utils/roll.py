@@ -1,38 +1,355 @@
+import re
+from functools import lru_cache
+from math import comb
 from random import randint
+from typing import Dict, List
 
+import numpy as np
 
-def roll_d100(advantage: int = 0) -> int:
+_generator: np.random.Generator = np.random.default_rng()
+_buffer = None
+
+
+def seed_generator(seed: int = None) -> np.random.Generator:
+    """
+    Replaces the module generator used by the batch rolls with a freshly seeded one
+    :param seed: anything accepted by numpy.random.default_rng, None draws fresh entropy
+    :return: the new generator
+    """
+    global _generator
+    _generator = np.random.default_rng(seed)
+    if _buffer is not None:
+        _buffer.generator = _generator
+        _buffer.clear()
+    return _generator
+
+
+def get_generator() -> np.random.Generator:
+    return _generator
+
+
+class DiceBuffer:
+    """
+    Holds pre-rolled batches of dice per die size and hands them out one at a time. When a batch runs out it is
+    refilled with a single call to the generator, so scalar rolls cost a list index rather than a call to randint.
+    """
+
+    def __init__(self, generator: np.random.Generator = None, size: int = 4096):
+        if size < 1:
+            raise ValueError("A DiceBuffer needs a size of at least 1")
+        self.generator = generator if generator is not None else _generator
+        self.size = size
+        self._rolls = {}
+        self._positions = {}
+
+    def clear(self):
+        self._rolls = {}
+        self._positions = {}
+
+    def spawn(self, n: int = 1) -> List["DiceBuffer"]:
+        """
+        Makes n new buffers whose generators are spawned from this one's, as numpy.random.SeedSequence.spawn does.
+        Their rolls are independent of this buffer's and of each other's, and are the same every run for a seeded
+        buffer, so they can be handed to parallel workers or to each character in an encounter.
+        """
+        return [DiceBuffer(generator, self.size) for generator in self.generator.spawn(n)]
+
+    def refill(self, m: int):
+        self._rolls[m] = self.generator.integers(1, m + 1, size=self.size).tolist()
+        self._positions[m] = 0
+
+    def die(self, m: int) -> int:
+        """
+        Takes a single roll of an m sided die from the buffer
+        """
+        position = self._positions.get(m, self.size)
+        if position >= self.size:
+            if m < 1:
+                raise ValueError(f"Cannot roll a die with {m} sides")
+            self.refill(m)
+            position = 0
+        self._positions[m] = position + 1
+        return self._rolls[m][position]
+
+
+def roll_stream(seed: int = None, size: int = 256) -> DiceBuffer:
+    """
+    A seeded stream of dice that can be passed as rng to the scalar rolls and to skill and character rolls, so that
+    a character or encounter rolls the same way every run without touching the module's shared random state
+    :param seed: anything accepted by numpy.random.default_rng, None draws fresh entropy
+    :param size: the number of rolls drawn per die size on each refill
+    """
+    return DiceBuffer(np.random.default_rng(seed), size)
+
+
+def use_batch_buffer(size: int = 4096, seed: int = None) -> DiceBuffer:
+    """
+    Routes roll_d100, roll_ndm and roll_str through a refillable DiceBuffer backed by the module generator
+    :param size: the number of rolls drawn per die size on each refill
+    :param seed: if given, the module generator is reseeded first
+    :return: the active buffer
+    """
+    global _buffer
+    if seed is not None:
+        seed_generator(seed)
+    _buffer = DiceBuffer(_generator, size)
+    return _buffer
+
+
+def stop_batch_buffer():
+    """
+    Returns the scalar rolls to the standard library random module
+    """
+    global _buffer
+    _buffer = None
+
+
+def roll_d100(advantage: int = 0, rng: DiceBuffer = None) -> int:
     """
     Makes a percentile dice roll
     :param advantage: a measure of advantage, positive or negative, taking the best or worst of multiple rolls
+    :param rng: a DiceBuffer to roll from, such as one from roll_stream, defaults to the module's random state
     :return: a value from the dice roll
     """
-    rolls = []
-    for _ in range(0, abs(advantage)+1):
-        rolls.append(randint(1, 100))
+    rng = rng if rng is not None else _buffer
+    if rng is not None:
+        rolls = [rng.die(100) for _ in range(0, abs(advantage)+1)]
+    else:
+        rolls = [randint(1, 100) for _ in range(0, abs(advantage)+1)]
     if advantage > 0:
         return min(rolls)
     return max(rolls)
 
 
-def roll_ndm(n: int = 0, m: int = 0) -> int:
+def roll_ndm(n: int = 0, m: int = 0, rng: DiceBuffer = None) -> int:
     """
     Makes a roll of n copies of dice with m sides each
+    :param rng: as in roll_d100
     :return: the sum from the dice roll
     """
     s = 0
+    rng = rng if rng is not None else _buffer
+    if rng is not None:
+        for _ in range(0, n):
+            s += rng.die(m)
+        return s
     for _ in range(0, n):
         s += randint(1, m)
     return s
 
 
-def roll_str(roll: str = ""):
-    _roll = roll.lower().split("d")
-    if len(_roll) == 2:
-        try:
-            if _roll[0][0] == "-":
-                return -1 * roll_ndm(-1 * int(_roll[0]), int(_roll[1]))
-            return roll_ndm(int(_roll[0]), int(_roll[1]))
-        except ValueError:
-            raise ValueError(f"{roll} is not a valid string roll")
-    raise ValueError(f"{roll} is not a valid string roll")
+def roll_str(roll: str = "", rng: DiceBuffer = None):
+    """
+    Rolls a dice expression such as "1d6", "-1d4" or "1d8+1d4", see DiceExpression for the full grammar
+    :param rng: as in roll_d100
+    :return: the result of the roll
+    """
+    return compile_dice(roll).roll(rng)
+
+
+def roll_d100_batch(n: int = 1, advantage: int = 0, generator: np.random.Generator = None) -> np.ndarray:
+    """
+    Makes n percentile dice rolls at once
+    :param n: the number of rolls to make
+    :param advantage: as in roll_d100, positive takes the lowest of extra rolls, negative the highest
+    :param generator: a numpy generator to draw from, defaults to the module generator
+    :return: an integer array of n values from 1 to 100
+    """
+    generator = generator if generator is not None else _generator
+    rolls = generator.integers(1, 101, size=(n, abs(advantage) + 1))
+    if advantage > 0:
+        return rolls.min(axis=1)
+    return rolls.max(axis=1)
+
+
+def roll_ndm_batch(n: int = 0, m: int = 0, count: int = 1, generator: np.random.Generator = None) -> np.ndarray:
+    """
+    Makes count rolls of n copies of dice with m sides each
+    :param n: the number of dice in each roll
+    :param m: the number of sides on each die
+    :param count: the number of rolls to make
+    :param generator: a numpy generator to draw from, defaults to the module generator
+    :return: an integer array of count sums
+    """
+    generator = generator if generator is not None else _generator
+    if n <= 0:
+        return np.zeros(count, dtype=np.int64)
+    if m < 1:
+        raise ValueError(f"Cannot roll a die with {m} sides")
+    return generator.integers(1, m + 1, size=(count, n)).sum(axis=1)
+
+
+def roll_str_batch(roll: str = "", count: int = 1, generator: np.random.Generator = None) -> np.ndarray:
+    """
+    Makes count rolls of a string roll of the form "1d6", "-1d4", etc.
+    :return: an integer array of count results
+    """
+    return compile_dice(roll).roll_many(count, generator)
+
+
+_TERMS = re.compile(r"[+-]?[^+-]+(?:[+-][^+-]+)*")
+_TERM = re.compile(r"([+-]?)([^+-]+)")
+_ATOM = re.compile(r"(?:(\d*)d(\d+)(?:(kh|kl)(\d+))?|(\d+))((?:\*\d+)*)")
+
+
+class DiceExpression:
+    """
+    A compiled dice expression. Expressions are sums and differences of terms, where each term is a constant ("3"),
+    a roll of dice ("2d6", "d8") or a roll keeping only the highest or lowest dice ("4d6kh3", "2d20kl1"), optionally
+    followed by one or more multipliers ("1d6*2"). Case and whitespace are ignored, so "1D8 + 1d4" and "-1d4" are valid.
+
+    Use compile_dice rather than constructing these directly so that each expression string is only parsed once.
+    """
+
+    def __init__(self, expression: str = ""):
+        self.expression = expression
+        self.constant = 0
+        self.terms = []  # tuples of (factor, number of dice, sides, keep mode or None, number kept)
+        self._distribution = None
+        self._parse()
+
+    def __repr__(self):
+        return f"DiceExpression({self.expression!r})"
+
+    def _parse(self):
+        text = "".join(str(self.expression).lower().split())
+        if not _TERMS.fullmatch(text):
+            raise ValueError(f"{self.expression} is not a valid string roll")
+        for sign, body in _TERM.findall(text):
+            atom = _ATOM.fullmatch(body)
+            if not atom:
+                raise ValueError(f"{self.expression} is not a valid string roll")
+            dice, sides, keep, kept, constant, multipliers = atom.groups()
+            factor = -1 if sign == "-" else 1
+            for multiplier in multipliers.split("*")[1:]:
+                factor *= int(multiplier)
+            if constant is not None:
+                self.constant += factor * int(constant)
+                continue
+            n = int(dice) if dice else 1
+            m = int(sides)
+            if m < 1:
+                raise ValueError(f"{self.expression} is not a valid string roll, dice need at least one side")
+            k = int(kept) if keep else n
+            if k > n:
+                raise ValueError(f"{self.expression} is not a valid string roll, cannot keep {k} of {n} dice")
+            if n and k and factor:
+                self.terms.append((factor, n, m, keep, k))
+        self.terms = tuple(self.terms)
+
+    def roll(self, rng: DiceBuffer = None) -> int:
+        """
+        Rolls the expression once using the scalar dice functions
+        :param rng: as in roll_d100
+        """
+        total = self.constant
+        for factor, n, m, keep, k in self.terms:
+            if keep is None:
+                total += factor * roll_ndm(n, m, rng)
+            else:
+                rolls = sorted(roll_ndm(1, m, rng) for _ in range(0, n))
+                total += factor * sum(rolls[n - k:] if keep == "kh" else rolls[:k])
+        return total
+
+    def roll_many(self, count: int = 1, generator: np.random.Generator = None) -> np.ndarray:
+        """
+        Rolls the expression count times at once
+        :param count: the number of rolls to make
+        :param generator: a numpy generator to draw from, defaults to the module generator
+        :return: an integer array of count results
+        """
+        generator = generator if generator is not None else _generator
+        totals = np.full(count, self.constant, dtype=np.int64)
+        for factor, n, m, keep, k in self.terms:
+            if keep is None:
+                totals += factor * roll_ndm_batch(n, m, count, generator)
+            else:
+                rolls = np.sort(generator.integers(1, m + 1, size=(count, n)), axis=1)
+                totals += factor * (rolls[:, n - k:] if keep == "kh" else rolls[:, :k]).sum(axis=1)
+        return totals
+
+    @property
+    def min(self) -> int:
+        return self.constant + sum(factor * k * (1 if factor > 0 else m) for factor, n, m, keep, k in self.terms)
+
+    @property
+    def max(self) -> int:
+        return self.constant + sum(factor * k * (m if factor > 0 else 1) for factor, n, m, keep, k in self.terms)
+
+    @property
+    def mean(self) -> float:
+        mean = self.constant
+        for factor, n, m, keep, k in self.terms:
+            if keep is None:
+                mean += factor * n * (m + 1) / 2
+            else:
+                counts = _keep_counts(n, m, keep, k)
+                mean += factor * sum(value * count for value, count in counts.items()) / m ** n
+        return mean
+
+    def counts(self):
+        """
+        The exact distribution of the expression as whole number counts
+        :return: a dict of result to the number of ways to roll it, and the total number of ways
+        """
+        if self._distribution is None:
+            counts, total = {self.constant: 1}, 1
+            for factor, n, m, keep, k in self.terms:
+                term = _keep_counts(n, m, keep, k) if keep else _sum_counts(n, m)
+                counts = _convolve(counts, {factor * value: count for value, count in term.items()})
+                total *= m ** n
+            self._distribution = (dict(sorted(counts.items())), total)
+        return self._distribution
+
+    def distribution(self) -> Dict[int, float]:
+        """
+        The exact probability of each possible result of the expression
+        """
+        counts, total = self.counts()
+        return {value: count / total for value, count in counts.items()}
+
+
+@lru_cache(maxsize=4096)
+def compile_dice(expression: str = "") -> DiceExpression:
+    """
+    Compiles a dice expression, returning the same DiceExpression every time the same string is passed in
+    """
+    return DiceExpression(expression)
+
+
+def _convolve(first: Dict[int, int], second: Dict[int, int]) -> Dict[int, int]:
+    result = {}
+    for a, a_count in first.items():
+        for b, b_count in second.items():
+            result[a + b] = result.get(a + b, 0) + a_count * b_count
+    return result
+
+
+def _sum_counts(n: int, m: int) -> Dict[int, int]:
+    counts = {0: 1}
+    die = {face: 1 for face in range(1, m + 1)}
+    for _ in range(0, n):
+        counts = _convolve(counts, die)
+    return counts
+
+
+def _keep_counts(n: int, m: int, keep: str, k: int) -> Dict[int, int]:
+    """
+    Counts the ways n dice with m sides can total each value when only the k highest (kh) or lowest (kl) are kept.
+    Faces are visited from the kept end, choosing how many of the remaining dice show each face.
+    """
+    faces = range(m, 0, -1) if keep == "kh" else range(1, m + 1)
+    states = {(n, 0, 0): 1}  # dice left to place, dice kept so far, kept total
+    for face in faces:
+        next_states = {}
+        for (left, kept, total), count in states.items():
+            for showing in range(0, left + 1):
+                taken = min(showing, k - kept)
+                key = (left - showing, kept + taken, total + taken * face)
+                next_states[key] = next_states.get(key, 0) + count * comb(left, showing)
+        states = next_states
+    counts = {}
+    for (left, kept, total), count in states.items():
+        if left == 0:
+            counts[total] = counts.get(total, 0) + count
+    return counts
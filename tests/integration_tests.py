@@ -1,9 +1,20 @@
+import io
+import json
 import os
+import struct
 
 import pytest
+from dataclasses import asdict
 from unittest.mock import patch, MagicMock
 
 from src.sheets import BasicRoleplayCharacter, BasicRoleplaySkill, load_character_from_json, save_character_to_json
+from src.sheets import SkillTable, brp_json, Roster, load_roster, save_roster
+from src.sheets import iter_characters_jsonl, write_characters_jsonl, load_snapshot, save_snapshot
+from src.sheets.brp_json import skills_to_dict
+from src.sheets import start_roll_log, stop_roll_log, read_roll_log, replay_rolls, RollRecord, brp_roll_log
+from src.sheets import simulate_encounters
+from src.sheets.brp_skill import build_skill
+from src.utils import roll_d100, roll_stream
 from tests.sample.raven_game import RavenSkill, RavenCharacter
 
 
@@ -83,3 +94,319 @@ def test_reset_guilt():
     char = RavenCharacter(name="Crow", guilt=42)
     char.reset_guilt()
     assert char.guilt == 0
+
+
+def test_compact_skills_subclass(tmp_path):
+    edgar = load_character_from_json(os.path.join("tests", "test_characters", "edgar.json"),
+                                     RavenCharacter,
+                                     RavenSkill)
+    expected = {key: skill.to_dict() for key, skill in edgar.skills.items()}
+    edgar.compact_skills()
+    assert isinstance(edgar.skills, SkillTable)
+    assert {key: skill.to_dict() for key, skill in edgar.skills.items()} == expected
+    assert isinstance(edgar.skills["Dodge"], RavenSkill)
+
+    save_character_to_json(edgar, str(tmp_path / "edgar.json"))
+    reloaded = load_character_from_json(str(tmp_path / "edgar.json"), RavenCharacter, RavenSkill)
+    assert {key: skill.to_dict() for key, skill in reloaded.skills.items()} == expected
+    assert "guilt" in edgar.skills["Dodge"].guilt_roll()
+
+
+@pytest.mark.parametrize("backend", ["default", "json"])
+def test_save_load_round_trip(tmp_path, monkeypatch, backend):
+    if backend == "json":
+        monkeypatch.setattr(brp_json, "orjson", None)
+        monkeypatch.setattr(brp_json, "msgspec", None)
+    edgar = load_character_from_json(os.path.join("tests", "test_characters", "edgar.json"), RavenCharacter, RavenSkill)
+    edgar.skills["Dodge"].guilt = 12
+    save_character_to_json(edgar, str(tmp_path / "edgar.json"))
+    reloaded = load_character_from_json(str(tmp_path / "edgar.json"), RavenCharacter, RavenSkill)
+    assert reloaded.to_dict() == edgar.to_dict()
+    assert all(type(skill) is RavenSkill for skill in reloaded.skills.owned().values())
+    assert json.loads((tmp_path / "edgar.json").read_text()) == asdict(edgar)
+
+
+def test_build_skill_matches_init():
+    values = {"name": "Hex", "chance": 30, "unknown": True}
+    assert build_skill(RavenSkill, values) == RavenSkill(**values)
+    assert build_skill(BasicRoleplaySkill, {"guilt": 5}) == BasicRoleplaySkill(guilt=5)
+
+
+@pytest.mark.parametrize("fixture", ["alice.json", "bob.json", "eve.json"])
+def test_sparse_save_round_trip(tmp_path, fixture):
+    character = load_character_from_json(os.path.join("tests", "test_characters", fixture))
+    character.skills["Climb"].improve(7)
+    save_character_to_json(character, str(tmp_path / "full.json"))
+    save_character_to_json(character, str(tmp_path / "sparse.json"), sparse=True)
+    assert (tmp_path / "sparse.json").stat().st_size * 10 < (tmp_path / "full.json").stat().st_size
+    full = load_character_from_json(str(tmp_path / "full.json"))
+    sparse = load_character_from_json(str(tmp_path / "sparse.json"))
+    assert sparse.to_dict() == full.to_dict()
+
+
+def test_sparse_save_round_trip_subclass(tmp_path):
+    raven = RavenCharacter(name="Poe", DEX=14, guilt=3,
+                           new_skill_defaults={"Confession": {"name": "Confession", "category": "communication",
+                                                              "chance": 20, "guilt": 40}})
+    raven.set_skill_class(RavenSkill)
+    raven.skills["Confession"].guilt = 35
+    raven.skills["Hide"].experience_check = True
+    raven.skills["Listen"].chance  # looked up, but unchanged
+    raven.STR = 16  # the Effort default now differs from the skill the character already has
+    save_character_to_json(raven, str(tmp_path / "sparse.json"), sparse=True)
+    saved = json.loads((tmp_path / "sparse.json").read_text())
+    assert set(saved["skills"]) == {"Confession", "Hide", "Effort"}
+    assert saved["guilt"] == 3 and "armor_category_penalty" not in saved
+
+    reloaded = load_character_from_json(str(tmp_path / "sparse.json"), RavenCharacter, RavenSkill)
+    assert reloaded.to_dict() == raven.to_dict()
+    assert isinstance(reloaded.skills["Listen"], RavenSkill) and reloaded.skills["Confession"].guilt == 35
+
+
+@pytest.mark.parametrize("backend", ["default", "json"])
+def test_write_character_streams_the_same_json(monkeypatch, backend):
+    if backend == "json":
+        monkeypatch.setattr(brp_json, "orjson", None)
+        monkeypatch.setattr(brp_json, "msgspec", None)
+    alice, bob, eve = _fixtures()
+    bob.compact_skills()
+    eve.skills = {}
+    blank = BasicRoleplayCharacter()
+    blank.set_skill_class()
+    for character in (alice, bob, eve, blank):
+        for sparse, expected in ((False, brp_json.character_to_dict), (True, brp_json.character_to_sparse_dict)):
+            fh = io.BytesIO()
+            brp_json.write_character(character, fh, sparse)
+            assert json.loads(fh.getvalue()) == json.loads(brp_json.dumps(expected(character)))
+
+
+def _fixtures():
+    return [load_character_from_json(os.path.join("tests", "test_characters", name))
+            for name in ("alice.json", "bob.json", "eve.json")]
+
+
+def test_roster_round_trip(tmp_path):
+    characters = _fixtures()
+    save_roster(characters, str(tmp_path / "party.roster"))
+    loaded = load_roster(str(tmp_path / "party.roster"))
+    assert list(loaded) == [character.name for character in characters]
+    assert [character.to_dict() for character in loaded.values()] == [c.to_dict() for c in characters]
+
+    only_bob = load_roster(str(tmp_path / "party.roster"), names=["Bob"])
+    assert list(only_bob) == ["Bob"] and only_bob["Bob"].to_dict() == characters[1].to_dict()
+    with pytest.raises(KeyError):
+        load_roster(str(tmp_path / "party.roster"), names=["Mallory"])
+
+
+def test_roster_update_append_and_delete(tmp_path):
+    alice, bob, eve = _fixtures()
+    save_roster([alice, bob], str(tmp_path / "party.roster"))
+    size = (tmp_path / "party.roster").stat().st_size
+    with Roster(str(tmp_path / "party.roster"), writable=True) as roster:
+        alice.skills["Climb"].improve(2)
+        roster.append(alice)  # fits in the space of the old Alice, so the file does not grow
+        assert (tmp_path / "party.roster").stat().st_size == size
+        bob.skills["Sorcery (Dark Arts)"] = BasicRoleplaySkill(name="Sorcery (Dark Arts)", category="mental")
+        roster.extend([bob, eve])
+        del roster["Alice"]
+        assert list(roster) == ["Bob", "Eve"]
+
+    with Roster(str(tmp_path / "party.roster")) as roster:
+        assert len(roster) == 2 and "Alice" not in roster
+        assert roster["Bob"].skills["Sorcery (Dark Arts)"].category == "mental"
+        assert roster["Eve"].to_dict() == eve.to_dict()
+        with pytest.raises(PermissionError):
+            roster.append(alice)
+        with pytest.raises(PermissionError):
+            del roster["Bob"]
+        assert "Bob" in roster and len(roster) == 2
+
+
+def test_roster_subclass_sparse(tmp_path):
+    edgar = load_character_from_json(os.path.join("tests", "test_characters", "edgar.json"), RavenCharacter, RavenSkill)
+    save_roster([], str(tmp_path / "ravens.roster"))
+    with Roster(str(tmp_path / "ravens.roster"), RavenCharacter, RavenSkill, sparse=True, writable=True) as roster:
+        roster.append(edgar)
+        edgar.add_guilt(5)
+        roster.append(edgar)
+        assert isinstance(roster["Edgar"], RavenCharacter)
+    loaded = load_roster(str(tmp_path / "ravens.roster"), CharacterClass=RavenCharacter, SkillClass=RavenSkill)
+    assert loaded["Edgar"].guilt == edgar.guilt and loaded["Edgar"].to_dict() == edgar.to_dict()
+    assert isinstance(loaded["Edgar"].skills["Listen"], RavenSkill)
+
+    with pytest.raises(TypeError, match="CharacterClass should be a subclass"):
+        load_roster(str(tmp_path / "ravens.roster"), CharacterClass=NotACharacter)
+    with pytest.raises(ValueError, match="not a roster file"):
+        Roster(os.path.join("tests", "test_characters", "alice.json"))
+    with pytest.raises(ValueError, match="only hold one character"):
+        save_roster([edgar, edgar], str(tmp_path / "twins.roster"))
+
+
+@pytest.mark.parametrize("filename, compression", [("party.jsonl", "infer"), ("party.jsonl.gz", "infer"),
+                                                   ("party.jsonl", "gzip"), ("party.jsonl.zst", "infer")])
+def test_jsonl_round_trip(tmp_path, filename, compression):
+    if filename.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    characters = _fixtures()
+    path = tmp_path / filename
+    assert write_characters_jsonl(iter(characters), path, compression=compression) == 3
+    loaded = iter_characters_jsonl(path, compression=compression)
+    assert [character.to_dict() for character in loaded] == [character.to_dict() for character in characters]
+
+
+def test_jsonl_parallel_subclass(tmp_path):
+    edgar = load_character_from_json(os.path.join("tests", "test_characters", "edgar.json"), RavenCharacter, RavenSkill)
+    ravens = []
+    for i in range(7):
+        raven = RavenCharacter(**{**asdict(edgar), "name": f"Raven {i}", "guilt": i})
+        raven.set_skill_class(RavenSkill)
+        ravens.append(raven)
+    path = str(tmp_path / "ravens.jsonl")
+    write_characters_jsonl(ravens, path, sparse=True)
+    loaded = list(iter_characters_jsonl(path, RavenCharacter, RavenSkill, processes=2, chunk_size=2))
+    assert [raven.name for raven in loaded] == [raven.name for raven in ravens]
+    assert [raven.to_dict() for raven in loaded] == [raven.to_dict() for raven in ravens]
+    assert isinstance(loaded[3].skills["Listen"], RavenSkill)
+
+    with pytest.raises(TypeError, match="CharacterClass should be a subclass"):
+        iter_characters_jsonl(path, NotACharacter)
+    with pytest.raises(ValueError, match="not one of"):
+        write_characters_jsonl(ravens, path, compression="bz2")
+
+
+def _state(character):
+    state = dict(vars(character))
+    state["skills"] = skills_to_dict(character.skills)
+    state["new_skill_defaults"] = skills_to_dict(character.new_skill_defaults)
+    return state
+
+
+def test_snapshot_round_trip(tmp_path):
+    alice, bob, eve = _fixtures()
+    alice.STR = 18  # Effort no longer matches the defaults for Alice's characteristics
+    alice.skills["Climb"].improve(3)
+    bob.compact_skills()
+    eve.take_damage(3, bypass_armor=True, target="head")
+    eve.max_hit_points = 99  # derived values are restored as saved, not recalculated
+    characters = [alice, bob, eve, BasicRoleplayCharacter(name="Mallory", STR=14)]
+    characters[3].set_skill_class()
+    save_snapshot(characters, str(tmp_path / "shard.snap"))
+
+    loaded = load_snapshot(str(tmp_path / "shard.snap"))
+    assert [_state(character) for character in loaded] == [_state(character) for character in characters]
+    assert isinstance(loaded[1].skills, SkillTable) and loaded[2].max_hit_points == 99
+    assert loaded[3].skills["Hide"].chance == characters[3].skills["Hide"].chance
+
+
+def test_snapshot_subclass_and_fallback(tmp_path):
+    edgar = load_character_from_json(os.path.join("tests", "test_characters", "edgar.json"), RavenCharacter, RavenSkill)
+    edgar.new_skill_defaults = {"Confession": {"name": "Confession", "category": "communication", "guilt": 40}}
+    edgar.set_skill_class(RavenSkill)
+    edgar.skills["Confession"].guilt = 35
+    save_snapshot([edgar], str(tmp_path / "ravens.snap"))
+    loaded = load_snapshot(str(tmp_path / "ravens.snap"), RavenCharacter, RavenSkill)
+    assert [_state(character) for character in loaded] == [_state(edgar)]
+    assert isinstance(loaded[0].new_skill_defaults["Confession"], RavenSkill)
+
+    # a snapshot for another class is stale, so the JSON is loaded instead
+    with pytest.raises(ValueError, match="does not match"):
+        load_snapshot(str(tmp_path / "ravens.snap"))
+    fallback = [os.path.join("tests", "test_characters", "alice.json")]
+    assert [character.name for character in load_snapshot(str(tmp_path / "ravens.snap"), fallback=fallback)] == \
+           ["Alice"]
+    write_characters_jsonl([edgar], str(tmp_path / "ravens.jsonl"))
+    loaded = load_snapshot(str(tmp_path / "missing.snap"), RavenCharacter, RavenSkill,
+                           fallback=str(tmp_path / "ravens.jsonl"))
+    assert loaded[0].to_dict() == edgar.to_dict()
+    with pytest.raises(TypeError, match="one CharacterClass"):
+        save_snapshot([edgar, BasicRoleplayCharacter()], str(tmp_path / "mixed.snap"))
+
+
+def _play_session(alice, bob):
+    alice.make_skill_roll("Dodge", modifier=5)
+    alice.opposed_roll_highest_success(BasicRoleplaySkill(name="Dodge", chance=30), my_skill="Climb")
+    bob.opposed_roll_subtraction(40, my_skill="Hide")
+    alice.opposed_pow_check(bob.POW)
+    bob.take_damage(7, target="left_arm")
+    bob.sanity_roll("1", "1d6+1", loss_reason="Saw the thing")
+    alice.pow_improvement_check = True
+    alice.improve_pow()
+
+
+def test_roll_log_replay(tmp_path):
+    alice, bob, _ = _fixtures()
+    start_state = [asdict(alice), asdict(bob)]
+    log = start_roll_log(str(tmp_path / "session.rolls"), capacity=3)
+    try:
+        _play_session(alice, bob)
+    finally:
+        stop_roll_log()
+    assert BasicRoleplayCharacter.make_skill_roll.__name__ == "make_skill_roll"
+
+    records = list(read_roll_log(str(tmp_path / "session.rolls")))
+    # rolls made inside another logged roll are part of the outer record
+    assert [record.method for record in records] == ["make_skill_roll", "opposed_roll_highest_success",
+                                                     "opposed_roll_subtraction", "opposed_pow_check", "take_damage",
+                                                     "sanity_roll", "improve_pow"]
+    assert records[0].arguments == {"skill": "Dodge", "modifier": 5}
+    assert records[1].dice[0][0] == 100 and records[5].arguments["loss_reason"] == "Saw the thing"
+    assert list(log) == records
+
+    replayed_alice = BasicRoleplayCharacter(**start_state[0])
+    replayed_alice.set_skill_class()
+    replayed_bob = BasicRoleplayCharacter(**start_state[1])
+    replayed_bob.set_skill_class()
+    with patch("src.utils.roll.randint", side_effect=AssertionError("replay should not roll")):
+        assert len(replay_rolls(replayed_alice, records)) == 4
+        assert len(replay_rolls(replayed_bob, records)) == 3
+    assert replayed_alice.to_dict() == alice.to_dict() and replayed_bob.to_dict() == bob.to_dict()
+
+    records[0].dice[0] = (100, records[0].dice[0][1] % 100 + 1)
+    with pytest.raises(ValueError, match="did not match"):
+        replay_rolls(BasicRoleplayCharacter(**start_state[0]), records[:1])
+
+
+def test_roll_log_dice_are_little_endian():
+    record = RollRecord("Alice", "make_skill_roll", {"skill": "Climb"}, [(100, 37), (6, 4)], {"success": True})
+    data = brp_roll_log._encode(record)
+    assert data.endswith(struct.pack("<4I", 100, 37, 6, 4))
+    assert brp_roll_log._decode(data) == (record, len(data))
+
+
+def test_roll_log_ring_and_streams():
+    alice, bob, _ = _fixtures()
+    log = start_roll_log(capacity=4)
+    try:
+        _play_session(alice, bob)
+        alice.make_skill_roll("Climb", rng=roll_stream(3))
+    finally:
+        stop_roll_log()
+    records = list(log)
+    # without a file only the most recent rolls are kept
+    assert len(records) == 4 and records[-1].arguments == {"skill": "Climb"}
+    assert records[-1].result["roll"] == records[-1].dice[0][1] == roll_d100(rng=roll_stream(3))
+
+    alice.make_skill_roll("Climb")
+    assert len(list(log)) == 4
+
+
+def test_simulate_encounters():
+    party_a = [BasicRoleplayCharacter(name=f"Guard {i}", STR=14, SIZ=14, DEX=11 + i, primary_weapon_damage="1d8")
+               for i in range(2)]
+    party_b = [RavenCharacter(name="Ogre", STR=22, SIZ=24, CON=18, DEX=8, primary_weapon_damage="2d6")]
+    for character in party_a + party_b:
+        character.set_skill_class()
+    before = [character.to_dict() for character in party_a + party_b]
+
+    stats = simulate_encounters(party_a, party_b, trials=120, seed=4, chunk_size=50, sanity_check=("0", "1d4"))
+    assert [character.to_dict() for character in party_a + party_b] == before
+    assert stats.trials == 120 == stats.wins_a + stats.wins_b + stats.draws
+    assert sum(stats.rounds_to_win.values()) == stats.wins_a + stats.wins_b
+    assert 0 < stats.win_rate_a < 1 and stats.mean_rounds_to_win >= 1
+    assert stats.party_b[0]["out"] == stats.wins_a
+    assert all(rate["out"] <= 1 for rate in stats.rates("a"))
+
+    # chunks roll from streams spawned from the seed, so workers do not change the result
+    assert simulate_encounters(party_a, party_b, trials=120, seed=4, chunk_size=50, workers=2,
+                               sanity_check=("0", "1d4")) == stats
+    assert simulate_encounters(party_a, party_b, trials=120, seed=5, chunk_size=50) != stats
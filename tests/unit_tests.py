@@ -1,7 +1,23 @@
+import copy
+import sys
+import threading
+import time
+import numpy as np
 import pytest
 from unittest.mock import patch, MagicMock
 
-from src.sheets import BasicRoleplayCharacter, BasicRoleplaySkill
+from src.sheets import BasicRoleplayCharacter, BasicRoleplaySkill, skill_roll_probabilities
+from src.sheets import SkillIndex, generic_skill_name, Archetype, generate_population, roll_characteristics
+from src.sheets.brp_character import _intify_success
+from src.sheets.brp_probability import d100_distribution
+from src.sheets import damage_distribution, damage_table, expected_damage
+from src.sheets.brp_population import CHARACTERISTICS, DERIVED, LOCATIONS
+from src.sheets.brp_derived import default_skill_chances, derived_characteristics
+from src.sheets.brp_skill_table import SkillTable
+from src.sheets import CharacterPopulation, bulk_experience_rolls, bulk_sanity_roll, sanity_risk
+from src.sheets import LockedCharacter, hold_characters
+from src.utils import roll, roll_d100, roll_ndm, roll_str, roll_d100_batch, roll_ndm_batch, roll_str_batch
+from src.utils import compile_dice, roll_stream
 
 
 @pytest.fixture
@@ -71,6 +87,47 @@ def test_make_skill_roll_fallback():
     assert isinstance(result, dict)
 
 
+class _AliasedCharacter(BasicRoleplayCharacter):
+    skill_aliases = {"Rifle": "Firearm (Rifle)", "Spot": "Spot Hidden"}
+
+
+def test_skill_index_resolves_specializations_and_aliases():
+    assert generic_skill_name("Firearm (Rifle)") == "Firearm (various)"
+    assert generic_skill_name("Language (Old Elvish)") == "Language (various)"
+    assert generic_skill_name("Skill specific") == "Skill (various)"
+    char = _AliasedCharacter(name="Scout")
+    char.set_skill_class()
+    rifle = char._get_skill("Firearm (Rifle)")
+    assert rifle is char.skills["Firearm (various)"] is char._get_skill("Rifle")
+    assert char._get_skill("Language (Old Elvish)") is char.skills["Language (various)"]
+    assert char.skill_index.resolve("Spot") == "Spot"
+    with pytest.raises(KeyError, match="Knitting"):
+        char._get_skill("Knitting")
+
+    char.skill_index.add("Firearm (Rifle)", BasicRoleplaySkill(name="Firearm (Rifle)", category="combat", chance=60))
+    assert char._get_skill("Rifle").chance == 60
+    assert char.skill_index.skill("Firearm (Shotgun)") is rifle
+
+    char.skills = {"Custom (various)": BasicRoleplaySkill(name="Custom (various)", chance=30)}
+    assert char.skill_index.skills is char.skills
+    assert char._get_skill("Custom thing").chance == 30
+    index = SkillIndex({"Spot Hidden": BasicRoleplaySkill(name="Spot Hidden")}, {"Spot": "Spot Hidden"})
+    assert index.resolve("Spot") == "Spot Hidden"
+
+
+@patch("src.sheets.brp_character.roll_d100", return_value=50)
+@patch("src.sheets.brp_skill.roll_d100", return_value=1)
+def test_opposed_rolls_resolve_specialized_skills(mock_skill_roll, mock_roll):
+    char = BasicRoleplayCharacter(name="Scout")
+    char.set_skill_class()
+    chance = char.skills["Firearm (various)"].chance
+    # equal skill rolls tie and an opponent this close is a plain 5% roll, so every method reads the skill's chance
+    assert char.opposed_roll_highest_success(chance, my_skill="Firearm (Rifle)")["i_won"]
+    assert char.opposed_roll_subtraction(chance, my_skill="Firearm (Rifle)")["critical"]
+    assert char.opposed_roll_resistance_table(chance, my_skill="Firearm (Rifle)")["chance"] == 50
+    assert char.opposed_roll_resistance(chance, my_skill="Firearm (Rifle)")["success"]
+
+
 def test_opposed_roll_highest_success():
     char = BasicRoleplayCharacter()
     skill = BasicRoleplaySkill(name="Test", chance=60)
@@ -150,6 +207,35 @@ def test_improve_pow():
             patch("src.sheets.brp_character.roll_ndm", return_value=2):
         char.improve_pow()
         assert char.POW > 10
+    assert char.max_power_points == char.POW == 11
+    assert char.temp_insanity_score == 28
+
+
+def test_derived_characteristics_follow_characteristics():
+    char = BasicRoleplayCharacter(STR=10, SIZ=10, CON=10)
+    assert "damage_modifier" not in vars(char)  # nothing is calculated until it is read
+    assert (char.damage_modifier, char.max_hit_points, char.major_wound_level) == ("0", 10, 5)
+    assert char.category_bonuses["combat"] == 0
+
+    char.STR, char.SIZ, char.CON = 18, 16, 14
+    assert (char.damage_modifier, char.max_hit_points, char.major_wound_level) == ("1d6", 15, 8)
+    assert char.max_hp_location["head"] == 5 and char.category_bonuses["combat"] == 4
+
+    char.max_hit_points = 30  # an assigned value is kept until a characteristic changes
+    assert char.max_hit_points == 30
+    char.SIZ = 16
+    assert char.max_hit_points == 30
+    char.tough = True
+    assert char.max_hit_points == 30 == 2 * char.major_wound_level
+
+    char.use_category_bonus, char.use_simple_category_bonus = False, True
+    assert char.category_bonuses["physical"] == 9
+    char.use_simple_category_bonus = False
+    assert set(char.category_bonuses.values()) == {0}
+
+    char.fatigue = 0
+    char._derived_characteristics()
+    assert char.fatigue == 32 and char.max_hit_points == 30
 
 
 def test_make_experience_rolls():
@@ -569,3 +655,686 @@ def test_sanity_does_not_go_below_zero():
 
     char.sanity_roll("5", "10")  # Exceeds current sanity
     assert char.sanity == 0
+
+
+def test_roll_d100_batch_range_and_advantage():
+    roll.seed_generator(1)
+    plain = roll_d100_batch(10000)
+    assert plain.shape == (10000,)
+    assert plain.min() >= 1 and plain.max() <= 100
+    assert roll_d100_batch(10000, advantage=2).mean() < plain.mean() < roll_d100_batch(10000, advantage=-2).mean()
+
+
+def test_roll_batches_are_reproducible_under_seed():
+    roll.seed_generator(7)
+    first = roll_ndm_batch(3, 6, 100)
+    roll.seed_generator(7)
+    assert (roll_ndm_batch(3, 6, 100) == first).all()
+    assert 3 <= first.min() and first.max() <= 18
+
+
+def test_roll_str_batch_negative():
+    results = roll_str_batch("-1d4", 1000)
+    assert results.min() >= -4 and results.max() <= -1
+    with pytest.raises(ValueError):
+        roll_str_batch("1x4", 10)
+
+
+def test_scalar_rolls_use_batch_buffer():
+    buffer = roll.use_batch_buffer(size=8, seed=3)
+    try:
+        rolls = [roll_d100() for _ in range(20)]
+        assert all(1 <= r <= 100 for r in rolls)
+        assert 2 <= roll_ndm(2, 6) <= 12
+        assert -4 <= roll_str("-1d4") <= -1
+        assert set(buffer._rolls) == {100, 6, 4}
+        roll.use_batch_buffer(size=8, seed=3)
+        assert [roll_d100() for _ in range(20)] == rolls
+    finally:
+        roll.stop_batch_buffer()
+
+
+def test_roll_streams_are_reproducible_and_independent():
+    def draws(rng):
+        return [roll_d100(2, rng), roll_ndm(3, 6, rng), roll_str("4d6kh3-1", rng)] + [roll_d100(rng=rng)
+                                                                                       for _ in range(50)]
+
+    with patch("src.utils.roll.randint", side_effect=AssertionError("used the shared random state")):
+        assert draws(roll.roll_stream(7)) == draws(roll.roll_stream(7))
+        assert draws(roll.roll_stream(7)) != draws(roll.roll_stream(8))
+        first, second = roll.roll_stream(7).spawn(2)
+        assert draws(first) != draws(second)
+        parent = roll.roll_stream(7)
+        assert draws(parent.spawn()[0]) != draws(parent.spawn()[0])  # each spawn gives new streams
+        assert [draws(stream) for stream in roll.roll_stream(7).spawn(3)] == \
+               [draws(stream) for stream in roll.roll_stream(7).spawn(3)]
+
+
+def test_character_rolls_take_a_stream():
+    def session(rng):
+        char = BasicRoleplayCharacter(POW=12, armor_protection="1d4")
+        char.set_skill_class()
+        opponent = BasicRoleplaySkill(chance=40)
+        results = [char.make_skill_roll("Dodge", rng=rng),
+                   char.opposed_roll_highest_success(opponent, my_skill="Climb", rng=rng),
+                   char.opposed_roll_subtraction(opponent, my_skill="Climb", rng=rng),
+                   char.opposed_roll_resistance(opponent, my_skill="Climb", rng=rng),
+                   char.opposed_pow_check(12, rng=rng),
+                   char.characteristic_roll("STR", 5, rng=rng),
+                   char.take_damage(8, target="head", rng=rng)]
+        char.sanity_roll("1", "1d6", rng=rng)
+        char.recover_sanity("1d3", rng=rng)
+        char.improve_pow(rng=rng)
+        char.make_experience_rolls(rng=rng)
+        return results, char.to_dict()
+
+    with patch("src.utils.roll.randint", side_effect=AssertionError("used the shared random state")):
+        assert session(roll.roll_stream(11)) == session(roll.roll_stream(11))
+
+
+@pytest.mark.parametrize("expression, low, high, mean", [
+    ("1d6", 1, 6, 3.5),
+    ("-1d4", -4, -1, -2.5),
+    ("1d8+1d4", 2, 12, 7),
+    ("2D6 - 1", 1, 11, 6),
+    ("1d6*2+3", 5, 15, 10),
+    ("4d6kh3", 3, 18, 15869 / 1296),
+    ("2d20kl1", 1, 20, 7.175),
+])
+def test_dice_expression_bounds_and_distribution(expression, low, high, mean):
+    dice = compile_dice(expression)
+    distribution = dice.distribution()
+    assert (dice.min, dice.max) == (low, high)
+    assert (min(distribution), max(distribution)) == (low, high)
+    assert dice.mean == pytest.approx(mean)
+    assert sum(distribution.values()) == pytest.approx(1)
+    assert sum(value * p for value, p in distribution.items()) == pytest.approx(mean)
+    assert low <= dice.roll() <= high
+    many = dice.roll_many(1000)
+    assert many.min() >= low and many.max() <= high
+
+
+def test_compile_dice_is_cached():
+    assert compile_dice("1d8+1d4") is compile_dice("1d8+1d4")
+
+
+@pytest.mark.parametrize("expression", ["", "d", "1x4", "1d0", "2d6kh3", "1d6+-2", "1d6*"])
+def test_dice_expression_invalid(expression):
+    with pytest.raises(ValueError):
+        roll_str(expression)
+
+
+def test_dice_expression_invalid_fails_fast():
+    # a long run of digits with a trailing sign used to backtrack exponentially before being rejected
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        compile_dice("1" * 200 + "+")
+    assert time.perf_counter() - start < 0.5
+
+
+def _enumerate_skill_roll(skill, rolls, **kwargs):
+    tiers = {1: "fumble", 2: "failure", 3: "success", 4: "special", 5: "critical"}
+    counts = {tier: 0 for tier in tiers.values()}
+    for roll_value in rolls:
+        with patch("src.sheets.brp_skill.roll_d100", return_value=roll_value):
+            counts[tiers[_intify_success(skill.skill_roll(**kwargs))]] += 1
+    return {tier: count / len(rolls) for tier, count in counts.items()}
+
+
+@pytest.mark.parametrize("chance, kwargs", [
+    (50, {}),
+    (0, {"lucky": True}),
+    (0, {}),
+    (100, {"diff_multi": 2}),
+    (45, {"diff_multi": 0.5, "modifier": 7}),
+    (60, {"category_bonus": {"combat": 5}, "armor_penalty": {"combat": 12}, "fatigue_points": -4}),
+    (130, {"fatigue_points": 3}),
+])
+def test_skill_roll_probabilities_match_skill_roll(chance, kwargs):
+    skill = BasicRoleplaySkill(name="Test", category="combat", chance=chance)
+    expected = _enumerate_skill_roll(skill, range(1, 101), **kwargs)
+    assert skill.skill_roll_probabilities(**kwargs) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("advantage", [1, -1])
+def test_skill_roll_probabilities_with_advantage(advantage):
+    skill = BasicRoleplaySkill(name="Test", chance=55)
+    pick = min if advantage > 0 else max
+    rolls = [pick(a, b) for a in range(1, 101) for b in range(1, 101)]
+    assert d100_distribution(advantage)[1:] == pytest.approx([rolls.count(x) / len(rolls) for x in range(1, 101)])
+    single = {x: _enumerate_skill_roll(skill, [x]) for x in range(1, 101)}
+    expected = {tier: sum(single[x][tier] for x in rolls) / len(rolls) for tier in single[1]}
+    assert skill_roll_probabilities(skill, advantage=advantage) == pytest.approx(expected)
+
+
+def test_character_skill_roll_probabilities_uses_fallback():
+    char = BasicRoleplayCharacter()
+    char.skills = {"Firearm (various)": BasicRoleplaySkill(name="Firearm (various)", category="combat", chance=40)}
+    char.category_bonuses = {"combat": 10}
+    probabilities = char.skill_roll_probabilities("Firearm (Rifle)")
+    assert probabilities["failure"] + probabilities["fumble"] == pytest.approx(0.7)
+
+
+def _all_roll_pairs():
+    return [value for a in range(1, 101) for b in range(1, 101) for value in (a, b)]
+
+
+@pytest.mark.parametrize("my_chance, opponent, i_win_ties", [
+    (60, 50, None),
+    (40, 40, None),
+    (30, 70, True),
+    (75, BasicRoleplaySkill(name="Dodge", category="physical", chance=55), False),
+])
+def test_predict_opposed_highest_success(my_chance, opponent, i_win_ties):
+    char = BasicRoleplayCharacter()
+    char.skills = {"Test": BasicRoleplaySkill(name="Test", category="combat", chance=my_chance)}
+    char.category_bonuses = {"combat": 5}
+    kwargs = {"opponent": opponent, "my_skill": "Test", "i_win_ties": i_win_ties,
+              "opponent_category_bonus": {"physical": -3}}
+    totals = {"i_won": 0, "is_critical": 0, "is_fail": 0, "is_fumble": 0}
+    with patch("src.sheets.brp_skill.roll_d100", side_effect=_all_roll_pairs()):
+        for _ in range(10000):
+            result = char.opposed_roll_highest_success(**kwargs)
+            for key in totals:
+                totals[key] += result[key]
+    prediction = char.predict_opposed("highest_success", **kwargs)
+    for key, total in totals.items():
+        assert prediction[key] == pytest.approx(total / 10000)
+
+
+@pytest.mark.parametrize("my_chance, opponent", [(60, 30), (42, 40), (20, 90)])
+def test_predict_opposed_subtraction(my_chance, opponent):
+    char = BasicRoleplayCharacter()
+    char.skills = {"Test": BasicRoleplaySkill(name="Test", category="combat", chance=my_chance)}
+    counts = {tier: 0 for tier in ("fumble", "failure", "success", "special", "critical")}
+    names = dict(enumerate(counts, start=1))
+    with patch("src.sheets.brp_skill.roll_d100", side_effect=_all_roll_pairs()):
+        for _ in range(10000):
+            counts[names[_intify_success(char.opposed_roll_subtraction(opponent=opponent, my_skill="Test"))]] += 1
+    prediction = char.predict_opposed("subtraction", my_skill="Test", opponent=opponent)
+    assert prediction == pytest.approx({tier: count / 10000 for tier, count in counts.items()})
+
+
+@pytest.mark.parametrize("method", ["resistance_table", "resistance"])
+@pytest.mark.parametrize("my_chance, opponent", [(60, 30), (10, 95), (100, 0)])
+def test_predict_opposed_resistance(method, my_chance, opponent):
+    char = BasicRoleplayCharacter()
+    char.skills = {"Test": BasicRoleplaySkill(name="Test", chance=my_chance)}
+    counts = {tier: 0 for tier in ("fumble", "failure", "success", "special", "critical")}
+    names = dict(enumerate(counts, start=1))
+    for roll_value in range(1, 101):
+        with patch("src.sheets.brp_character.roll_d100", return_value=roll_value):
+            result = getattr(char, f"opposed_roll_{method}")(opponent=opponent, my_skill="Test")
+        counts[names[_intify_success(result)]] += 1
+    prediction = char.predict_opposed(method, my_skill="Test", opponent=opponent)
+    assert prediction == pytest.approx({tier: count / 100 for tier, count in counts.items()})
+
+
+def test_predict_opposed_invalid_method():
+    char = BasicRoleplayCharacter()
+    char.skills = {"Test": BasicRoleplaySkill(name="Test", chance=50)}
+    with pytest.raises(ValueError):
+        char.predict_opposed("arm_wrestle", my_skill="Test", opponent=50)
+
+
+def test_default_skills_are_not_shared_between_characters():
+    first, second = BasicRoleplayCharacter(DEX=12), BasicRoleplayCharacter(DEX=12)
+    first.set_skill_class()
+    second.set_skill_class()
+    assert first.skills.template is second.skills.template
+    first.skills["Climb"].improve(10)
+    first.skills["Climb"].experience_check = True
+    assert first.skills["Climb"].chance == 50
+    assert second.skills["Climb"].chance == 40 and not second.skills["Climb"].experience_check
+    assert first.skills["Dodge"].chance == 24
+
+
+def test_default_skills_only_store_used_skills():
+    char = BasicRoleplayCharacter(POW=12, skills={"Climb": {"name": "Climb", "category": "physical", "chance": 70}})
+    char.set_skill_class()
+    assert set(char.skills.owned()) == {"Climb"}
+    assert "Luck" in char.skills and len(char.skills) == len(list(char.skills))
+    assert char.skills["Luck"].chance == 60
+    assert set(char.skills.owned()) == {"Climb", "Luck"}
+    assert char.skills["Climb"].chance == 70
+
+
+def test_default_skills_follow_characteristics_not_previous_characters():
+    BasicRoleplayCharacter(can_drive=True, literate=True).set_skill_class()
+    char = BasicRoleplayCharacter(can_drive=False, literate=False, can_fly=False, DEX=11)
+    char.set_skill_class()
+    assert char.skills["Drive (various)"].chance == 0
+    assert char.skills["Literacy"].chance == 0
+    assert char.skills["Fly"].chance == 5.5
+
+
+def test_skill_table_views_write_through():
+    table = SkillTable({"Test": BasicRoleplaySkill(name="Test", category="combat", chance=50),
+                        "Half": {"name": "Half", "chance": 5.5}})
+    assert list(table) == ["Test", "Half"] and len(table) == 2
+    assert table["Half"].chance == 5.5 and table["Test"].chance == 50
+    with patch("src.sheets.brp_skill.roll_d100", return_value=10):
+        assert table["Test"].skill_roll()["success"]
+    assert table["Test"].experience_check
+    assert [key for key, _ in table.checked()] == ["Test"]
+    with patch("src.sheets.brp_skill.roll_d100", return_value=100), \
+            patch("src.sheets.brp_skill.roll_ndm", return_value=4):
+        table["Test"].experience_roll()
+    assert table["Test"].chance == 54 and not table["Test"].experience_check
+    del table["Half"]
+    assert "Half" not in table and list(table) == ["Test"]
+    with pytest.raises(KeyError):
+        table["Half"]
+
+
+def test_skill_table_sized_by_its_own_skills():
+    tables = [SkillTable({"Dodge": {"name": "Dodge", "chance": 20},
+                          f"Craft (Unique {i})": {"name": f"Craft (Unique {i})", "chance": i}}) for i in range(500)]
+    last = tables[-1]
+    assert len(last._flags) == len(last._chance) == 2
+    assert list(last) == ["Dodge", "Craft (Unique 499)"] and last["Craft (Unique 499)"].chance == 499
+    assert "Craft (Unique 0)" not in last and tables[0]["Craft (Unique 0)"].chance == 0
+    del last["Dodge"]
+    last["Dodge"] = {"name": "Dodge", "chance": 30}
+    assert len(last._flags) == 2 and list(last) == ["Craft (Unique 499)", "Dodge"] and last["Dodge"].chance == 30
+
+
+def test_compact_skills_make_skill_roll():
+    char = BasicRoleplayCharacter()
+    char.set_skill_class()
+    char.compact_skills()
+    with patch("src.sheets.brp_skill.roll_d100", return_value=1):
+        assert char.make_skill_roll("Firearm (Rifle)")["critical"]
+    assert char.skills["Firearm (various)"].experience_check
+    char.make_experience_rolls()
+    assert not char.skills["Firearm (various)"].experience_check
+
+
+def test_damage_table_matches_enumeration():
+    counts = {}
+    for weapon in range(1, 7):
+        for modifier in range(1, 5):
+            for armor in range(1, 3):
+                amount = max(0, max(0, weapon - modifier) - armor)
+                counts[amount] = counts.get(amount, 0) + 1
+    table = damage_table("1d6", "-1d4", "1d2")
+    assert table == tuple((amount, count / 48) for amount, count in sorted(counts.items()))
+    assert damage_table("1d6", "-1d4", "1d2") is table
+    assert damage_table("2", "0", 3) == ((0, 1.0),)
+
+
+def test_damage_distribution():
+    attacker = BasicRoleplayCharacter(name="Attacker", STR=10, SIZ=10, primary_weapon_damage="1d8")
+    defender = BasicRoleplayCharacter(name="Defender", CON=10, SIZ=10, armor_protection=2)
+    defender.damage = 6
+    defender.damage_location["head"] = 1
+    prediction = damage_distribution(attacker, defender)
+    assert prediction["pmf"] == {0: 2 / 8, **{amount: 1 / 8 for amount in range(1, 7)}}
+    assert prediction["expected"] == pytest.approx(21 / 8) == expected_damage(attacker, defender)
+    # 4 hit points remain, so 6, 7 and 8 on the d8 kill
+    assert prediction["kill"] == pytest.approx(3 / 8)
+    head = defender.max_hp_location["head"]
+    assert prediction["locations"]["head"]["disabled"] == pytest.approx(sum(
+        1 / 8 for amount in range(1, 7) if 1 + amount >= head))
+    assert prediction["locations"]["head"]["severed"] == 0
+    assert expected_damage(attacker, defender, weapon="3") == 1
+
+
+def _crowd():
+    crowd = []
+    for i, (dex, con, penalty) in enumerate([(10, 10, 0), (16, 8, 10), (6, 15, 0), (12, 12, 5)]):
+        char = BasicRoleplayCharacter(name=f"NPC {i}", DEX=dex, CON=con,
+                                      skills={"Stealth": {"name": "Stealth", "category": "physical", "chance": 20 * i}})
+        char.set_skill_class()
+        char.armor_category_penalty["physical"] = penalty
+        crowd.append(char)
+    crowd[3].fatigue = -7
+    return crowd
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"difficulty": 2, "modifier": -5}, {"lucky": True}])
+def test_population_skill_roll_matches_skill_roll(kwargs):
+    crowd = _crowd()
+    population = CharacterPopulation.from_characters(crowd)
+    for roll_value in range(1, 101):
+        with patch("src.sheets.brp_population.roll_d100_batch", return_value=np.full(len(crowd), roll_value)):
+            results = population.make_skill_roll("Stealth", **kwargs)
+        for row, char in enumerate(crowd):
+            with patch("src.sheets.brp_skill.roll_d100", return_value=roll_value):
+                expected = char.make_skill_roll("Stealth", **kwargs)
+            for key, value in expected.items():
+                assert results[key][row] == value, (roll_value, row, key)
+            assert results["tier"][row] == _intify_success(expected)
+
+
+def test_population_round_trip_and_mask():
+    crowd = _crowd()
+    population = CharacterPopulation.from_characters(crowd)
+    assert population.chance[:, population.skill_column("Stealth")].tolist() == [0, 20, 40, 60]
+    with patch("src.sheets.brp_population.roll_d100_batch", side_effect=lambda n, *args: np.ones(n, dtype=int)):
+        results = population.make_skill_roll("Hide", mask=np.array([1, 3]))
+    assert results["rolled"].tolist() == [False, True, False, True]
+    assert results["critical"].tolist() == [False, True, False, True]
+    population.chance[0, population.skill_column("Climb")] = 55
+    population.STR[2] = 14
+    characters = population.to_characters()
+    assert set(crowd[0].skills.owned()) == {"Stealth", "Climb"}
+    assert characters[0] is crowd[0] and crowd[0].skills["Climb"].chance == 55
+    assert crowd[1].skills["Hide"].experience_check and not crowd[0].skills["Hide"].experience_check
+    assert crowd[2].STR == 14
+
+    rebuilt = CharacterPopulation.from_characters(crowd)
+    rebuilt.characters = None
+    copies = rebuilt.to_characters()
+    assert [copy.skills["Climb"].chance for copy in copies] == [55, 40, 40, 40]
+    assert copies[3].fatigue == -7 and copies[1].armor_category_penalty["physical"] == 10
+
+
+@pytest.mark.parametrize("roll_value", [1, 40, 100])
+def test_population_resolve_hits_matches_take_damage(roll_value):
+    generator = np.random.default_rng(3)
+    crowd = []
+    for i in range(6):
+        char = BasicRoleplayCharacter(name=f"NPC {i}", CON=6 + 2 * i, SIZ=8 + i, POW=4 + 2 * i, armor_protection=i % 3)
+        char.set_skill_class()
+        crowd.append(char)
+    crowd[2].minor_wound = True
+    crowd[4].damage = 5
+    targets = generator.integers(0, len(crowd), 40)
+    amounts = generator.integers(0, 12, 40)
+    locations = [None if i % 3 == 0 else ("nowhere" if i % 7 == 0 else LOCATIONS[i % 7]) for i in range(40)]
+
+    population = CharacterPopulation.from_characters(copy.deepcopy(crowd))
+    with patch("src.sheets.brp_population.roll_d100_batch", side_effect=lambda n, *args: np.full(n, roll_value)):
+        results = population.resolve_hits(targets, amounts, locations)
+    for hit, (row, amount, location) in enumerate(zip(targets, amounts, locations)):
+        with patch("src.sheets.brp_skill.roll_d100", return_value=roll_value):
+            expected = crowd[row].take_damage(int(amount), target=location)
+        assert results["unconscious"][hit] == expected["unconscious"], hit
+        assert results["dying"][hit] == expected["dying"], hit
+        assert results["permanent_injury"][hit] == expected["permanent_injury"], hit
+        timer = results["major_wound_timer"][hit]
+        assert (None if np.isnan(timer) else timer) == expected["major_wound_timer"], hit
+        for key in ("disabled_body_part", "maimed_body_part", "severed_body_part"):
+            assert results[key][hit] == (expected[key] is not None), (hit, key)
+    for row, char in enumerate(population.to_characters()):
+        for name in ("damage", "minor_wound", "major_wound", "fatal_wound", "damage_location"):
+            assert getattr(char, name) == getattr(crowd[row], name), (row, name)
+        assert char.skills["Luck"].experience_check == crowd[row].skills["Luck"].experience_check
+
+
+def test_population_resolve_hits_rolls_armor():
+    crowd = [BasicRoleplayCharacter(name="Knight", armor_protection="1d4"), BasicRoleplayCharacter(name="Peasant")]
+    for char in crowd:
+        char.set_skill_class()
+    population = CharacterPopulation.from_characters(crowd)
+    results = population.resolve_hits([0] * 50 + [1], [5] * 50 + [3], generator=np.random.default_rng(1))
+    assert set(results["amount"][:50].tolist()) == {1, 2, 3, 4}
+    assert results["amount"][50] == 3
+    assert population.damage.tolist() == [results["amount"][:50].sum(), 3]
+    assert population.resolve_hits([], [])["unconscious"].shape == (0,)
+
+
+def _experienced_roster(count=200):
+    roster = []
+    for i in range(count):
+        char = BasicRoleplayCharacter(name=f"PC {i}", INT=8 + i % 10, improvement_die=6 if i % 2 else "1d4")
+        char.set_skill_class()
+        for key in ("Climb", "Hide", "Listen"):
+            char.skills[key].experience_check = True
+        roster.append(char)
+    return roster
+
+
+def test_bulk_experience_rolls_reproducible_and_written_back():
+    first, second = _experienced_roster(20), _experienced_roster(20)
+    reports = bulk_experience_rolls(first, np.random.default_rng(5))
+    assert reports == bulk_experience_rolls(second, np.random.default_rng(5))
+    for char, report in zip(first, reports):
+        assert set(report) == {"Climb", "Hide", "Listen"}
+        assert char.skills["Climb"].chance == 40 + report["Climb"]
+        assert not any(skill.experience_check for skill in char.skills.values())
+        assert all(0 <= amount <= (6 if char.improvement_die == 6 else 4) for amount in report.values())
+
+
+def test_bulk_experience_rolls_match_experience_roll():
+    roster = _experienced_roster(400)
+    reports = bulk_experience_rolls(roster, np.random.default_rng(11))
+    bulk_rate = np.mean([amount > 0 for report in reports for amount in report.values()])
+    # a skill improves when d100 + INT / 2 rounded up is at least its chance
+    expected = np.mean([min(100, 100 - chance + 1 + -(char.INT // -2)) / 100
+                        for char in roster for chance in (40, 10, 25)])
+    assert bulk_rate == pytest.approx(expected, abs=0.04)
+
+
+def _investigators(count=300):
+    roster = []
+    for i in range(count):
+        char = BasicRoleplayCharacter(name=f"PC {i}", POW=8 + i % 6)
+        char.sanity = 5 + i % 60
+        char.recent_san_loss = i % 4
+        char.temp_insanity_score = 6 + i % 5
+        roster.append(char)
+    return roster
+
+
+def test_bulk_sanity_roll_updates_characters():
+    first, second = _investigators(50), _investigators(50)
+    summary = bulk_sanity_roll(first, "1", "1d6", "Reveal", np.random.default_rng(2))
+    assert all((summary[key] == value).all()
+               for key, value in bulk_sanity_roll(second, "1", "1d6", "Reveal", np.random.default_rng(2)).items())
+    for char, before, success, loss in zip(first, _investigators(50), summary["success"], summary["loss"]):
+        assert loss == 1 if success else 1 <= loss <= 6
+        assert char.sanity == max(0, before.sanity - loss)
+        assert char.recent_san_loss == before.recent_san_loss + loss
+        assert char.temporarily_insane == (char.recent_san_loss >= char.temp_insanity_score)
+        assert char.permanently_insane == (char.sanity == 0)
+        assert {"amount": int(loss), "reason": "Reveal"} in char.loss_history
+    assert summary["temporarily_insane"].any()
+
+
+def test_sanity_risk_matches_bulk_sanity_roll():
+    char = BasicRoleplayCharacter(name="PC", POW=10)
+    char.sanity, char.recent_san_loss, char.temp_insanity_score = 6, 3, 10
+    # a success, on 1 to 6, loses 1d2 and never reaches 10 lost; a failure loses 1d10 with 7 to 10 reaching it
+    risk = sanity_risk(char, "1d2", "1d10")
+    assert risk["temporarily_insane"] == pytest.approx(0.94 * 0.4)
+    assert risk["permanently_insane"] == pytest.approx(0.94 * 0.5)
+    assert risk["expected_loss"] == pytest.approx(0.06 * 1.5 + 0.94 * 5.5)
+    roster = _investigators(2000)
+    summary = bulk_sanity_roll(roster, "1d2", "1d6+1", generator=np.random.default_rng(8))
+    expected = np.mean([sanity_risk(before, "1d2", "1d6+1")["permanently_insane"] for before in _investigators(2000)])
+    assert summary["permanently_insane"].mean() == pytest.approx(expected, abs=0.02)
+
+
+def test_archetype_spawns_constructed_characters():
+    skills = {"Brawl": {"name": "Brawl", "category": "combat", "chance": 40}}
+    goblin = Archetype("Goblin", {"SIZ": 6, "armor_protection": 1, "skills": skills},
+                       rolls={"STR": "3d6", "DEX": "2d6+6"}, skill_variance=10)
+    spawned = goblin.spawn(20, np.random.default_rng(4))
+    assert [char.name for char in spawned[:2]] == ["Goblin 1", "Goblin 2"]
+    for char in spawned:
+        expected = BasicRoleplayCharacter(name=char.name, SIZ=6, armor_protection=1, STR=char.STR, DEX=char.DEX,
+                                          skills={"Brawl": {**skills["Brawl"], "chance": char.skills["Brawl"].chance}})
+        expected.set_skill_class()
+        assert char == expected
+        assert char.max_hit_points == expected.max_hit_points and char.fatigue == expected.fatigue
+        assert char.skills["Dodge"].chance == 2 * char.DEX
+        assert 30 <= char.skills["Brawl"].chance <= 50
+    assert len({char.skills["Brawl"].chance for char in spawned}) > 1
+
+    spawned[0].take_damage(3, target="head", bypass_armor=True)
+    spawned[0].skills["Brawl"].chance = 99
+    assert spawned[1].damage_location["head"] == 0 and spawned[1].skills["Brawl"].chance != 99
+    assert goblin.prototype.skills["Brawl"].chance == 40
+    assert goblin.spawn(1)[0].name == "Goblin 21"
+
+
+def test_archetype_spawn_population():
+    guard = Archetype("Guard", {"STR": 14}, skill_variance={"Dodge": 5})
+    population = guard.spawn_population(10, np.random.default_rng(2))
+    assert population.STR.tolist() == [14] * 10
+    dodge = population.chance[:, population.skill_column("Dodge")]
+    assert ((dodge >= 15) & (dodge <= 25)).all()
+
+
+def test_roll_characteristics_methods():
+    rolled = roll_characteristics(2000, generator=np.random.default_rng(6))
+    assert rolled["STR"].min() >= 3 and rolled["STR"].max() <= 18
+    assert rolled["SIZ"].min() >= 8 and rolled["SIZ"].max() <= 18
+    assert rolled["STR"].mean() == pytest.approx(10.5, abs=0.3)
+    heroic = roll_characteristics(2000, "heroic", np.random.default_rng(6))
+    assert heroic["STR"].mean() > rolled["STR"].mean() + 1
+    assert (roll_characteristics(5, {"CHA": "18"})["CHA"] == 18).all()
+    with pytest.raises(ValueError):
+        roll_characteristics(5, "legendary")
+
+
+@pytest.mark.parametrize("options", [{}, {"can_fly": False, "literate": False, "primary_language": "Elvish"}])
+def test_generate_population_matches_constructed_characters(options):
+    population = generate_population(40, name="Villager", generator=np.random.default_rng(9), **options)
+    for row, char in enumerate(population.to_characters()):
+        assert char.name == f"Villager {row + 1}"
+        assert all(getattr(char, key) == value for key, value in options.items())
+        expected = BasicRoleplayCharacter(**{name: getattr(char, name) for name in CHARACTERISTICS}, **options)
+        expected.set_skill_class()
+        for name in DERIVED:
+            assert getattr(population, name)[row] == getattr(expected, name), name
+        assert population.damage_modifier[row] == expected.damage_modifier
+        assert population.max_hp_location[row].tolist() == [expected.max_hp_location[key] for key in LOCATIONS]
+        assert population.category_bonuses[row, :-1].tolist() == [expected.category_bonuses[key]
+                                                                  for key in population.categories]
+        for key, skill in expected.skills.items():
+            assert population.chance[row, population.skill_ids[key]] == skill.chance, key
+
+
+@pytest.mark.parametrize("options", [{}, {"can_drive": False, "can_fly": False, "literate": False},
+                                     {"energy_projection": True, "use_education": False, "primary_language": "Elvish"}])
+def test_default_skill_chances_match_characters(options):
+    characteristics = roll_characteristics(30, generator=np.random.default_rng(3))
+    chances = default_skill_chances(characteristics, **options)
+    for row in range(30):
+        char = BasicRoleplayCharacter(**{key: int(values[row]) for key, values in characteristics.items()}, **options)
+        char.set_skill_class()
+        template = char._skill_template()
+        assert set(chances) == set(template)
+        for key, spec in template.items():
+            assert chances[key][row] == spec["chance"], key
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_derived_characteristics_match_characters(seed):
+    # random characteristics, including extremes, and options checked against the scalar calculations
+    generator = np.random.default_rng(seed)
+    size = 300
+    characteristics = {name: generator.integers(1, 80 if name in ("STR", "SIZ") else 30, size)
+                       for name in ("STR", "CON", "POW", "DEX", "CHA", "INT", "SIZ", "EDU")}
+    options = {name: generator.random(size) < 0.5 for name in ("tough", "use_category_bonus",
+                                                                 "use_simple_category_bonus")}
+    derived = derived_characteristics(characteristics, **options)
+    for row in range(size):
+        char = BasicRoleplayCharacter(**{name: int(values[row]) for name, values in characteristics.items()},
+                                      **{name: bool(values[row]) for name, values in options.items()})
+        for name, values in derived.items():
+            if isinstance(values, dict):
+                assert {key: column[row] for key, column in values.items()} == getattr(char, name), (row, name)
+            else:
+                assert values[row] == getattr(char, name), (row, name)
+
+
+def test_population_recalculate_derived():
+    crowd = [BasicRoleplayCharacter(name=f"PC {i}", STR=8 + i, POW=6 + i, tough=i == 2,
+                                    use_category_bonus=i != 3, use_simple_category_bonus=True) for i in range(4)]
+    population = CharacterPopulation.from_characters(crowd)
+    population.STR += 4
+    population.POW[1] = 18
+    population.sanity[:] = 7
+    population.recalculate_derived(rows=np.array([True, True, False, True]))
+    assert population.STR[2] == 14 and population.max_power_points[2] == 8
+    characters = population.to_characters()
+    for row, char in enumerate(characters):
+        if row == 2:
+            continue
+        assert population.damage_modifier[row] == char.damage_modifier
+        assert population.max_power_points[row] == char.max_power_points
+        assert population.category_bonuses[row, :-1].tolist() == [char.category_bonuses[key]
+                                                                  for key in population.categories]
+        assert char.sanity == 7
+    assert characters[2].tough
+    population.recalculate_derived(reset_pools=True)
+    assert population.sanity.tolist() == [min(5 * char.POW, 100) for char in characters]
+
+
+def test_loss_history_is_per_character():
+    first, second = BasicRoleplayCharacter(), BasicRoleplayCharacter()
+    first.sanity_roll("1", "1")
+    assert first.loss_history == [{"amount": 1, "reason": "Default"}]
+    assert second.loss_history == []
+
+
+def test_locked_character_transitions_are_atomic():
+    character = BasicRoleplayCharacter(CON=18, SIZ=18, POW=18)
+    character.set_skill_class()
+    locked = LockedCharacter(character)
+    streams = roll_stream(0).spawn(8)
+
+    def work(rng):
+        for _ in range(300):
+            locked.take_damage(1, bypass_armor=True, rng=rng)
+            locked.sanity_roll("1", "1", rng=rng)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work, args=(stream,)) for stream in streams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert character.damage == 8 * 300
+    assert character.recent_san_loss == len(character.loss_history) == 8 * 300
+    assert locked.damage == character.damage
+    with locked as held:
+        assert held is character
+        locked.heal_damage(character.damage)
+    assert character.damage == 0
+
+
+def test_separate_wrappers_share_the_character_lock():
+    character = BasicRoleplayCharacter(CON=18, SIZ=18)
+    character.set_skill_class()
+    assert LockedCharacter(character) is LockedCharacter(character)
+    streams = roll_stream(1).spawn(8)
+
+    def work(rng):
+        # each thread wraps the character itself, as separate requests on a server would
+        for _ in range(300):
+            LockedCharacter(character).take_damage(1, bypass_armor=True, rng=rng)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work, args=(stream,)) for stream in streams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert character.damage == 8 * 300
+
+
+def test_hold_characters_in_any_order():
+    first = LockedCharacter(BasicRoleplayCharacter(name="First"))
+    second = LockedCharacter(BasicRoleplayCharacter(name="Second"))
+    with hold_characters(second, first) as (held_second, held_first):
+        assert held_first is first.character and held_second is second.character
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(second.lock.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+        assert acquired == [False]
+    assert second.lock.acquire(blocking=False)
+    second.lock.release()